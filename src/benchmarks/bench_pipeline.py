@@ -0,0 +1,350 @@
+"""
+Measures how loading, validating and saving files scale with rows, columns, sheets and failure rate.
+Synthetic CSV and XLSX files are generated from the schema of a configuration, and each stage of the pipeline
+runs on them against the local provider. Every scenario runs in a fresh process, so peak memory isn't shared.
+Results are compared with a stored baseline, and the command fails if throughput or memory regressed.
+Run from the src folder: python -m benchmarks.bench_pipeline [--rows N,N] [--columns N,N] [--sheets N,N]
+    [--failure-rates R,R] [--formats csv,xlsx] [--definition NAME] [--repeat N] [--save-baseline]
+"""
+import argparse
+import importlib
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from multiprocessing import get_context
+from typing import Any, Callable
+
+import numpy
+import pandas as pd
+import pyarrow
+from pandera import Column
+
+from benchmarks.bench_validation import build_schema
+from sheetdrop.configuration import (Configuration, MultipleSheetConfiguration,
+                                     SheetConfiguration)
+from sheetdrop.fileops import (convert_file_to_dataframe,
+                               convert_file_to_dataframe_dict,
+                               save_dataframe_to_cloud, save_table_to_cloud)
+from sheetdrop.pipeline import validate_dataframe
+from sheetdrop.reports import write_failure_report
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "pipeline_baseline.json")
+
+
+@dataclass
+class Scenario():
+    """One combination of the benchmark parameters. Must stay picklable, to reach the process that runs it."""
+    format: str
+    rows: int
+    columns: int
+    sheets: int
+    failure_rate: float
+    definition: str = None
+
+    @property
+    def key(self) -> str:
+        name = self.definition or f"{self.columns}c"
+        return f"{self.format}-{self.rows}r-{name}-{self.sheets}s-{self.failure_rate:g}f"
+
+
+def build_configuration(scenario: Scenario, workdir: str) -> Configuration | MultipleSheetConfiguration:
+    """
+    The configuration used to read a scenario's file, saving to the work directory.
+    With a definition, its schemas, engines and save options are kept, but the sheets are renamed to match the generated
+    file and load_params are dropped, since the file is written without any of the quirks they handle.
+    """
+    if scenario.definition:
+        definition = importlib.import_module(f"file_definitions.{scenario.definition}").configuration
+    else:
+        definition = Configuration(name="benchmark", save_location="unused", schema=build_schema(scenario.columns))
+    if isinstance(definition, MultipleSheetConfiguration):
+        sheets = [replace(sheet_conf, sheet=f"sheet_{i}", save_location=os.path.join(workdir, f"sheet_{i}.out"))
+                  for i, sheet_conf in enumerate(definition.sheets)]
+        return replace(definition, sheets=sheets, load_params=None)
+    if scenario.sheets > 1:
+        sheets = [SheetConfiguration(sheet=f"sheet_{i}", save_location=os.path.join(workdir, f"sheet_{i}.out"), schema=definition.schema,
+                                     save_type=definition.save_type, save_params=definition.save_params,
+                                     validation_engine=definition.validation_engine)
+                  for i in range(scenario.sheets)]
+        return MultipleSheetConfiguration(name=definition.name, sheets=sheets, excel_engine=definition.excel_engine,
+                                          schema_columns_only=definition.schema_columns_only)
+    load_type = "csv" if scenario.format == "csv" else "excel"
+    return replace(definition, load_type=load_type, load_params=None, chunk_size=None, save_location=os.path.join(workdir, "file.out"))
+
+
+def column_values(column: Column, rows: int, rng: numpy.random.Generator) -> numpy.ndarray:
+    """
+    Values of the column's type that pass its isin, range and str_length checks.
+    Other checks aren't taken into account, so their failures show up in every scenario.
+    """
+    statistics = {check.name: check.statistics or {} for check in column.checks}
+    kind = str(column.dtype).lower()
+    if "isin" in statistics:
+        return rng.choice(list(statistics["isin"]["allowed_values"]), rows)
+    low, high = 0, 1000
+    for name, stats in statistics.items():
+        if name != "str_length":
+            low = stats.get("min_value", low)
+            high = stats.get("max_value", high)
+    if kind.startswith(("int", "uint")):
+        # skip the lower bound, which may be exclusive
+        return rng.integers(int(low) + 1, max(int(high), int(low) + 2), rows)
+    if kind.startswith("float"):
+        return rng.uniform(low, high, rows)
+    if kind.startswith("bool"):
+        return rng.integers(0, 2, rows).astype(bool)
+    if kind.startswith("datetime"):
+        return pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365 * 86400, rows), unit="s")
+    min_length = statistics.get("str_length", {}).get("min_value") or 5
+    max_length = statistics.get("str_length", {}).get("max_value") or 10
+    digits = rng.integers(10 ** max(min_length - 5, 0), 10 ** max(max_length - 4, 1), rows)
+    return numpy.char.add("abc-", digits.astype(str)).astype(object)
+
+
+def invalid_value(column: Column) -> Any:
+    """A value that fails the column's checks, its type or its nullability."""
+    names = {check.name for check in column.checks}
+    kind = str(column.dtype).lower()
+    if kind.startswith(("int", "uint", "float")) and names & {"isin", "less_than", "less_than_or_equal_to", "in_range"}:
+        return 10 ** 9
+    if kind.startswith(("int", "uint", "float", "bool", "datetime")):
+        return "n/a"
+    return "BAD!" if column.nullable or names else None
+
+
+def build_dataframe(schema: dict[str, Column], rows: int, failure_rate: float, seed: int = 0) -> pd.DataFrame:
+    """A dataframe that passes the schema, except for a fraction of randomly placed bad values in every column."""
+    rng = numpy.random.default_rng(seed)
+    failures = int(rows * failure_rate)
+    data = {}
+    for name, column in schema.items():
+        values = pd.Series(column_values(column, rows, rng))
+        if failures:
+            values = values.astype(object)
+            values.iloc[rng.choice(rows, failures, replace=False)] = invalid_value(column)
+        data[name] = values
+    return pd.DataFrame(data)
+
+
+def write_input_file(scenario: Scenario, conf: Configuration | MultipleSheetConfiguration, path: str) -> None:
+    """Writes the synthetic file of a scenario."""
+    if isinstance(conf, MultipleSheetConfiguration):
+        with pd.ExcelWriter(path, engine="openpyxl") as writer:
+            for i, sheet_conf in enumerate(conf.sheets):
+                build_dataframe(sheet_conf.schema, scenario.rows, scenario.failure_rate, seed=i).to_excel(writer, sheet_name=sheet_conf.sheet, index=False)
+    elif scenario.format == "csv":
+        build_dataframe(conf.schema, scenario.rows, scenario.failure_rate).to_csv(path, index=False)
+    else:
+        build_dataframe(conf.schema, scenario.rows, scenario.failure_rate).to_excel(path, index=False, engine="openpyxl")
+
+
+def reset_peak_rss() -> bool:
+    """
+    Resets the peak resident memory of this process to its current one, so the next peak belongs to the stage that follows.
+    Only Linux supports it. Returns whether the peak was reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    """The peak resident memory of this process since it was last reset, or since it started, in MB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS, and in kilobytes elsewhere
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def measure(stage: str, action: Callable[[], Any], repeat: int, rows: int, size: int, prepare: Callable[[], None] = None) -> tuple[dict, Any]:
+    """
+    Runs a stage repeat times, and returns its best time and highest peak memory with the result of the last run.
+    prepare runs before each run, outside the timing, e.g. to copy data the stage modifies.
+    The peak memory is the stage's own where it can be reset (see reset_peak_rss), and the process's so far elsewhere.
+    """
+    best = float("inf")
+    peak = 0.0
+    result = None
+    for _ in range(repeat):
+        if prepare:
+            prepare()
+        # the result of the previous run is dropped first, so it isn't counted in this one
+        result = None
+        per_stage = reset_peak_rss()
+        start = time.perf_counter()
+        result = action()
+        best = min(best, time.perf_counter() - start)
+        peak = max(peak, peak_rss_mb())
+    best = max(best, 1e-9)
+    return {
+        "stage": stage,
+        "seconds": best,
+        "rows_per_second": rows / best,
+        "mb_per_second": size / 1024 / 1024 / best,
+        "peak_rss_mb": peak,
+        "peak_rss_scope": "stage" if per_stage else "process",
+    }, result
+
+
+def run_scenario(scenario: Scenario, path: str, workdir: str, repeat: int) -> list[dict]:
+    """
+    Loads, validates and saves the file of a scenario, as the pipeline does, and measures each stage.
+    Valid files are saved both from a dataframe and from an Arrow table. Invalid ones get a failure report instead.
+    MB/s are relative to the size of the input file, so the stages can be compared with each other.
+    """
+    conf = build_configuration(scenario, workdir)
+    conf.compile()
+    size = os.path.getsize(path)
+    rows = scenario.rows * scenario.sheets
+    results = []
+
+    if isinstance(conf, MultipleSheetConfiguration):
+        sheet_confs = {sheet_conf.sheet: sheet_conf for sheet_conf in conf.sheets}
+        load = lambda: convert_file_to_dataframe_dict("benchmark", conf, path)
+    else:
+        sheet_confs = {None: conf}
+        load = lambda: {None: convert_file_to_dataframe("benchmark", conf, path)}
+    stats, loaded = measure("load", load, repeat, rows, size)
+    results.append(stats)
+
+    # validation coerces in place, so every run gets fresh copies
+    copies = {}
+    prepare = lambda: copies.update({sheet: dataframe.copy() for sheet, dataframe in loaded.items()})
+
+    def validate():
+        failures = [validate_dataframe(dataframe, sheet_confs[sheet]) for sheet, dataframe in copies.items()]
+        return [failure_cases for failure_cases in failures if failure_cases is not None]
+
+    stats, failures = measure("validate", validate, repeat, rows, size, prepare)
+    results.append(stats)
+    # the stages below don't need the loaded dataframes. Emptied rather than deleted, since prepare refers to them
+    loaded.clear()
+
+    if failures:
+        report_path = os.path.join(workdir, "failure_cases.parquet")
+        stats, _ = measure("report", lambda: write_failure_report(pd.concat(failures, ignore_index=True), report_path), repeat, rows, size)
+        results.append(stats)
+        return results
+
+    save = lambda: [save_dataframe_to_cloud(dataframe, "local", sheet_confs[sheet].save_type, sheet_confs[sheet].save_location, sheet_confs[sheet].save_params)
+                    for sheet, dataframe in copies.items()]
+    stats, _ = measure("save_dataframe", save, repeat, rows, size)
+    results.append(stats)
+    tables = {sheet: pyarrow.Table.from_pandas(dataframe, preserve_index=False) for sheet, dataframe in copies.items()}
+    copies.clear()
+    save = lambda: [save_table_to_cloud(table, "local", sheet_confs[sheet].save_type, sheet_confs[sheet].save_location, sheet_confs[sheet].save_params)
+                    for sheet, table in tables.items()]
+    stats, _ = measure("save_table", save, repeat, rows, size)
+    results.append(stats)
+    return results
+
+
+def build_scenarios(args: argparse.Namespace) -> list[Scenario]:
+    """Every combination of the parameters. Multiple sheets only apply to XLSX files."""
+    definition_sheets = None
+    if args.definition:
+        definition = importlib.import_module(f"file_definitions.{args.definition}").configuration
+        if isinstance(definition, MultipleSheetConfiguration):
+            definition_sheets = len(definition.sheets)
+    scenarios = []
+    for format in args.formats:
+        if format == "csv" and definition_sheets:
+            print(f"Skipping csv: {args.definition} is a multiple sheet definition")
+            continue
+        sheet_counts = [definition_sheets] if definition_sheets else args.sheets if format == "xlsx" else [1]
+        for rows in args.rows:
+            for columns in [0] if args.definition else args.columns:
+                for sheets in sheet_counts:
+                    for failure_rate in args.failure_rates:
+                        scenarios.append(Scenario(format, rows, columns, sheets, failure_rate, args.definition))
+    return scenarios
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    """Returns the stages whose throughput dropped, or whose peak memory grew, by more than the tolerance."""
+    regressions = []
+    for key, stats in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if stats["rows_per_second"] < base["rows_per_second"] * (1 - tolerance):
+            regressions.append(f"{key}: {stats['rows_per_second']:,.0f} rows/s, baseline {base['rows_per_second']:,.0f}")
+        if stats["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{key}: {stats['peak_rss_mb']:,.0f} MB peak, baseline {base['peak_rss_mb']:,.0f}")
+    return regressions
+
+
+def main():
+    int_list = lambda value: [int(item) for item in value.split(",")]
+    float_list = lambda value: [float(item) for item in value.split(",")]
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int_list, default=[10_000, 100_000])
+    parser.add_argument("--columns", type=int_list, default=[10, 30])
+    parser.add_argument("--sheets", type=int_list, default=[1, 4])
+    parser.add_argument("--failure-rates", type=float_list, default=[0.0, 0.01])
+    parser.add_argument("--formats", type=lambda value: value.split(","), default=["csv", "xlsx"])
+    parser.add_argument("--definition", help="name of a module in file_definitions whose schema is used instead of a synthetic one")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="fraction of throughput or memory change reported as a regression")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    print(f"{'scenario':<32} {'stage':<15} {'seconds':>8} {'rows/s':>12} {'MB/s':>8} {'peak MB':>8} {'vs base':>8}")
+    with tempfile.TemporaryDirectory(prefix="sheetdrop-bench-") as workdir:
+        for scenario in build_scenarios(args):
+            scenario_dir = os.path.join(workdir, scenario.key)
+            os.makedirs(scenario_dir)
+            path = os.path.join(scenario_dir, f"input.{scenario.format}")
+            write_input_file(scenario, build_configuration(scenario, scenario_dir), path)
+            # a fresh process per scenario, so the peak memory of one doesn't hide the next
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                stages = pool.submit(run_scenario, scenario, path, scenario_dir, args.repeat).result()
+            for stats in stages:
+                key = f"{scenario.key}/{stats['stage']}"
+                results[key] = stats
+                base = baseline.get(key)
+                change = f"{stats['rows_per_second'] / base['rows_per_second'] - 1:+.0%}" if base else ""
+                print(f"{scenario.key:<32} {stats['stage']:<15} {stats['seconds']:>8.3f} {stats['rows_per_second']:>12,.0f} "
+                      f"{stats['mb_per_second']:>8.1f} {stats['peak_rss_mb']:>8.0f} {change:>8}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"settings": {key: value for key, value in vars(args).items() if key != "save_baseline"},
+                       "results": results}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+    if not baseline:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to record one")
+        return
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"Regressions beyond {args.tolerance:.0%} of the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
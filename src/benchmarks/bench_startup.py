@@ -0,0 +1,78 @@
+"""
+Measures how long the web application and workers take to start: importing their modules, then loading the file
+definitions, with STARTUP_MODE=eager and lazy. Every run uses a fresh interpreter, so nothing is cached between them.
+The slowest imports are listed, from python -X importtime. The command fails if the lazy startup takes longer than the
+budget, or imports any of pandas, pandera, pyarrow or numpy.
+Run from the src folder: python -m benchmarks.bench_startup [--repeat N] [--budget SECONDS] [--top N]
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+# seconds the imports and the lazy registry of the definitions may take, on a developer machine
+DEFAULT_BUDGET = 1.0
+
+# run in a fresh interpreter, with the startup mode as argument. Imports what main.py and worker.py import from sheetdrop.
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import sheetdrop.admission, sheetdrop.db, sheetdrop.executor, sheetdrop.fileops, sheetdrop.jobs
+import sheetdrop.metrics, sheetdrop.pipeline, sheetdrop.status_cache, sheetdrop.uploads
+from sheetdrop.configuration import ConfigurationRegistry
+imported = time.perf_counter()
+configurations = ConfigurationRegistry("file_definitions")
+if sys.argv[1] == "eager":
+    configurations.load_all()
+loaded = time.perf_counter()
+from sheetdrop.lazy import heavy_modules_loaded
+print(json.dumps({"import": imported - start, "definitions": loaded - imported, "heavy_modules": heavy_modules_loaded()}))
+"""
+
+
+def run_probe(mode: str) -> tuple[dict, list[tuple[int, str]]]:
+    """
+    Starts an interpreter that imports the application and loads the definitions.
+    Returns:
+        The seconds taken by each step and the heavy modules imported, and the cumulative microseconds of each top-level import
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE, mode], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup failed in {mode} mode:\n{result.stderr}")
+    imports = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package, nested imports are indented
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit() and not name[1:].startswith(" "):
+            imports.append((int(cumulative), name.strip()))
+    # the definitions print a line as they are loaded, the measurements come last
+    return json.loads(result.stdout.strip().splitlines()[-1]), sorted(imports, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="seconds the lazy startup may take")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports listed")
+    args = parser.parse_args()
+
+    failed = False
+    for mode in ("eager", "lazy"):
+        runs = [run_probe(mode) for _ in range(args.repeat)]
+        best, imports = min(runs, key=lambda run: run[0]["import"] + run[0]["definitions"])
+        total = best["import"] + best["definitions"]
+        print(f"{mode}: {total:.3f}s (imports {best['import']:.3f}s, definitions {best['definitions']:.3f}s), "
+              f"heavy modules: {', '.join(best['heavy_modules']) or 'none'}")
+        for cumulative, name in imports[:args.top]:
+            print(f"    {cumulative / 1e6:8.3f}s  {name}")
+        if mode == "lazy" and (total > args.budget or best["heavy_modules"]):
+            print(f"REGRESSION: the lazy startup must take less than {args.budget}s without importing heavy modules")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
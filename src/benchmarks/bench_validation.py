@@ -0,0 +1,83 @@
+"""
+Compares the pandera and fast validation engines on a synthetic wide dataframe.
+Run from the src folder: python -m benchmarks.bench_validation [--rows N] [--columns N] [--repeat N]
+"""
+import argparse
+import time
+
+import numpy
+import pandas as pd
+from pandera import Check, Column
+
+from sheetdrop.configuration import Configuration
+from sheetdrop.pipeline import validate_dataframe
+
+
+def build_schema(columns: int) -> dict[str, Column]:
+    """A schema with a numeric, a categorical and a string column in turn, each with common built-in checks."""
+    schema = {}
+    for i in range(columns):
+        if i % 3 == 0:
+            schema[f"amount_{i}"] = Column(float, [Check.greater_than_or_equal_to(0), Check.less_than(1000)])
+        elif i % 3 == 1:
+            schema[f"category_{i}"] = Column(int, [Check.isin([1, 2, 3, 4, 5])])
+        else:
+            schema[f"code_{i}"] = Column(str, [Check.str_matches(r"^[a-z]{3}-[0-9]+$"), Check.str_length(5, 10)])
+    return schema
+
+
+def build_dataframe(schema: dict[str, Column], rows: int, failures: int, seed: int = 0) -> pd.DataFrame:
+    """A dataframe that passes the schema, except for a number of bad values in every column."""
+    rng = numpy.random.default_rng(seed)
+    data = {}
+    for name in schema:
+        if name.startswith("amount"):
+            values = rng.uniform(0, 999, rows)
+            values[:failures] = 5000.0
+        elif name.startswith("category"):
+            values = rng.integers(1, 6, rows)
+            values[:failures] = 9
+        else:
+            values = numpy.char.add("abc-", rng.integers(0, 99999, rows).astype(str)).astype(object)
+            values[:failures] = "BAD"
+        data[name] = values
+    return pd.DataFrame(data)
+
+
+def time_engine(conf: Configuration, dataframe: pd.DataFrame, repeat: int) -> tuple[float, int]:
+    """Returns the best time to validate a copy of the dataframe, and the number of failure cases found."""
+    best = float("inf")
+    failure_count = 0
+    for _ in range(repeat):
+        # validation coerces in place, so every run gets a fresh copy
+        data = dataframe.copy()
+        start = time.perf_counter()
+        failure_cases = validate_dataframe(data, conf)
+        best = min(best, time.perf_counter() - start)
+        failure_count = 0 if failure_cases is None else len(failure_cases)
+    return best, failure_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--columns", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    schema = build_schema(args.columns)
+    print(f"{args.rows} rows, {args.columns} columns, best of {args.repeat}")
+    print(f"{'scenario':<10} {'engine':<8} {'seconds':>8} {'failures':>9} {'speedup':>8}")
+    for scenario, failures in (("valid", 0), ("invalid", 10)):
+        dataframe = build_dataframe(schema, args.rows, failures)
+        baseline = None
+        for engine in ("pandera", "fast"):
+            conf = Configuration(name="benchmark", save_location="unused", schema=schema, validation_engine=engine)
+            conf.compile()
+            seconds, failure_count = time_engine(conf, dataframe, args.repeat)
+            baseline = baseline or seconds
+            print(f"{scenario:<10} {engine:<8} {seconds:>8.3f} {failure_count:>9} {baseline / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,93 +1,456 @@
-import importlib
-import io
+import asyncio
+import hashlib
+import json
 import os
-from typing import Annotated, Optional
+import zipfile
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable, Iterator, Optional
 
-import pandas as pd
-import pandera as pdr
-import pyarrow
-from fastapi import BackgroundTasks, FastAPI, File, Request, UploadFile
+from fastapi import FastAPI, HTTPException, Request, UploadFile
+from fastapi.responses import (FileResponse, JSONResponse, Response,
+                               StreamingResponse)
 from fastapi.templating import Jinja2Templates
 
-from alembic import command
-from alembic.config import Config
-from alembic.script import ScriptDirectory
-from sheetdrop.configuration import (Configuration, MultipleSheetConfiguration,
-                                     load_configurations)
-from sheetdrop.db import (create_engine, load_latest_file_status,
-                          save_file_status)
+from sheetdrop.admission import AdmissionControl, UploadRejectedError
+from sheetdrop.batches import (BatchNotFoundError, archive_file_id,
+                               create_batch, expire_batches, extract_entry,
+                               load_batch, summarize_batch)
+from sheetdrop.configuration import (Configuration, ConfigurationRegistry,
+                                     MultipleSheetConfiguration)
+from sheetdrop.db import (create_async_engine, create_engine, file_status_dict,
+                          load_reusable_file_status, run_db, save_file_status,
+                          status_listeners)
 from sheetdrop.enums import Status
-from sheetdrop.fileops import (clear_temp_dir, convert_file_to_dataframe,
-                               convert_file_to_dataframe_dict,
-                               delete_temp_file, recover_temp_file,
-                               save_dataframe_to_cloud, save_table_to_cloud,
-                               store_temp_file)
+from sheetdrop.executor import JobExecutor
+from sheetdrop.fileops import (FileTooLargeError, StorageSettings,
+                               delete_temp_file, stream_temp_file, upload_hash)
+from sheetdrop.jobs import (JobWorker, enqueue_job, find_active_job,
+                            load_job_states)
+from sheetdrop.metrics import (METRICS_CONTENT_TYPE, StageTimer,
+                               enable_tracing, metrics_registry)
+from sheetdrop.pipeline import PipelineSettings, precheck_file
+from sheetdrop.status_cache import StatusCache
+from sheetdrop.uploads import (IncompleteUploadError, UploadNotFoundError,
+                               assemble_upload, create_upload, delete_upload,
+                               expire_uploads, list_chunks, load_upload,
+                               write_chunk)
 from sheetdrop.configs import app_configs
 
 # call create_engine to get connection to utility database
-engine = create_engine(app_configs.database_url)
+pool_settings = (app_configs.database_pool_size, app_configs.database_max_overflow, app_configs.database_pool_timeout)
+engine = create_engine(app_configs.database_url, *pool_settings)
+# with an async engine, request handlers await the database instead of using threads
+async_engine = None
+if app_configs.async_database_url:
+    async_engine = create_async_engine(app_configs.async_database_url, *pool_settings)
 
-alembic_cfg = Config("alembic.ini")
-script = ScriptDirectory.from_config(alembic_cfg)
 
-# check if database is up to date
-try:
-    command.check(alembic_cfg)
-except Exception as e:
-    print(f"ERROR: Database is not up to date. Please run alembic upgrade head. Details: {e}")
-    exit(1)
+def check_database() -> None:
+    """Exits if the utility database isn't up to date with the migrations."""
+    # alembic is only needed here, so it isn't imported with the application
+    from alembic import command
+    from alembic.config import Config
 
+    try:
+        command.check(Config("alembic.ini"))
+    except Exception as e:
+        print(f"ERROR: Database is not up to date. Please run alembic upgrade head. Details: {e}")
+        exit(1)
 
-app = FastAPI()
-templates = Jinja2Templates(directory="templates")
 
+# in the lazy startup modes, the check runs when the application starts instead of when it is imported
+if app_configs.startup_mode == "eager":
+    check_database()
 
 # Path to the directory where your configurations are stored
 modules_dir = os.path.join(os.path.dirname(__file__), "file_definitions")
 
-# Loop through all .py files in the file_definitions directory and import configurations into a dictionary
-configurations, configuration_errors = load_configurations(modules_dir)
+# the file definitions in the directory, by file id. In the lazy startup modes, each one is imported when it is first requested
+configurations = ConfigurationRegistry(modules_dir)
+if app_configs.startup_mode == "eager":
+    configurations.load_all()
+
+# statuses are read from memory; statuses saved by this process are written through to it
+status_cache = StatusCache(engine, app_configs.status_cache_ttl, app_configs.status_cache_size, app_configs.status_poll_interval, async_engine)
+status_listeners.append(status_cache.put)
+
+# uploads are only accepted while the queue has room, and are rejected with 429 otherwise
+admission = AdmissionControl(engine, async_engine, app_configs.max_queue_depth, app_configs.max_queued_per_file,
+                             app_configs.max_concurrent_uploads, app_configs.retry_after)
+
+# seconds between comments sent to keep idle status event streams open
+EVENTS_KEEPALIVE = 15
+
+# files of a batch upload stored and queued at the same time
+BATCH_CONCURRENCY = 8
+
+# outcome of an upload in the metrics, by the status code it was rejected with
+UPLOAD_OUTCOMES = {404: "not_found", 409: "incomplete", 413: "too_large", 422: "precheck_failed", 429: "rejected"}
+
+if app_configs.opentelemetry:
+    enable_tracing()
+
+# uploads are queued in the job table; unless workers run separately (worker.py),
+# a worker inside the application claims them and runs them on a bounded pool
+executor = None
+job_worker = None
+storage_settings = StorageSettings(app_configs.storage_endpoint, app_configs.storage_region, app_configs.storage_access_key, app_configs.storage_secret_key,
+                                   app_configs.storage_health_check_interval, app_configs.storage_health_check_path)
+pipeline_settings = PipelineSettings(app_configs.storage_provider, app_configs.sheet_workers, app_configs.failure_samples, storage_settings,
+                                     app_configs.opentelemetry)
+if app_configs.job_runner == "embedded":
+    executor = JobExecutor(app_configs.executor_type, app_configs.max_workers, app_configs.max_queue_depth)
+    job_worker = JobWorker(engine, executor, configurations, app_configs.database_url, pipeline_settings,
+                           app_configs.job_poll_interval, app_configs.job_lease_seconds, app_configs.job_max_attempts)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if app_configs.startup_mode != "eager":
+        await asyncio.to_thread(check_database)
+    if app_configs.startup_mode == "background":
+        configurations.warm_up()
+    if app_configs.definitions_reload_interval:
+        configurations.watch(app_configs.definitions_reload_interval)
+    if job_worker:
+        job_worker.start()
+    status_refresher = asyncio.create_task(status_cache.run())
+    yield
+    status_refresher.cancel()
+    configurations.stop_watching()
+    if job_worker:
+        job_worker.stop()
+        executor.shutdown(wait=True)
+    if async_engine:
+        await async_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+templates = Jinja2Templates(directory="templates")
 
 
 @app.get("/")
 async def root(request: Request):
-    """Endpoint to return a HTML page with a list of links to each file in your database."""
-    return templates.TemplateResponse("index.html", {"files": configurations, "request": request})
+    """Endpoint to return a HTML page with a list of links to each file in your database, and how long their latest upload took."""
+    # listing the files loads every definition; on a thread, so other requests aren't held up in the lazy startup modes
+    await asyncio.to_thread(configurations.load_all)
+    statuses = dict(zip(configurations, await asyncio.gather(*(status_cache.get(file_id) for file_id in configurations))))
+    return templates.TemplateResponse("index.html", {"files": configurations, "statuses": statuses,
+                                                     "configuration_errors": configurations.errors, "request": request})
 
 @app.get("/file/{file_id}")
 async def show_file(file_id: str, request: Request):
     """Endpoint to return a HTML page with a form to upload a file and current status."""
-    status = load_latest_file_status(engine, file_id)
+    status = await status_cache.get(file_id)
     return templates.TemplateResponse("file.html", {"file_id": file_id, "file_config": configurations[file_id], "status": status, "request": request})
 
 @app.post("/file/{file_id}")
-async def receive_file(file_id: str, file: UploadFile, request: Request, background_tasks: BackgroundTasks):
+async def receive_file(file_id: str, file: UploadFile, request: Request):
     """
-    Endpoint to receive a file and start a background task to validate it.
+    Endpoint to receive a file and queue it for validation.
     file_id: str
         The id of the file to validate
     file: UploadFile
         The file to validate
     request: Request
         The request object
-    background_tasks: BackgroundTasks
-        The background tasks object
     Returns:
-        A 202 Accepted response if the background task was successfully started.
+        A 202 Accepted response if the file was queued for validation, or an identical upload already was.
+        A 200 OK response with the result of the latest upload, if it was identical and the file definition is deduplicated.
         A 404 Not Found response if the file_id is not found in the configurations.
+        A 413 Content Too Large response if the file exceeds the configured max_file_size.
+        A 422 Unprocessable Content response if the first rows of the file don't match the schema.
+        A 429 Too Many Requests response, with a Retry-After header, if the job queue or the queue of the file is full.
     """
     if(file_id not in configurations):
-        return {"error": "File ID not found"}, 404
-    save_file_status(engine, file_id, Status.IN_PROGRESS)
-    contents = io.BytesIO(file.file.read())
-    file_path = store_temp_file(file_id, contents)
-    background_tasks.add_task(process_file, file_id, file_path)
+        raise HTTPException(status_code=404, detail="File ID not found")
+    file_conf = configurations[file_id]
+    with upload_timer(file_id) as timer:
+        try:
+            async with admission.admit(file_id):
+                store = lambda max_size, hasher: stream_temp_file(file_id, file, max_size, hasher=hasher, timer=timer)
+                return upload_response(request, file_id, *await queue_upload(file_id, file_conf, store, file.size, timer))
+        except UploadRejectedError as exc:
+            raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": str(exc.retry_after)})
+
+@contextmanager
+def upload_timer(file_id: str) -> Iterator[StageTimer]:
+    """Times the stages of an upload received by this process, and records them in the metrics with its outcome."""
+    timer = StageTimer(file_id)
+    try:
+        yield timer
+    except HTTPException as exc:
+        timer.outcome = UPLOAD_OUTCOMES.get(exc.status_code, "error")
+        raise
+    except BaseException:
+        timer.outcome = "error"
+        raise
+    finally:
+        metrics_registry.record(timer, "sheetdrop_uploads_total")
+
+async def queue_upload(file_id: str, file_conf: Configuration | MultipleSheetConfiguration, store: Callable[[int, Any], Awaitable[str]],
+                       size: Optional[int], timer: StageTimer) -> tuple[str, dict, int]:
+    """
+    Stores an upload that was admitted in the temp directory, and queues it unless it is identical to a previous one.
+    store is called with the maximum size and the hasher, writes the upload to a temporary file and returns its path,
+    raising FileTooLargeError beyond the maximum size. size is the size of the upload, if known before it is stored.
+    Returns the message, body and status code of the response, like queue_file.
+    """
+    max_size = file_conf.max_file_size
+    # deduplicated uploads are hashed while they are written, without reading them again
+    hasher = hashlib.sha256() if file_conf.deduplicate else None
+    try:
+        # reject early when the size is already known, otherwise enforce the limit while streaming
+        if max_size is not None and size is not None and size > max_size:
+            raise FileTooLargeError(f"File exceeds the maximum size of {max_size} bytes")
+        with timer.stage("upload") as timing:
+            file_path = await store(max_size, hasher)
+            timing.bytes = os.path.getsize(file_path)
+    except FileTooLargeError as exc:
+        with timer.stage("status_db"):
+            await run_db(engine, async_engine, save_file_status, file_id, Status.FAILED, [str(exc)], None, timer.as_dict())
+        raise HTTPException(status_code=413, detail=str(exc))
+    return await queue_file(file_id, file_conf, file_path, hasher, timer)
+
+async def queue_file(file_id: str, file_conf: Configuration | MultipleSheetConfiguration, file_path: str, hasher, timer: StageTimer) -> tuple[str, dict, int]:
+    """
+    Queues a file stored in the temp directory, unless it is identical to a previous upload or obviously wrong.
+    Returns the message, body and status code of the response, see upload_response. Failures raise HTTPException.
+    """
+    # the temp file belongs to the job once it is queued, and is removed on every other path
+    queued = False
+    try:
+        if app_configs.precheck_rows:
+            with timer.stage("precheck") as timing:
+                timing.rows = app_configs.precheck_rows
+                errors = await asyncio.to_thread(precheck_file, file_id, file_conf, file_path, app_configs.precheck_rows, app_configs.failure_samples)
+            if errors:
+                with timer.stage("status_db"):
+                    await run_db(engine, async_engine, save_file_status, file_id, Status.FAILED, errors, None, timer.as_dict())
+                raise HTTPException(status_code=422, detail=errors)
+        # uploads of the same file are compared with the previous ones and queued one at a time
+        async with admission.file_lock(file_id):
+            content_hash = None
+            if hasher is not None:
+                content_hash = upload_hash(hasher, file_conf)
+                with timer.stage("status_db"):
+                    status = await run_db(engine, async_engine, load_reusable_file_status, file_id, content_hash)
+                if status is not None:
+                    timer.outcome = "deduplicated"
+                    return "Identical to the latest upload, its result was kept", {"status": file_status_dict(status)}, 200
+                with timer.stage("status_db"):
+                    job_id = await run_db(engine, async_engine, find_active_job, file_id, content_hash)
+                if job_id is not None:
+                    timer.outcome = "deduplicated"
+                    return "Identical to an upload already in progress", {"job_id": job_id}, 202
+            # the file is marked as in progress when its job is queued, in the same transaction
+            supersede = app_configs.file_concurrency == "coalesce"
+            with timer.stage("status_db"):
+                job_id = await run_db(engine, async_engine, enqueue_job, file_id, file_path, content_hash, supersede, timer.as_dict())
+            queued = True
+    finally:
+        if not queued:
+            delete_temp_file(file_path)
+    if job_worker:
+        job_worker.notify()
+    timer.outcome = "queued"
+    return "Validation started in background", {"job_id": job_id}, 202
+
+@app.post("/file/{file_id}/uploads")
+async def create_resumable_upload(file_id: str):
+    """
+    Endpoint to start a resumable upload, for large files sent over unreliable connections.
+    The file is sent in numbered chunks with PUT /file/{file_id}/uploads/{upload_id}/chunks/{number} (starting at 1),
+    which can be retried one at a time, and queued for validation with POST /file/{file_id}/uploads/{upload_id}/commit.
+    file_id: str
+        The id of the file to validate
+    Returns:
+        A 201 Created response with the id of the upload.
+        A 404 Not Found response if the file_id is not found in the configurations.
+        A 429 Too Many Requests response, with a Retry-After header, if the job queue or the queue of the file is full.
+    """
+    if file_id not in configurations:
+        raise HTTPException(status_code=404, detail="File ID not found")
+    try:
+        # don't let clients send a whole file that would be rejected when it is committed
+        async with admission.admit(file_id):
+            pass
+    except UploadRejectedError as exc:
+        raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": str(exc.retry_after)})
+    await asyncio.to_thread(expire_uploads, app_configs.upload_expiration)
+    upload_id = await asyncio.to_thread(create_upload, file_id)
+    return JSONResponse({"upload_id": upload_id, "max_file_size": configurations[file_id].max_file_size}, status_code=201)
+
+@app.get("/file/{file_id}/uploads/{upload_id}")
+async def get_resumable_upload(file_id: str, upload_id: str):
+    """
+    Endpoint to get the chunks of a resumable upload received so far, to resume it after a failure.
+    Returns:
+        The size of each chunk received, by chunk number, and the total size received.
+        A 404 Not Found response if the upload doesn't exist or was already committed.
+    """
+    try:
+        await asyncio.to_thread(load_upload, file_id, upload_id)
+        chunks = await asyncio.to_thread(list_chunks, upload_id)
+    except (UploadNotFoundError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return {"upload_id": upload_id, "chunks": chunks, "size": sum(chunks.values())}
+
+@app.put("/file/{file_id}/uploads/{upload_id}/chunks/{number}")
+async def receive_chunk(file_id: str, upload_id: str, number: int, request: Request):
+    """
+    Endpoint to receive a chunk of a resumable upload, as the raw body of the request.
+    Sending a chunk again replaces it. Chunks can have any size and be sent in any order.
+    Returns:
+        The number and size of the chunk.
+        A 404 Not Found response if the upload doesn't exist or was already committed.
+        A 413 Content Too Large response if the chunks received exceed the configured max_file_size.
+    """
+    file_conf = configurations.get(file_id)
+    if file_conf is None:
+        raise HTTPException(status_code=404, detail="File ID not found")
+    try:
+        await asyncio.to_thread(load_upload, file_id, upload_id)
+        size = await write_chunk(upload_id, number, request.stream(), file_conf.max_file_size)
+    except (UploadNotFoundError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except FileTooLargeError as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"number": number, "size": size}
+
+@app.post("/file/{file_id}/uploads/{upload_id}/commit")
+async def commit_resumable_upload(file_id: str, upload_id: str, request: Request):
+    """
+    Endpoint to assemble the chunks of a resumable upload and queue the file for validation.
+    Returns:
+        The same responses as POST /file/{file_id}.
+        A 404 Not Found response if the upload doesn't exist or was already committed.
+        A 409 Conflict response listing the missing chunks, if there are gaps in the chunk numbers.
+    """
+    file_conf = configurations.get(file_id)
+    if file_conf is None:
+        raise HTTPException(status_code=404, detail="File ID not found")
+    hasher = hashlib.sha256() if file_conf.deduplicate else None
+    with upload_timer(file_id) as timer:
+        try:
+            async with admission.admit(file_id):
+                with timer.stage("assemble_upload") as timing:
+                    file_path = await asyncio.to_thread(assemble_upload, file_id, upload_id, hasher)
+                    timing.bytes = os.path.getsize(file_path)
+                return upload_response(request, file_id, *await queue_file(file_id, file_conf, file_path, hasher, timer))
+        except UploadRejectedError as exc:
+            raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": str(exc.retry_after)})
+        except UploadNotFoundError:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        except IncompleteUploadError as exc:
+            raise HTTPException(status_code=409, detail=str(exc))
+
+@app.delete("/file/{file_id}/uploads/{upload_id}")
+async def delete_resumable_upload(file_id: str, upload_id: str):
+    """
+    Endpoint to abort a resumable upload, removing the chunks received.
+    Returns:
+        A 204 No Content response.
+        A 404 Not Found response if the upload doesn't exist or was already committed.
+    """
+    try:
+        await asyncio.to_thread(delete_upload, file_id, upload_id)
+    except UploadNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return Response(status_code=204)
+
+@app.post("/batches")
+async def receive_batch(request: Request):
+    """
+    Endpoint to upload many files in one request, each one queued for validation like with POST /file/{file_id}.
+    The body is multipart form data, with either one part per file, named after its file_id, or a single zip archive
+    in a part named "archive". Each entry of the archive goes to the file_id of its top-level directory, or of its
+    name without extension (sales/2024-01.csv and sales.csv both go to sales).
+    Files are stored and queued concurrently, and admitted one by one, so some can be rejected while others are queued.
+    Returns:
+        A 202 Accepted response with the id of the batch, to follow it with GET /batches/{batch_id}, and the outcome
+        of each file: the status code and message POST /file/{file_id} would have returned, and its job_id if queued.
+        A 400 Bad Request response if there are no files, or the archive isn't a zip file.
+    """
+    form = await request.form()
+    parts = [(name, part) for name, part in form.multi_items() if not isinstance(part, str)]
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    try:
+        if len(parts) == 1 and parts[0][0] == "archive":
+            try:
+                archive = await asyncio.to_thread(zipfile.ZipFile, parts[0][1].file)
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail="The archive is not a zip file")
+            entries = [(file_id, info) for info in archive.infolist() if (file_id := archive_file_id(info.filename))]
+            results = await asyncio.gather(*(
+                queue_batch_entry(file_id, info.filename, info.file_size, semaphore,
+                                  lambda max_size, hasher, file_id=file_id, info=info: asyncio.to_thread(extract_entry, archive, info, file_id, max_size, hasher))
+                for file_id, info in entries
+            ))
+        else:
+            results = await asyncio.gather(*(
+                queue_batch_entry(file_id, part.filename, part.size, semaphore,
+                                  lambda max_size, hasher, file_id=file_id, part=part: stream_temp_file(file_id, part, max_size, hasher=hasher))
+                for file_id, part in parts
+            ))
+    finally:
+        await form.close()
+    if not results:
+        raise HTTPException(status_code=400, detail="The batch doesn't contain any file")
+    await asyncio.to_thread(expire_batches, app_configs.batch_expiration)
+    batch_id = await asyncio.to_thread(create_batch, list(results))
+    return JSONResponse({"batch_id": batch_id, "entries": results}, status_code=202, headers={"Location": f"/batches/{batch_id}"})
+
+async def queue_batch_entry(file_id: str, name: str, size: Optional[int], semaphore: asyncio.Semaphore, store: Callable[[int, Any], Awaitable[str]]) -> dict:
+    """Stores and queues one file of a batch, like POST /file/{file_id}, and returns its outcome instead of raising it."""
+    entry = {"file_id": file_id, "name": name}
+    file_conf = configurations.get(file_id)
+    if file_conf is None:
+        return {**entry, "status_code": 404, "message": "File ID not found"}
+    async with semaphore:
+        try:
+            with upload_timer(file_id) as timer:
+                try:
+                    async with admission.admit(file_id):
+                        message, body, status_code = await queue_upload(file_id, file_conf, store, size, timer)
+                except UploadRejectedError as exc:
+                    raise HTTPException(status_code=429, detail=str(exc))
+        except HTTPException as exc:
+            return {**entry, "status_code": exc.status_code, "message": exc.detail}
+    # the status of deduplicated files is left to GET /batches/{batch_id}
+    return {**entry, "status_code": status_code, "message": message, "job_id": body.get("job_id")}
+
+@app.get("/batches/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """
+    Endpoint to follow the files of a batch upload.
+    Returns:
+        The state of the batch, in_progress until every queued file is processed and done afterwards, the number of
+        files in each state (queued, running, done, failed, superseded or rejected), each file of the batch with its
+        state, and the latest status of each file_id.
+        A 404 Not Found response if the batch doesn't exist or has expired.
+    """
+    try:
+        batch = await asyncio.to_thread(load_batch, batch_id)
+    except BatchNotFoundError:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    job_ids = [entry["job_id"] for entry in batch["entries"] if entry.get("job_id") is not None]
+    job_states = await run_db(engine, async_engine, load_job_states, job_ids)
+    summary = summarize_batch(batch, job_states)
+    file_ids = sorted({entry["file_id"] for entry in batch["entries"] if entry["status_code"] != 404})
+    statuses = dict(zip(file_ids, await asyncio.gather(*(status_cache.get(file_id) for file_id in file_ids))))
+    return {"batch_id": batch_id, **summary, "statuses": statuses}
+
+def upload_response(request: Request, file_id: str, message: str, body: dict, status_code: int):
+    """The response to an upload: a page that redirects to the file for browsers, JSON otherwise."""
     if 'text/html' in request.headers.get('accept', ''):
         # Return Jinja template for browser requests
-        return templates.TemplateResponse("redirect.html", {"file_id": file_id, "message": "Validation started in background", "request": request})
+        return templates.TemplateResponse("redirect.html", {"file_id": file_id, "message": message, "request": request})
     else:
         # Return JSON response for API requests
-        return {"message": "Validation started in background"}, 202
+        return JSONResponse({"message": message, **body}, status_code=status_code)
     
 @app.get("/file/{file_id}/status")
 async def get_file_status(file_id: str):
@@ -98,63 +461,60 @@ async def get_file_status(file_id: str):
     Returns:
         The status of the validation of the file
     """
-    status = load_latest_file_status(engine, file_id)
+    status = await status_cache.get(file_id)
     return {"status": status}
 
-async def process_file(file_id: str, file_path: str) -> None:
+@app.get("/file/{file_id}/events")
+async def get_file_events(file_id: str):
     """
-    Validates and stores a file asynchronously.
+    Endpoint to follow the status of a file with Server-Sent Events.
     file_id: str
-        The id of the file to validate
-    file_path: str
-        The temporary path of file to validate
+        The id of the file for which to follow the status
+    Returns:
+        A stream with a 'status' event with the current status, and another one every time it changes.
     """
-    try:
-        file_conf = configurations[file_id]
-        if isinstance(file_conf, MultipleSheetConfiguration):
-            process_file_multiple_sheets(file_id, file_path, file_conf)
-        else:
-            dataframe = convert_file_to_dataframe(file_id, file_conf, file_path)
-            validate_and_save_dataframe(file_id, dataframe, file_conf)
-    finally:
-        delete_temp_file(file_path)
-
-
-def process_file_multiple_sheets(file_id: str, file_path: str, file_conf: MultipleSheetConfiguration) -> None:
-    """Validates and stores multiple sheets of a file asynchronously."""
-    dataframe_dict = convert_file_to_dataframe_dict(file_id, configurations[file_id], file_path)
-    errors = []
-    partial_success = False
-    for name, dataframe in dataframe_dict.items():
+    async def events():
+        queue = status_cache.subscribe(file_id)
         try:
-            validate_and_save_dataframe(file_id, dataframe, file_conf)
-            partial_success = True
-        except pdr.errors.SchemaErrors as exc:
-            errors.extend([f"{name}: {cause}" for cause in exc.failure_cases])
-            break
-    if errors and not partial_success:
-        save_file_status(engine, file_id, Status.FAILED, errors)
-    elif errors:
-        save_file_status(engine, file_id, Status.PARTIAL_SUCCESS, errors)
-    else:
-        save_file_status(engine, file_id, Status.SUCCESS)
+            status = await status_cache.get(file_id)
+            yield f"event: status\ndata: {json.dumps(status)}\n\n"
+            while True:
+                try:
+                    new_status = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                # the status loaded above may also have been queued
+                if status is None or new_status["status_id"] > status["status_id"]:
+                    status = new_status
+                    yield f"event: status\ndata: {json.dumps(status)}\n\n"
+        finally:
+            status_cache.unsubscribe(file_id, queue)
 
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
-def validate_and_save_dataframe(file_id: str, dataframe: pd.DataFrame, file_conf: Configuration) -> None:
-    """Validates and saves a dataframe."""
-    schema = file_conf.schema
-    try:
-        pdr_schema = pdr.DataFrameSchema(schema, coerce=True)
-        pdr_schema.validate(dataframe, lazy=True, inplace=True)
-        save_file_status(engine, file_id, Status.SAVING)
-        # save dataframe to appropriate location
-        save_dataframe_to_cloud(dataframe, app_configs.storage_provider, file_conf.save_type, file_conf.save_location, file_conf.save_params)
-        save_file_status(engine, file_id, Status.SUCCESS)
-    except (pyarrow.lib.ArrowInvalid, ValueError) as exc:
-        save_file_status(engine, file_id, Status.FAILED , str(exc))
-    except pdr.errors.SchemaErrors as exc:
-        save_file_status(engine, file_id, Status.FAILED , str(exc.failure_cases).split("\n"))
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Endpoint for Prometheus to scrape the metrics of this process: the time, rows, bytes and peak memory of each stage
+    of the uploads received and the files processed here, and their outcomes, by file_id.
+    """
+    return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
 
+@app.get("/file/{file_id}/report")
+async def get_failure_report(file_id: str):
+    """
+    Endpoint to download every failure case found in the latest upload of a file, as a Parquet file.
+    file_id: str
+        The id of the file for which to get the report
+    Returns:
+        The failure report of the file
+        A 404 Not Found response if the latest upload of the file has no failure report.
+    """
+    status = await status_cache.get(file_id)
+    if status is None or not status["report_path"] or not os.path.exists(status["report_path"]):
+        raise HTTPException(status_code=404, detail="No failure report found")
+    return FileResponse(status["report_path"], media_type="application/vnd.apache.parquet", filename=f"{file_id}_failures.parquet")
 
 if __name__ == "__main__":
     import uvicorn
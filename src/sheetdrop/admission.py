@@ -0,0 +1,96 @@
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from sheetdrop.db import run_db
+from sheetdrop.jobs import count_active_jobs
+
+
+class UploadRejectedError(Exception):
+    """Raised when an upload is not accepted because too many files are waiting. The client should retry later."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionControl():
+    """
+    Decides whether an upload is accepted, before it is written to the temp directory.
+    Uploads being received count as queued, so the number of files waiting in the temp directory, and the time
+    they wait, stay bounded during bursts. Also serializes the queueing of uploads of the same file in this process.
+    """
+
+    def __init__(self, engine: Engine, async_engine: AsyncEngine = None, max_queue_depth: int = 100,
+                 max_queued_per_file: int = None, max_receiving: int = None, retry_after: int = 5):
+        """
+        engine: sqlalchemy.engine.Engine
+            The engine for the utility database
+        async_engine: sqlalchemy.ext.asyncio.AsyncEngine
+            The async engine for the utility database, used instead of running queries on threads, if set
+        max_queue_depth: int
+            The maximum number of files queued or being received, across all workers
+        max_queued_per_file: int
+            The maximum number of uploads of the same file queued or being received, or None for no limit
+        max_receiving: int
+            The maximum number of uploads received by this process at the same time, or None for no limit
+        retry_after: int
+            Seconds clients are asked to wait before retrying a rejected upload
+        """
+        self.engine = engine
+        self.async_engine = async_engine
+        self.max_queue_depth = max_queue_depth
+        self.max_queued_per_file = max_queued_per_file
+        self.max_receiving = max_receiving
+        self.retry_after = retry_after
+        self._receiving: dict[str, int] = {}
+        # locks are dropped once no upload of the file holds them
+        self._file_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+
+    @property
+    def receiving(self) -> int:
+        """The number of uploads being received by this process."""
+        return sum(self._receiving.values())
+
+    @asynccontextmanager
+    async def admit(self, file_id: str) -> AsyncIterator[None]:
+        """
+        Reserves a place in the queue for an upload, while it is received and until it is queued.
+        file_id: str
+            The id of the file being uploaded
+        Raises:
+            UploadRejectedError if the queue, the queue of the file, or the uploads being received are full
+        """
+        # rejected without a query when the process is already busy
+        self._check_receiving()
+        queued, queued_for_file = await run_db(self.engine, self.async_engine, count_active_jobs, file_id)
+        # other uploads may have been admitted during the query, so every limit is checked again from here,
+        # and the upload counted without awaiting in between, so concurrent requests see each other
+        self._check_receiving()
+        if queued + self.receiving >= self.max_queue_depth:
+            raise UploadRejectedError("Too many files waiting to be processed. Please try again later.", self.retry_after)
+        if self.max_queued_per_file is not None and queued_for_file + self._receiving.get(file_id, 0) >= self.max_queued_per_file:
+            raise UploadRejectedError("Too many uploads of this file waiting to be processed. Please try again later.", self.retry_after)
+        self._receiving[file_id] = self._receiving.get(file_id, 0) + 1
+        try:
+            yield
+        finally:
+            self._receiving[file_id] -= 1
+            if not self._receiving[file_id]:
+                del self._receiving[file_id]
+
+    def _check_receiving(self) -> None:
+        if self.max_receiving is not None and self.receiving >= self.max_receiving:
+            raise UploadRejectedError("Too many files being uploaded. Please try again later.", self.retry_after)
+
+    def file_lock(self, file_id: str) -> asyncio.Lock:
+        """A lock held while an upload of the file is compared with the previous ones and queued."""
+        lock = self._file_locks.get(file_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._file_locks[file_id] = lock
+        return lock
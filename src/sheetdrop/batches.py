@@ -0,0 +1,159 @@
+import json
+import os
+import time
+import uuid
+import zipfile
+from typing import Any
+
+from sheetdrop.enums import JobState
+from sheetdrop.fileops import (TEMP_DIR, UPLOAD_CHUNK_SIZE, FileTooLargeError,
+                               delete_temp_file, new_temp_path)
+
+# batches keep the outcome of each of their files here, one JSON file per batch
+BATCH_DIR = os.path.join(TEMP_DIR, "batches")
+
+# states of the jobs of files still waiting or being processed
+ACTIVE_JOB_STATES = (JobState.QUEUED.value, JobState.RUNNING.value)
+
+
+class BatchNotFoundError(LookupError):
+    """Raised when a batch doesn't exist, or has expired."""
+
+
+def archive_file_id(name: str) -> str | None:
+    """
+    Returns the file_id an entry of a zip archive is uploaded to: its top-level directory (sales/2024-01.csv),
+    or its name without extension (sales.csv).
+    name: str
+        The name of the entry in the archive
+    Returns:
+        The file_id, or None for directories and the hidden files added by archivers, which are skipped
+    """
+    if name.endswith("/"):
+        return None
+    parts = name.split("/")
+    if any(part.startswith(".") or part == "__MACOSX" for part in parts):
+        return None
+    return parts[0] if len(parts) > 1 else os.path.splitext(parts[0])[0]
+
+
+def extract_entry(archive: zipfile.ZipFile, info: zipfile.ZipInfo, file_id: str, max_size: int = None, hasher=None,
+                  chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """
+    Copies an entry of a zip archive to a temporary file, one chunk at a time.
+    archive: zipfile.ZipFile
+        The archive
+    info: zipfile.ZipInfo
+        The entry to copy
+    file_id: str
+        The id of the file the entry is uploaded to
+    max_size: int
+        The maximum number of bytes accepted, or None for no limit
+    hasher: hashlib hash object
+        If set, updated with every chunk, to hash the entry without reading it again
+    chunk_size: int
+        The number of bytes read from the archive at a time
+    Returns:
+        The path of the stored file
+    Raises:
+        FileTooLargeError if the entry is larger than max_size, checked against the size recorded in the archive
+        before anything is decompressed, and again on the bytes written. The partial file is removed.
+    """
+    if max_size is not None and info.file_size > max_size:
+        raise FileTooLargeError(f"File exceeds the maximum size of {max_size} bytes")
+    path = new_temp_path(file_id)
+    written = 0
+    try:
+        with archive.open(info) as entry, open(path, "wb") as output:
+            while data := entry.read(chunk_size):
+                written += len(data)
+                if max_size is not None and written > max_size:
+                    raise FileTooLargeError(f"File exceeds the maximum size of {max_size} bytes")
+                if hasher is not None:
+                    hasher.update(data)
+                output.write(data)
+    except BaseException:
+        delete_temp_file(path)
+        raise
+    return path
+
+
+def batch_path(batch_id: str) -> str:
+    """Returns the file that describes a batch."""
+    # batch ids come from URLs, so don't let them point outside the batch directory
+    if not batch_id.isalnum():
+        raise BatchNotFoundError(f"Batch {batch_id} not found")
+    return os.path.join(BATCH_DIR, f"{batch_id}.json")
+
+
+def create_batch(entries: list[dict[str, Any]]) -> str:
+    """
+    Records the files of a batch upload. Kept on disk, so every web server sharing the temp directory can report on it.
+    entries: list[dict[str, Any]]
+        The outcome of each file: its file_id, the name of its part or archive entry, the status code and message
+        of its upload, and the job_id it was queued as, if any
+    Returns:
+        The id of the batch
+    """
+    batch_id = uuid.uuid4().hex
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    with open(batch_path(batch_id), "w") as f:
+        json.dump({"created_at": time.time(), "entries": entries}, f)
+    return batch_id
+
+
+def load_batch(batch_id: str) -> dict[str, Any]:
+    """
+    Returns the description of a batch, as recorded by create_batch.
+    Raises:
+        BatchNotFoundError if the batch doesn't exist
+    """
+    try:
+        with open(batch_path(batch_id)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise BatchNotFoundError(f"Batch {batch_id} not found") from None
+
+
+def summarize_batch(batch: dict[str, Any], job_states: dict[int, str]) -> dict[str, Any]:
+    """
+    Aggregates the status of the files of a batch.
+    batch: dict[str, Any]
+        The batch, as returned by load_batch
+    job_states: dict[int, str]
+        The state of the jobs of the batch, by job id (see jobs.load_job_states)
+    Returns:
+        The state of the batch, in_progress while any of its files is queued or running and done afterwards,
+        the number of files in each state, and the entries of the batch with the state of each one. Files that
+        weren't queued are "rejected", or "done" if they were identical to the latest upload of their file.
+    """
+    entries = []
+    counts: dict[str, int] = {}
+    for entry in batch["entries"]:
+        if entry.get("job_id") is not None:
+            state = job_states.get(entry["job_id"], JobState.FAILED.value)
+        else:
+            state = "rejected" if entry["status_code"] >= 400 else JobState.DONE.value
+        entries.append({**entry, "state": state})
+        counts[state] = counts.get(state, 0) + 1
+    in_progress = any(state in ACTIVE_JOB_STATES for state in counts)
+    return {"state": "in_progress" if in_progress else "done", "counts": counts, "entries": entries}
+
+
+def expire_batches(max_age: float) -> None:
+    """
+    Removes the batches created more than max_age seconds ago.
+    max_age: float
+        The age in seconds
+    """
+    if not os.path.exists(BATCH_DIR):
+        return
+    deadline = time.time() - max_age
+    for name in os.listdir(BATCH_DIR):
+        path = os.path.join(BATCH_DIR, name)
+        try:
+            if os.path.getmtime(path) < deadline:
+                os.remove(path)
+        except OSError:
+            # removed by another process in the meantime
+            pass
@@ -1,24 +1,105 @@
-
 import os
 import yaml
 
 class AppConfig:
     def __init__(self):
-        self.database_url = os.getenv("DATABASE_URL")
-        self.database_schema = os.getenv("DATABASE_SCHEMA")
-        self.storage_provider = os.getenv("STORAGE_PROVIDER")
+        try:
+            with open("config.yaml") as f:
+                yaml_config = yaml.safe_load(f) or {}
+        except FileNotFoundError:
+            yaml_config = {}  # YAML is optional, environment variables can be used
 
-        if not all([self.database_url, self.database_schema, self.storage_provider]):
-            try:
-                with open("config.yaml") as f:
-                    yaml_config = yaml.safe_load(f)
-                    self.database_url = self.database_url or yaml_config.get("database_url")
-                    self.database_schema = self.database_schema or yaml_config.get("database_schema")
-                    self.storage_provider = self.storage_provider or yaml_config.get("storage_provider")
-            except FileNotFoundError:
-                pass  # YAML is optional, environment variables can be used
+        def setting(name, default=None, cast=str):
+            """Read a setting from the environment (upper case name) or the YAML file, in that order."""
+            value = os.getenv(name.upper()) or yaml_config.get(name)
+            return default if value is None else cast(value)
+
+        self.database_url = setting("database_url")
+        self.database_schema = setting("database_schema")
+        self.storage_provider = setting("storage_provider")
 
         if not all([self.database_url, self.database_schema, self.storage_provider]):
             raise ValueError("Missing required configuration. Please set DATABASE_URL, DATABASE_SCHEMA, and STORAGE_PROVIDER environment variables or provide them in a config.yaml file.")
 
+        # connection pool of the utility database; unset values use SQLAlchemy's defaults
+        self.database_pool_size = setting("database_pool_size", None, int)
+        self.database_max_overflow = setting("database_max_overflow", None, int)
+        self.database_pool_timeout = setting("database_pool_timeout", None, float)
+        # same database with an async driver (e.g. sqlite+aiosqlite, postgresql+asyncpg), used by request handlers
+        self.async_database_url = setting("async_database_url")
+
+        # connection to the storage provider; unset values use the provider's defaults (environment, instance metadata, Hadoop configuration)
+        self.storage_endpoint = setting("storage_endpoint")
+        self.storage_region = setting("storage_region")
+        self.storage_access_key = setting("storage_access_key")
+        self.storage_secret_key = setting("storage_secret_key")
+        self.storage_health_check_interval = setting("storage_health_check_interval", None, float)
+        self.storage_health_check_path = setting("storage_health_check_path", "")
+
+        # execution engine for the load, validate and save pipeline
+        self.executor_type = setting("executor_type", "thread")
+        self.max_workers = setting("max_workers", os.cpu_count() or 1, int)
+        self.max_queue_depth = setting("max_queue_depth", 100, int)
+        # admission of uploads: uploads of one file run one at a time ("serialize"), or only the latest queued one runs ("coalesce")
+        self.file_concurrency = setting("file_concurrency", "serialize")
+        self.max_queued_per_file = setting("max_queued_per_file", None, int)
+        self.max_concurrent_uploads = setting("max_concurrent_uploads", None, int)
+        self.retry_after = setting("retry_after", 5, int)
+        # seconds a resumable upload is kept without receiving chunks
+        self.upload_expiration = setting("upload_expiration", 86400, float)
+        # seconds the outcome of a batch upload is kept
+        self.batch_expiration = setting("batch_expiration", 604800, float)
+        # sheets of a multiple sheet file validated and saved at the same time
+        self.sheet_workers = setting("sheet_workers", 4, int)
+        # rows read from each file or sheet to check its columns and types before it is queued, 0 to skip the check
+        self.precheck_rows = setting("precheck_rows", 100, int)
+        # failing values shown in the status of a file for each column and check
+        self.failure_samples = setting("failure_samples", 5, int)
+
+        # durable job queue: "embedded" runs a worker inside the web application, "external" leaves jobs to worker.py
+        self.job_runner = setting("job_runner", "embedded")
+        self.job_poll_interval = setting("job_poll_interval", 1.0, float)
+        self.job_lease_seconds = setting("job_lease_seconds", 60, int)
+        self.job_max_attempts = setting("job_max_attempts", 3, int)
+
+        # latest statuses kept in memory, for status pages, polling clients and event streams
+        self.status_cache_ttl = setting("status_cache_ttl", 2.0, float)
+        self.status_cache_size = setting("status_cache_size", 10000, int)
+        self.status_poll_interval = setting("status_poll_interval", 1.0, float)
+
+        # instrumentation: a span for every stage of an upload, and the port where standalone workers serve /metrics
+        self.opentelemetry = setting("opentelemetry", False, lambda value: str(value).lower() in ("1", "true", "yes"))
+        self.metrics_port = setting("metrics_port", None, int)
+
+        # file definitions are all loaded before serving ("eager"), each on its first request ("lazy"),
+        # or on their first request and in the background once the application is up ("background")
+        self.startup_mode = setting("startup_mode", "eager")
+        # seconds between checks for added, changed or removed file definitions, unset to load them only once
+        self.definitions_reload_interval = setting("definitions_reload_interval", None, float)
+
+        if self.executor_type not in ("thread", "process"):
+            raise ValueError(f"Invalid EXECUTOR_TYPE: {self.executor_type}. Supported values: thread, process")
+        if self.max_workers < 1 or self.max_queue_depth < 0 or self.sheet_workers < 1 or self.failure_samples < 0 or self.precheck_rows < 0:
+            raise ValueError("MAX_WORKERS and SHEET_WORKERS must be at least 1 and MAX_QUEUE_DEPTH, FAILURE_SAMPLES and PRECHECK_ROWS can't be negative")
+        if self.file_concurrency not in ("serialize", "coalesce"):
+            raise ValueError(f"Invalid FILE_CONCURRENCY: {self.file_concurrency}. Supported values: serialize, coalesce")
+        if (self.max_queued_per_file is not None and self.max_queued_per_file < 1) or \
+                (self.max_concurrent_uploads is not None and self.max_concurrent_uploads < 1) or self.retry_after < 0:
+            raise ValueError("MAX_QUEUED_PER_FILE and MAX_CONCURRENT_UPLOADS must be at least 1 and RETRY_AFTER can't be negative")
+        if self.upload_expiration <= 0 or self.batch_expiration <= 0:
+            raise ValueError("UPLOAD_EXPIRATION and BATCH_EXPIRATION must be positive")
+        if self.job_runner not in ("embedded", "external"):
+            raise ValueError(f"Invalid JOB_RUNNER: {self.job_runner}. Supported values: embedded, external")
+        if (self.database_pool_size is not None and self.database_pool_size < 1) or \
+                (self.database_max_overflow is not None and self.database_max_overflow < 0):
+            raise ValueError("DATABASE_POOL_SIZE must be at least 1 and DATABASE_MAX_OVERFLOW can't be negative")
+        if self.storage_health_check_interval is not None and self.storage_health_check_interval < 0:
+            raise ValueError("STORAGE_HEALTH_CHECK_INTERVAL can't be negative")
+        if self.status_cache_ttl < 0 or self.status_cache_size < 1 or self.status_poll_interval <= 0:
+            raise ValueError("STATUS_CACHE_TTL can't be negative, STATUS_CACHE_SIZE must be at least 1 and STATUS_POLL_INTERVAL must be positive")
+        if self.startup_mode not in ("eager", "lazy", "background"):
+            raise ValueError(f"Invalid STARTUP_MODE: {self.startup_mode}. Supported values: eager, lazy, background")
+        if self.definitions_reload_interval is not None and self.definitions_reload_interval <= 0:
+            raise ValueError("DEFINITIONS_RELOAD_INTERVAL must be positive")
+
 app_configs = AppConfig()
@@ -1,35 +1,291 @@
+from __future__ import annotations
+
+import hashlib
 import importlib
+import importlib.util
 import os
-import pandera as pa
-from dataclasses import dataclass
+import sys
+import threading
+from collections.abc import Iterator, Mapping
+from contextlib import suppress
+from dataclasses import dataclass, field
 from typing import Any
+from sheetdrop.excel import EXCEL_ENGINES
+from sheetdrop.lazy import lazy_import
+from sheetdrop.schemas import CompiledSchema, compile_schema
+from sheetdrop.validation import VALIDATION_ENGINES
+
+pa = lazy_import("pandera")
+
+def definition_names(modules_dir: str) -> list[str]:
+    """Returns the names of the file definitions in a directory, without importing them."""
+    return sorted(filename[:-3] for filename in os.listdir(modules_dir) if filename.endswith(".py") and filename != "__init__.py")
+
+
+def load_configuration(modules_dir: str, module_name: str, package: str = "file_definitions",
+                       reload: bool = False) -> Configuration | MultipleSheetConfiguration:
+    """
+    Imports a file definition, validates its configuration and compiles its schemas.
+    modules_dir: str
+        The directory of the file definitions, importable as package
+    module_name: str
+        The name of the definition, i.e. its module
+    package: str
+        The package of the file definitions
+    reload: bool
+        Whether to import the module again if it was already imported, e.g. after it changed.
+        A new configuration is built, so the one returned before is left as it was.
+    Raises:
+        ValueError if the definition doesn't have a valid configuration
+    """
+    module_path = f"{package}.{module_name}"
+    source_path = os.path.join(modules_dir, f"{module_name}.py")
+    try:
+        # Dynamically import the module
+        if reload and module_path in sys.modules:
+            # cached bytecode only records the modification time in seconds, so a quick edit could be missed
+            with suppress(FileNotFoundError):
+                os.remove(importlib.util.cache_from_source(source_path))
+            module = importlib.reload(sys.modules[module_path])
+        else:
+            module = importlib.import_module(module_path)
+    except Exception as exc:
+        raise ValueError(f"Could not import module {module_name}: {exc}") from exc
+
+    # Check if the module has an attribute called "configuration"
+    if not hasattr(module, "configuration"):
+        raise ValueError(f"Module {module_name} does not have a configuration attribute")
+    config = module.configuration
+    if not isinstance(config, (Configuration, MultipleSheetConfiguration)):
+        raise ValueError(f"Invalid configuration for {module_name}: {config}")
+    validation_errors = config.validate()
+    if validation_errors:
+        raise ValueError(f"Invalid configuration for {module_name}: {', '.join(validation_errors)}")
+    with open(source_path, "rb") as f:
+        # changes to the definition make earlier results of the same upload obsolete
+        config.fingerprint = hashlib.sha256(f.read()).hexdigest()
+    try:
+        # build the pandera schemas once, instead of on every upload
+        config.compile()
+    except Exception as exc:
+        raise ValueError(f"Invalid schema for {module_name}: {exc}") from exc
+    print(f"Loaded configuration: {module_name}")
+    return config
+
 
 def load_configurations(modules_dir):
     configurations = {}
     errors = []
-    for filename in os.listdir(modules_dir):
-        if filename.endswith(".py"):
-            module_name = filename[:-3]  # Strip the .py extension
-            module_path = f"file_definitions.{module_name}"
+    for module_name in definition_names(modules_dir):
+        try:
+            configurations[module_name] = load_configuration(modules_dir, module_name)
+        except ValueError as exc:
+            errors.append(str(exc))
+    return configurations, errors
 
-            # Dynamically import the module
-            module = importlib.import_module(module_path)
 
-            # Check if the module has an attribute called "configuration"
-            if hasattr(module, "configuration"):
-                config = module.configuration
-                if isinstance(config, (Configuration, MultipleSheetConfiguration)):
-                    validation_errors = config.validate()
-                    if validation_errors:
-                        errors.append(f"Invalid configuration for {module_name}: {', '.join(validation_errors)}")
-                    else:
-                        configurations[module_name] = config
-                        print(f"Loaded configuration: {module_name}")
-                else:
-                    errors.append(f"Invalid configuration for {module_name}: {config}")
-            else:
-                errors.append(f"Module {module_name} does not have a configuration attribute")
-    return configurations, errors
+class ConfigurationRegistry(Mapping):
+    """
+    The configurations of the file definitions, by file id. Only the names of the definitions are read when it is
+    created; each definition is imported and compiled the first time it is requested, so startup doesn't pay for
+    pandas, pandera and every schema. Iterating loads every definition, and only yields the valid ones.
+    Definitions can be loaded ahead of requests with load_all, or in the background with warm_up.
+
+    Changes to the directory are picked up by refresh, or periodically by watch. A changed definition is replaced by
+    a new configuration once it is valid, so jobs keep the configuration they started with. While it is invalid, the
+    previous version stays in use and the error is reported in errors.
+    """
+
+    def __init__(self, modules_dir: str, package: str = "file_definitions"):
+        """
+        modules_dir: str
+            The directory of the file definitions, importable as package
+        package: str
+            The package of the file definitions
+        """
+        self.modules_dir = modules_dir
+        self.package = package
+        self._names = definition_names(modules_dir)
+        # modification time and size of each definition when the registry last looked at it
+        self._signatures = {name: self._signature(name) for name in self._names}
+        self._configurations: dict[str, Configuration | MultipleSheetConfiguration] = {}
+        # errors of the definitions whose latest version failed to load, by name, so they are only tried once
+        self._errors: dict[str, str] = {}
+        # imports aren't safe to run twice at once for the same module, and compiling is only done once
+        self._lock = threading.RLock()
+        self._stopping = threading.Event()
+
+    def __getitem__(self, file_id: str) -> Configuration | MultipleSheetConfiguration:
+        if file_id in self._configurations:
+            return self._configurations[file_id]
+        if file_id not in self._names:
+            raise KeyError(file_id)
+        with self._lock:
+            if file_id not in self._configurations and file_id not in self._errors:
+                self._load(file_id)
+        try:
+            return self._configurations[file_id]
+        except KeyError:
+            raise KeyError(file_id) from None
+
+    def __iter__(self) -> Iterator[str]:
+        self.load_all()
+        return iter([name for name in self._names if name in self._configurations])
+
+    def __len__(self) -> int:
+        self.load_all()
+        return len(self._configurations)
+
+    @property
+    def errors(self) -> list[str]:
+        """The errors of the definitions whose latest version failed to load."""
+        with self._lock:
+            return [self._errors[name] for name in self._names if name in self._errors]
+
+    def load_all(self) -> None:
+        """Loads every definition that isn't loaded yet."""
+        for name in self._names:
+            self.get(name)
+
+    def warm_up(self) -> threading.Thread:
+        """
+        Loads every definition on a background thread, so requests don't wait for them.
+        Returns:
+            The thread, already started
+        """
+        thread = threading.Thread(target=self.load_all, name="sheetdrop-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def refresh(self) -> list[str]:
+        """
+        Picks up the definitions added, changed or removed since the last refresh. Only the modules that changed are
+        imported again, and only if they were loaded before: the others are loaded from the new version when they
+        are first requested. New definitions are loaded right away, so their errors are reported.
+        Returns:
+            The names of the definitions added, changed or removed
+        """
+        # new files aren't seen by the import system until its caches are cleared
+        importlib.invalidate_caches()
+        names = definition_names(self.modules_dir)
+        changed = []
+        with self._lock:
+            for name in set(self._names) - set(names):
+                changed.append(name)
+                self._configurations.pop(name, None)
+                self._errors.pop(name, None)
+                self._signatures.pop(name, None)
+                sys.modules.pop(f"{self.package}.{name}", None)
+                print(f"Removed configuration: {name}")
+            for name in names:
+                signature = self._signature(name)
+                if signature == self._signatures.get(name):
+                    continue
+                changed.append(name)
+                known = name in self._signatures
+                self._signatures[name] = signature
+                if not known or name in self._configurations or name in self._errors:
+                    self._load(name, reload=known)
+            self._names = names
+        return sorted(changed)
+
+    def watch(self, interval: float) -> threading.Thread:
+        """
+        Refreshes the definitions periodically on a background thread, until stop_watching is called.
+        interval: float
+            Seconds between checks of the directory
+        Returns:
+            The thread, already started
+        """
+        def run():
+            while not self._stopping.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as exc:
+                    print(f"Failed to refresh the file definitions: {exc!r}")
+
+        self._stopping.clear()
+        thread = threading.Thread(target=run, name="sheetdrop-definition-watcher", daemon=True)
+        thread.start()
+        return thread
+
+    def stop_watching(self) -> None:
+        """Stops the thread started by watch."""
+        self._stopping.set()
+
+    def _load(self, name: str, reload: bool = False) -> None:
+        # called with the lock held. The configuration is only replaced once the new one is valid and compiled,
+        # and readers get either the old or the new one, never one being built.
+        try:
+            config = load_configuration(self.modules_dir, name, self.package, reload)
+        except ValueError as exc:
+            self._errors[name] = str(exc)
+            if name in self._configurations:
+                print(f"ERROR: {exc}. The previous version of {name} is still used.")
+        else:
+            self._configurations[name] = config
+            self._errors.pop(name, None)
+
+    def _signature(self, name: str) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(os.path.join(self.modules_dir, f"{name}.py"))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+# compression codecs accepted in the save_params of Parquet outputs
+PARQUET_COMPRESSIONS = ("snappy", "gzip", "brotli", "zstd", "lz4", "none")
+
+def validate_parquet_params(owner: str, save_params: dict[str, Any], schema: dict[str, pa.Column]) -> list[str]:
+    """Checks the save_params that control the layout of Parquet outputs (see fileops.write_parquet_dataset)."""
+    errors = []
+    partition_cols = save_params.get("partition_cols")
+    if partition_cols is not None:
+        if not isinstance(partition_cols, list) or not partition_cols or not all(isinstance(column, str) for column in partition_cols):
+            errors.append(f"{owner}.save_params['partition_cols'] must be a non-empty list of column names")
+        elif isinstance(schema, dict) and (missing := [column for column in partition_cols if column not in schema]):
+            errors.append(f"{owner}.save_params['partition_cols'] contains columns missing from the schema: {', '.join(missing)}")
+    for name in ("max_rows_per_file", "row_group_size"):
+        value = save_params.get(name)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value <= 0):
+            errors.append(f"{owner}.save_params['{name}'] must be a positive integer")
+    use_dictionary = save_params.get("use_dictionary")
+    if use_dictionary is not None and not isinstance(use_dictionary, bool) and \
+            not (isinstance(use_dictionary, list) and all(isinstance(column, str) for column in use_dictionary)):
+        errors.append(f"{owner}.save_params['use_dictionary'] must be a boolean or a list of column names")
+    compression = save_params.get("compression")
+    if compression is not None and (not isinstance(compression, str) or compression.lower() not in PARQUET_COMPRESSIONS):
+        errors.append(f"{owner}.save_params['compression'] must be one of {list(PARQUET_COMPRESSIONS)}")
+    return errors
+
+# write modes accepted in the save_params of Delta Lake outputs
+DELTA_MODES = ("overwrite", "append", "merge")
+
+def validate_delta_params(owner: str, save_params: dict[str, Any], schema: dict[str, pa.Column]) -> list[str]:
+    """Checks the save_params that control how Delta Lake outputs are written (see fileops.write_delta_table)."""
+    errors = []
+    mode = save_params.get("mode", "overwrite")
+    if mode not in DELTA_MODES:
+        errors.append(f"{owner}.save_params['mode'] must be one of {list(DELTA_MODES)}")
+    predicate = save_params.get("predicate")
+    if predicate is not None and (not isinstance(predicate, str) or not predicate or mode != "overwrite"):
+        errors.append(f"{owner}.save_params['predicate'] must be a non-empty string, and is only supported with mode 'overwrite'")
+    merge_keys = save_params.get("merge_keys")
+    if mode == "merge":
+        if not isinstance(merge_keys, list) or not merge_keys or not all(isinstance(column, str) for column in merge_keys):
+            errors.append(f"{owner}.save_params['merge_keys'] must be a non-empty list of column names with mode 'merge'")
+        elif isinstance(schema, dict) and (missing := [column for column in merge_keys if column not in schema]):
+            errors.append(f"{owner}.save_params['merge_keys'] contains columns missing from the schema: {', '.join(missing)}")
+    elif merge_keys is not None:
+        errors.append(f"{owner}.save_params['merge_keys'] is only supported with mode 'merge'")
+    for name in ("compact_every", "vacuum_every"):
+        value = save_params.get(name)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value <= 0):
+            errors.append(f"{owner}.save_params['{name}'] must be a positive integer")
+    retention = save_params.get("vacuum_retention_hours")
+    if retention is not None and (not isinstance(retention, (int, float)) or isinstance(retention, bool) or retention < 0):
+        errors.append(f"{owner}.save_params['vacuum_retention_hours'] must be a non-negative number")
+    return errors
 
 @dataclass
 class Configuration():
@@ -40,6 +296,26 @@ class Configuration():
     load_params: dict[str, Any] = None
     save_type: str = "parquet"
     save_params: dict[str, Any] = None
+    max_file_size: int = None
+    chunk_size: int = None
+    engine: str = "pandas"
+    excel_engine: str = "auto"
+    schema_columns_only: bool = False
+    validation_engine: str = "pandera"
+    deduplicate: bool = False
+    # hash of the module that defines the configuration, set by load_configurations
+    fingerprint: str = field(default=None, init=False, repr=False, compare=False)
+    _compiled_schema: CompiledSchema = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def compiled_schema(self) -> CompiledSchema:
+        """The schema compiled by compile(), compiling it on first use if needed."""
+        if self._compiled_schema is None:
+            self.compile()
+        return self._compiled_schema
+
+    def compile(self) -> None:
+        self._compiled_schema = compile_schema(self.schema)
 
     def validate(self) -> list[str]:
         errors = []
@@ -53,6 +329,27 @@ class Configuration():
             errors.append("Configuration.load_params must be a dictionary")
         if self.save_params and not isinstance(self.save_params, dict):
             errors.append("Configuration.save_params must be a dictionary")
+        elif self.save_params and self.save_type == "parquet":
+            errors.extend(validate_parquet_params("Configuration", self.save_params, self.schema))
+        elif self.save_params and self.save_type == "deltalake":
+            errors.extend(validate_delta_params("Configuration", self.save_params, self.schema))
+        if self.max_file_size is not None and (not isinstance(self.max_file_size, int) or self.max_file_size <= 0):
+            errors.append("Configuration.max_file_size must be a positive integer")
+        if self.chunk_size is not None:
+            if not isinstance(self.chunk_size, int) or self.chunk_size <= 0:
+                errors.append("Configuration.chunk_size must be a positive integer")
+            if self.load_type != "csv":
+                errors.append("Configuration.chunk_size is only supported when load_type is 'csv'")
+        if self.engine not in ("pandas", "arrow"):
+            errors.append("Configuration.engine must be 'pandas' or 'arrow'")
+        elif self.engine == "arrow" and (self.load_type != "csv" or self.chunk_size):
+            errors.append("Configuration.engine 'arrow' is only supported when load_type is 'csv', without chunk_size")
+        if self.excel_engine not in EXCEL_ENGINES:
+            errors.append(f"Configuration.excel_engine must be one of {list(EXCEL_ENGINES)}")
+        if self.validation_engine not in VALIDATION_ENGINES:
+            errors.append(f"Configuration.validation_engine must be one of {list(VALIDATION_ENGINES)}")
+        if not isinstance(self.deduplicate, bool):
+            errors.append("Configuration.deduplicate must be a boolean")
         return errors
 
 @dataclass
@@ -62,6 +359,18 @@ class SheetConfiguration():
     schema: dict[str, pa.Column]
     save_type: str = "parquet"
     save_params: dict[str, Any] = None
+    validation_engine: str = "pandera"
+    _compiled_schema: CompiledSchema = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def compiled_schema(self) -> CompiledSchema:
+        """The schema compiled by compile(), compiling it on first use if needed."""
+        if self._compiled_schema is None:
+            self.compile()
+        return self._compiled_schema
+
+    def compile(self) -> None:
+        self._compiled_schema = compile_schema(self.schema)
 
     def validate(self) -> list[str]:
         errors = []
@@ -73,6 +382,12 @@ class SheetConfiguration():
             errors.append("SheetConfiguration.schema must be a dictionary")
         if self.save_params and not isinstance(self.save_params, dict):
             errors.append("SheetConfiguration.save_params must be a dictionary")
+        elif self.save_params and self.save_type == "parquet":
+            errors.extend(validate_parquet_params("SheetConfiguration", self.save_params, self.schema))
+        elif self.save_params and self.save_type == "deltalake":
+            errors.extend(validate_delta_params("SheetConfiguration", self.save_params, self.schema))
+        if self.validation_engine not in VALIDATION_ENGINES:
+            errors.append(f"SheetConfiguration.validation_engine must be one of {list(VALIDATION_ENGINES)}")
         return errors
     
 @dataclass
@@ -80,6 +395,16 @@ class MultipleSheetConfiguration():
     name: str
     sheets: list[SheetConfiguration]
     load_params: dict[str, Any] = None
+    max_file_size: int = None
+    excel_engine: str = "auto"
+    schema_columns_only: bool = False
+    deduplicate: bool = False
+    # hash of the module that defines the configuration, set by load_configurations
+    fingerprint: str = field(default=None, init=False, repr=False, compare=False)
+
+    def compile(self) -> None:
+        for sheet_conf in self.sheets:
+            sheet_conf.compile()
 
     def validate(self) -> list[str]:
         errors = []
@@ -95,4 +420,10 @@ class MultipleSheetConfiguration():
                     errors.extend(sheet_conf.validate())
         if self.load_params and not isinstance(self.load_params, dict):
             errors.append("MultipleSheetConfiguration.load_params must be a dictionary")
+        if self.max_file_size is not None and (not isinstance(self.max_file_size, int) or self.max_file_size <= 0):
+            errors.append("MultipleSheetConfiguration.max_file_size must be a positive integer")
+        if self.excel_engine not in EXCEL_ENGINES:
+            errors.append(f"MultipleSheetConfiguration.excel_engine must be one of {list(EXCEL_ENGINES)}")
+        if not isinstance(self.deduplicate, bool):
+            errors.append("MultipleSheetConfiguration.deduplicate must be a boolean")
         return errors
@@ -1,51 +1,201 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import Any, Callable
 import sqlalchemy
-from sqlalchemy.engine import Engine
-from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy import select, desc
-from sheetdrop.dbmodels import FileStatus, FileStatusDetail
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import insert, select, update
+from sheetdrop.dbmodels import FileLatestStatus, FileStatus, FileStatusDetail
 from sheetdrop.enums import Status
 
-def create_engine(url: str) -> Engine:
+def create_engine(url: str, pool_size: int = None, max_overflow: int = None, pool_timeout: float = None) -> Engine:
     """Create a database engine for use within FastApi
     Parameters:
         url: str
             The URL of the database
+        pool_size: int
+            The number of connections kept open, or None for SQLAlchemy's default
+        max_overflow: int
+            The number of connections opened beyond pool_size when needed, or None for SQLAlchemy's default
+        pool_timeout: float
+            Seconds to wait for a free connection, or None for SQLAlchemy's default
     Returns:
         sqlalchemy.engine.Engine
             The engine for the database
     """
-    return sqlalchemy.create_engine(url)
-
+    return sqlalchemy.create_engine(url, **pool_options(pool_size, max_overflow, pool_timeout))
 
+def create_async_engine(url: str, pool_size: int = None, max_overflow: int = None, pool_timeout: float = None) -> AsyncEngine:
+    """Create an asyncio database engine, for a URL with an async driver (e.g. sqlite+aiosqlite, postgresql+asyncpg)
+    Parameters:
+        url: str
+            The URL of the database
+        pool_size, max_overflow, pool_timeout:
+            Connection pool settings, as in create_engine
+    Returns:
+        sqlalchemy.ext.asyncio.AsyncEngine
+            The engine for the database
+    """
+    options = pool_options(pool_size, max_overflow, pool_timeout)
+    if options and sqlalchemy.engine.make_url(url).get_backend_name() == "sqlite":
+        # aiosqlite opens a new connection for every checkout by default, without a pool to configure
+        options["poolclass"] = sqlalchemy.pool.AsyncAdaptedQueuePool
+    return sqlalchemy.ext.asyncio.create_async_engine(url, **options)
 
+def pool_options(pool_size: int = None, max_overflow: int = None, pool_timeout: float = None) -> dict[str, Any]:
+    """The connection pool arguments for create_engine that were set, leaving the others to the dialect's defaults"""
+    options = {"pool_size": pool_size, "max_overflow": max_overflow, "pool_timeout": pool_timeout}
+    return {name: value for name, value in options.items() if value is not None}
 
-def save_file_status(engine: Engine, file_id: str, status: Status, status_detail: list[str] = None) -> None:
-    """Save the status of a file in the database
+async def run_db(engine: Engine, async_engine: AsyncEngine | None, function: Callable, *args) -> Any:
+    """Run a database function from async code, without blocking the event loop
     Parameters:
         engine: sqlalchemy.engine.Engine
             The engine for the database
+        async_engine: sqlalchemy.ext.asyncio.AsyncEngine
+            The async engine for the same database, or None. When set, the function runs on one of its connections.
+            Otherwise, it runs with engine on a thread.
+        function: Callable
+            A function that receives an engine or a connection as its first argument, e.g. save_file_status
+        args:
+            The other arguments of the function
+    Returns:
+        Any
+            The result of the function
+    """
+    if async_engine is None:
+        return await asyncio.to_thread(function, engine, *args)
+    async with async_engine.connect() as connection:
+        return await connection.run_sync(function, *args)
+
+# callbacks run with file_status_dict of every status saved in this process, e.g. to update a cache
+status_listeners: list[Callable[[dict[str, Any]], None]] = []
+
+def utcnow() -> datetime:
+    """Returns the current UTC time without timezone, so it compares the same way in every database."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def file_status_dict(status: FileStatus, status_detail: list[str] = None) -> dict[str, Any]:
+    """Copy a status and its details to a dictionary, that can be shared between threads and sent as JSON
+    Parameters:
+        status: FileStatus
+            The status to copy
+        status_detail: list[str]
+            The details of the status, if they are not loaded in status.status_details
+    Returns:
+        dict[str, Any]
+            The status, with the same fields as FileStatus
+    """
+    if status_detail is None:
+        status_detail = [detail.status_detail for detail in status.status_details]
+    return {
+        "status_id": status.status_id,
+        "file_id": status.file_id,
+        "status": status.status,
+        "report_path": status.report_path,
+        "stage_timings": json.loads(status.stage_timings) if status.stage_timings else None,
+        "created_at": status.created_at.isoformat(),
+        "status_details": [{"status_detail": detail} for detail in status_detail],
+    }
+
+def save_file_status(engine: Engine | Connection, file_id: str, status: Status, status_detail: list[str] = None, report_path: str = None,
+                     stage_timings: dict[str, dict] = None, content_hash: str = None) -> None:
+    """Save the status of a file in the database
+    Parameters:
+        engine: sqlalchemy.engine.Engine | sqlalchemy.engine.Connection
+            The engine for the database, or a connection to it
         file_id: str    
             The ID of the file
         status: Status 
             The status of the file
         status_detail: list[str]    
             The detail of the status
+        report_path: str
+            The path of the full failure report of the file, if any
+        stage_timings: dict[str, dict]
+            The timing of each stage of the upload so far, as returned by StageTimer.as_dict, if measured
+        content_hash: str
+            The hash of the upload the status is the result of (see fileops.upload_hash), if it is deduplicated.
+            Only set on the final status a job saves, so identical uploads reuse the result of this upload and no other.
     """
-    # Create a session
-    with Session(engine) as session:
-        # Create a new FileStatus entry
-        new_status = FileStatus(file_id=file_id, status=status.value)
-        # Add the status details to the new status
-        for detail in status_detail or []:
-            new_status_detail = FileStatusDetail(status_detail=detail)
-            new_status.status_details.append(new_status_detail)
-        # Add the new status (along with its details) to the session
-        session.add(new_status)
+    # Create a session; the new status stays readable after the commit, for the listeners
+    with Session(engine, expire_on_commit=False) as session:
+        new_status = add_file_status(session, file_id, status, status_detail, report_path, stage_timings, content_hash)
         # Commit the transaction to save the new status and details
         session.commit()
+    notify_status_listeners(new_status, status_detail)
+
+def add_file_status(session: Session, file_id: str, status: Status, status_detail: list[str] = None, report_path: str = None,
+                    stage_timings: dict[str, dict] = None, content_hash: str = None) -> FileStatus:
+    """Add the status of a file to a session, so it can be committed along with other changes
+    Parameters:
+        session: sqlalchemy.orm.Session
+            The session where the status is saved. Once it is committed, pass the status to notify_status_listeners.
+        file_id, status, status_detail, report_path, stage_timings, content_hash:
+            As in save_file_status
+    Returns:
+        FileStatus
+            The new status, flushed but not committed
+    """
+    # Create a new FileStatus entry
+    new_status = FileStatus(file_id=file_id, status=status.value, report_path=report_path,
+                            stage_timings=json.dumps(stage_timings) if stage_timings else None, created_at=utcnow())
+    session.add(new_status)
+    # Flush to get the id of the new status
+    session.flush()
+    # Insert the status details in bulk, without creating an ORM object for each one
+    if status_detail:
+        session.execute(insert(FileStatusDetail), [
+            {"status_id": new_status.status_id, "status_detail": detail} for detail in status_detail
+        ])
+    # Point the file to its new status, in the same transaction
+    update_latest_file_status(session, file_id, new_status.status_id, content_hash)
+    return new_status
 
-def load_latest_file_status(engine: Engine, file_id: str) -> FileStatus:
-    """Load the latest status of a file
+def notify_status_listeners(status: FileStatus, status_detail: list[str] = None) -> None:
+    """Pass a status that was just committed to the status listeners
+    Parameters:
+        status: FileStatus
+            The new status, still loaded (e.g. from a session with expire_on_commit=False)
+        status_detail: list[str]
+            The details of the status
+    """
+    if status_listeners:
+        saved = file_status_dict(status, status_detail or [])
+        for listener in status_listeners:
+            listener(saved)
+
+def update_latest_file_status(session: Session, file_id: str, status_id: int, content_hash: str = None) -> None:
+    """Point the latest status of a file to a new status, and the hash of the upload it belongs to
+    Parameters:
+        session: sqlalchemy.orm.Session
+            The session where the status was saved
+        file_id: str
+            The ID of the file
+        status_id: int
+            The ID of the new status
+        content_hash: str
+            The hash of the upload the new status is the result of, or None. Moved along with status_id, so the
+            hash of one upload never ends up next to the result of another
+    """
+    # never replace a status saved by a concurrent transaction that got a later id
+    stmt = (update(FileLatestStatus)
+            .where(FileLatestStatus.file_id == file_id, FileLatestStatus.status_id < status_id)
+            .values(status_id=status_id, content_hash=content_hash))
+    if session.execute(stmt).rowcount:
+        return
+    try:
+        with session.begin_nested():
+            session.execute(insert(FileLatestStatus).values(file_id=file_id, status_id=status_id, content_hash=content_hash))
+    except IntegrityError:
+        # the file already had a row, newer than this status or inserted by a concurrent transaction
+        session.execute(stmt)
+
+def load_latest_file_status(engine: Engine | Connection, file_id: str) -> FileStatus:
+    """Load the latest status of a file, along with its details, in a single query
     
     Parameters:
         engine: sqlalchemy.engine.Engine
@@ -59,10 +209,51 @@ def load_latest_file_status(engine: Engine, file_id: str) -> FileStatus:
     """
     # Create a session
     with Session(engine) as session:
-        # Query to get the latest FileStatus by file_id, ordered by timestamp descending
-        stmt = select(FileStatus).where(FileStatus.file_id == file_id).order_by(desc(FileStatus.status_id))
-        latest_status = session.scalars(stmt).first()
-        # Get the status details from the latest status, to force eager loading
-        details = latest_status.status_details if latest_status else None
+        # Look the status up through the latest status of the file, joining its details
+        stmt = (select(FileStatus)
+                .join(FileLatestStatus, FileLatestStatus.status_id == FileStatus.status_id)
+                .where(FileLatestStatus.file_id == file_id)
+                .options(joinedload(FileStatus.status_details)))
+        return session.scalars(stmt).unique().first()
+
+def load_reusable_file_status(engine: Engine | Connection, file_id: str, content_hash: str) -> FileStatus | None:
+    """Load the result of the latest upload of a file, if it was identical to a new one and can stand for it
+    
+    Parameters:
+        engine: sqlalchemy.engine.Engine
+            The engine for the database
+        file_id: str
+            The ID of the file
+        content_hash: str
+            The hash of the new upload (see fileops.upload_hash)
+            
+    Returns:
+        FileStatus
+            The latest status of the file, if its upload had the same hash and it succeeded or failed validation.
+            None otherwise, e.g. while it is in progress or if it failed for another reason, that may not happen again.
+    """
+    with Session(engine) as session:
+        stmt = (select(FileStatus)
+                .join(FileLatestStatus, FileLatestStatus.status_id == FileStatus.status_id)
+                .where(FileLatestStatus.file_id == file_id, FileLatestStatus.content_hash == content_hash)
+                .options(joinedload(FileStatus.status_details)))
+        status = session.scalars(stmt).unique().first()
+    # validation failures always come with a failure report
+    if status is not None and (status.status == Status.SUCCESS.value or status.report_path):
+        return status
+    return None
 
-        return latest_status
+def load_latest_status_ids(engine: Engine | Connection, file_ids: list[str]) -> dict[str, int]:
+    """Load the ID of the latest status of many files at once
+    Parameters:
+        engine: sqlalchemy.engine.Engine
+            The engine for the database
+        file_ids: list[str]
+            The IDs of the files
+    Returns:
+        dict[str, int]
+            The ID of the latest status of each file that has one
+    """
+    with Session(engine) as session:
+        stmt = select(FileLatestStatus.file_id, FileLatestStatus.status_id).where(FileLatestStatus.file_id.in_(file_ids))
+        return {file_id: status_id for file_id, status_id in session.execute(stmt)}
@@ -1,22 +1,52 @@
 
-from sqlalchemy import ForeignKey
+from datetime import datetime
+from sqlalchemy import ForeignKey, Index, Text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from typing import List
+from typing import List, Optional
 
 class Base(DeclarativeBase):
     pass 
 
 class FileStatus(Base):
     __tablename__ = 'file_status'
+    __table_args__ = (Index('ix_file_status_file_id_status_id', 'file_id', 'status_id'),)
 
     status_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, nullable=False)
     file_id: Mapped[str] = mapped_column(nullable=False)
     status: Mapped[str] = mapped_column(nullable=False)
-    status_details: Mapped[List["FileStatusDetail"]] = relationship(cascade="all, delete-orphan")
+    report_path: Mapped[Optional[str]] = mapped_column(nullable=True)
+    # JSON with the time, rows, bytes and peak memory of each stage of the upload (see metrics.StageTimer), if measured
+    stage_timings: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(nullable=False)
+    status_details: Mapped[List["FileStatusDetail"]] = relationship(cascade="all, delete-orphan", order_by="FileStatusDetail.status_detail_id")
 
 class FileStatusDetail(Base):
     __tablename__ = 'file_status_detail'
+    __table_args__ = (Index('ix_file_status_detail_status_id', 'status_id'),)
 
     status_detail_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, nullable=False)
     status_id: Mapped[int] = mapped_column(ForeignKey("file_status.status_id"), nullable=False)
     status_detail: Mapped[str] = mapped_column(nullable=False)
+
+class FileLatestStatus(Base):
+    """The latest status of each file, kept up to date by save_file_status."""
+    __tablename__ = 'file_latest_status'
+
+    file_id: Mapped[str] = mapped_column(primary_key=True, nullable=False)
+    status_id: Mapped[int] = mapped_column(ForeignKey("file_status.status_id"), nullable=False)
+    # hash of the upload the latest status belongs to (see fileops.upload_hash), if it was deduplicated
+    content_hash: Mapped[Optional[str]] = mapped_column(nullable=True)
+
+class Job(Base):
+    __tablename__ = 'job'
+    __table_args__ = (Index('ix_job_state_job_id', 'state', 'job_id'),)
+
+    job_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, nullable=False)
+    file_id: Mapped[str] = mapped_column(nullable=False)
+    file_path: Mapped[str] = mapped_column(nullable=False)
+    state: Mapped[str] = mapped_column(nullable=False)
+    attempts: Mapped[int] = mapped_column(nullable=False, default=0)
+    worker_id: Mapped[Optional[str]] = mapped_column(nullable=True)
+    lease_expires_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+    content_hash: Mapped[Optional[str]] = mapped_column(nullable=True)
+    created_at: Mapped[datetime] = mapped_column(nullable=False)
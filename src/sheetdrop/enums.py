@@ -6,3 +6,12 @@ class Status(Enum):
     SUCCESS = "success"
     FAILED = "failed"
     PARTIAL_SUCCESS = "partial_success"
+
+
+class JobState(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    # replaced by a newer upload of the same file before it started
+    SUPERSEDED = "superseded"
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import importlib.util
+import itertools
+import os
+import zipfile
+from typing import IO, Any, Callable, Iterable
+
+from sheetdrop.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+# values accepted by Configuration.excel_engine
+EXCEL_ENGINES = ("auto", "calamine", "openpyxl", "openpyxl_read_only", "xlrd", "pyxlsb", "odf")
+
+# without calamine, automatic selection streams xlsx files larger than this (in bytes)
+STREAMING_THRESHOLD = 10 * 1024 * 1024
+
+# load_params understood by the openpyxl_read_only engine
+READ_ONLY_PARAMS = {"sheet_name", "header", "skiprows", "nrows", "usecols"}
+
+
+def detect_excel_format(file: IO[bytes]) -> str | None:
+    """
+    Detects the format of a spreadsheet from its contents, since uploads are stored without extension.
+    file: IO[bytes]
+        The open file. Its position is restored afterwards.
+    Returns:
+        'xls', 'xlsx', 'xlsb', 'ods', or None if the file is not a known spreadsheet format
+    """
+    position = file.tell()
+    header = file.read(8)
+    file.seek(position)
+    if header.startswith(b"\xd0\xcf\x11\xe0"):
+        return "xls"
+    if not header.startswith(b"PK\x03\x04"):
+        return None
+    try:
+        with zipfile.ZipFile(file) as archive:
+            names = set(archive.namelist())
+    except zipfile.BadZipFile:
+        return None
+    finally:
+        file.seek(position)
+    if "xl/workbook.bin" in names:
+        return "xlsb"
+    if "content.xml" in names:
+        return "ods"
+    return "xlsx"
+
+
+def select_excel_engine(file: IO[bytes], requested: str = "auto", load_params: dict[str, Any] = None) -> str:
+    """
+    Selects the engine used to read a spreadsheet.
+    With 'auto', calamine is used when python-calamine is installed, since it is the fastest reader for every format.
+    Otherwise the engine is picked from the format of the file, and large xlsx files are read in streaming mode.
+    file: IO[bytes]
+        The open file
+    requested: str
+        The engine set in the configuration, one of EXCEL_ENGINES
+    load_params: dict[str, Any]
+        The parameters that will be used to read the file
+    Returns:
+        The name of the engine
+    """
+    if requested != "auto":
+        return requested
+    if importlib.util.find_spec("python_calamine") is not None:
+        return "calamine"
+    file_format = detect_excel_format(file)
+    if file_format == "xls":
+        return "xlrd"
+    if file_format == "xlsb":
+        return "pyxlsb"
+    if file_format == "ods":
+        return "odf"
+    streamable = set(load_params or {}) <= READ_ONLY_PARAMS
+    if streamable and os.fstat(file.fileno()).st_size > STREAMING_THRESHOLD:
+        return "openpyxl_read_only"
+    return "openpyxl"
+
+
+class ExcelWorkbook():
+    """
+    A workbook opened once, whose sheets are only parsed when requested.
+    The openpyxl_read_only engine streams rows and keeps only the selected columns, instead of
+    materializing the whole sheet first. Every other engine goes through pandas.ExcelFile.
+    """
+
+    def __init__(self, file: IO[bytes], engine: str):
+        """
+        file: IO[bytes]
+            The open file
+        engine: str
+            The engine used to read the file, as returned by select_excel_engine
+        """
+        self.engine = engine
+        if engine == "openpyxl_read_only":
+            import openpyxl
+            self._workbook = openpyxl.load_workbook(file, read_only=True, data_only=True, keep_links=False)
+        else:
+            self._workbook = pd.ExcelFile(file, engine=engine)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        self._workbook.close()
+
+    def parse(self, sheet: str | int = 0, **load_params) -> pd.DataFrame:
+        """
+        Reads a sheet into a dataframe.
+        sheet: str | int
+            The name or index of the sheet
+        load_params:
+            Parameters for pandas.read_excel. The openpyxl_read_only engine only supports READ_ONLY_PARAMS.
+        Returns:
+            A dataframe
+        """
+        if self.engine != "openpyxl_read_only":
+            return self._workbook.parse(sheet, **load_params)
+        unsupported = set(load_params) - READ_ONLY_PARAMS
+        if unsupported:
+            raise ValueError(f"Parameters not supported by the openpyxl_read_only engine: {sorted(unsupported)}")
+        return self._parse_read_only(sheet, **load_params)
+
+    def _parse_read_only(self, sheet: str | int, header: int = 0, skiprows: int = None, nrows: int = None,
+                         usecols: Iterable[str] | Callable[[str], bool] = None) -> pd.DataFrame:
+        worksheet = self._workbook.worksheets[sheet] if isinstance(sheet, int) else self._workbook[sheet]
+        rows = itertools.islice(worksheet.iter_rows(values_only=True), (skiprows or 0) + header, None)
+        names = next(rows, None)
+        if names is None:
+            return pd.DataFrame()
+        if usecols is None:
+            selected = lambda name: True
+        elif callable(usecols):
+            selected = usecols
+        else:
+            selected = set(usecols).__contains__
+        keep = [i for i, name in enumerate(names) if name is not None and selected(name)]
+        data = []
+        for row in itertools.islice(rows, nrows):
+            values = [row[i] if i < len(row) else None for i in keep]
+            data.append(values)
+        # read-only worksheets often report formatted but empty rows at the end
+        while data and all(value is None for value in data[-1]):
+            data.pop()
+        return pd.DataFrame(data, columns=[names[i] for i in keep])
@@ -0,0 +1,82 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the executor is running and queueing as many jobs as allowed."""
+
+
+class JobExecutor():
+    """
+    Runs jobs on a bounded pool of threads or processes.
+    At most max_workers jobs run at the same time, and at most max_queue_depth more wait for a free worker.
+    Submitting beyond that raises QueueFullError instead of piling jobs up in memory.
+    """
+
+    def __init__(self, executor_type: str = "thread", max_workers: int = None, max_queue_depth: int = 100):
+        """
+        executor_type: str
+            'thread' to run jobs on a thread pool, 'process' to run them on a process pool.
+            Jobs and their arguments must be picklable when using processes.
+        max_workers: int
+            The maximum number of jobs running at the same time. Defaults to the number of CPUs.
+        max_queue_depth: int
+            The maximum number of jobs waiting for a free worker
+        """
+        if executor_type == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sheetdrop-worker")
+        elif executor_type == "process":
+            # spawn instead of fork, so workers don't inherit the web server's threads and DB connections
+            self._pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            raise ValueError(f"Executor type must be one of ['thread', 'process'], got {executor_type}")
+        self.max_workers = self._pool._max_workers
+        self.max_queue_depth = max_queue_depth
+        self._slots = threading.BoundedSemaphore(self.max_workers + max_queue_depth)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """The number of jobs running or waiting for a worker."""
+        return self._pending
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Submits a job to the pool.
+        fn: Callable
+            The function to run
+        *args, **kwargs:
+            The arguments to call fn with
+        Returns:
+            A future for the result of the job
+        Raises:
+            QueueFullError if the pool is busy and the queue is full
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(f"Too many files being processed ({self.max_workers} running, {self.max_queue_depth} queued). Please try again later.")
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._job_done)
+        return future
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stops accepting jobs and, if wait is True, waits for the submitted ones to finish."""
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _release(self) -> None:
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def _job_done(self, future: Future) -> None:
+        self._release()
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Job failed with an unexpected error: {future.exception()!r}")
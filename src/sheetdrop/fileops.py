@@ -1,14 +1,191 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
 import io
 import os
-import pandas as pd
-import pyarrow
-from pyarrow.fs import HadoopFileSystem
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
 from random import randint
-from sheetdrop.configuration import Configuration, MultipleSheetConfiguration
+from typing import IO, Any, Callable, Iterable, Iterator
+from sheetdrop.configuration import (Configuration, MultipleSheetConfiguration,
+                                     SheetConfiguration)
+from sheetdrop.excel import ExcelWorkbook, select_excel_engine
+from sheetdrop.lazy import lazy_import
+from sheetdrop.metrics import StageTimer, StageTiming
+
+pd = lazy_import("pandas")
+pyarrow = lazy_import("pyarrow")
+
+# Directory where uploads are kept until they are processed
+TEMP_DIR = "temp"
+
+# Size of the chunks read from an upload while it is streamed to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# save_params that turn a Parquet output into a directory of files written by write_parquet_dataset
+PARQUET_DATASET_PARAMS = ("partition_cols", "max_rows_per_file")
+# save_params for the Parquet writer, also accepted for single file outputs
+PARQUET_WRITE_PARAMS = ("row_group_size", "use_dictionary", "compression")
+# commit metadata where write_delta_table counts the writes to a table, to compact and vacuum every so many of them.
+# Vacuum doesn't commit when it has nothing to delete, so the history alone can't tell when it last ran
+DELTA_WRITE_COUNT = "sheetdrop.writes"
+
+
+class FileTooLargeError(ValueError):
+    """Raised when an upload exceeds the maximum size allowed by its configuration."""
+
+
+@dataclass(frozen=True)
+class StorageSettings():
+    """Connection settings of the storage provider. Must stay picklable, to reach worker processes."""
+    endpoint: str = None
+    region: str = None
+    access_key: str = None
+    secret_key: str = None
+    # seconds between health checks of a cached client, or None to never check
+    health_check_interval: float = None
+    # path probed by health checks; the root of the filesystem when not set
+    health_check_path: str = ""
+
+
+class StorageClients():
+    """
+    Builds the filesystem and client of each storage provider once per process, and shares them between threads.
+    pyarrow filesystems, gcsfs filesystems and boto3 sessions are safe to use from several threads at once.
+    A client is checked every health_check_interval seconds before it is handed out, and rebuilt if the check
+    fails. Clients are also rebuilt after invalidate(), which writers call when a write fails with an I/O error.
+    """
+
+    def __init__(self, settings: StorageSettings = None):
+        self._settings = settings or StorageSettings()
+        self._clients: dict[str, tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+        self._factories: dict[str, Callable[[StorageSettings], Any]] = {
+            "s3": _s3_filesystem,
+            "gcs": _gcs_filesystem,
+            "hdfs": _hdfs_filesystem,
+            "local": lambda settings: pyarrow.fs.LocalFileSystem(),
+            "boto3": _boto3_session,
+            "gcsfs": _gcsfs_filesystem,
+        }
+
+    @property
+    def settings(self) -> StorageSettings:
+        return self._settings
+
+    def configure(self, settings: StorageSettings) -> None:
+        """Uses new connection settings, dropping the clients built with the old ones. Does nothing if they didn't change."""
+        with self._lock:
+            if settings != self._settings:
+                self._settings = settings
+                self._clients.clear()
+
+    def get(self, name: str) -> Any:
+        """
+        Returns the client of a provider, building it on first use.
+        name: str
+            A provider ('s3', 'gcs', 'hdfs', 'local') for its pyarrow filesystem,
+            or 'boto3' for an AWS session, or 'gcsfs' for a gcsfs filesystem
+        """
+        factory = self._factories.get(name)
+        if not factory:
+            raise ValueError(f"Provider must be one of {list(self._factories.keys())}")
+        with self._lock:
+            client, checked_at = self._clients.get(name, (None, 0))
+            interval = self._settings.health_check_interval
+            if client is not None and interval is not None and time.monotonic() - checked_at >= interval:
+                if self._is_healthy(client):
+                    self._clients[name] = (client, time.monotonic())
+                else:
+                    client = None
+            if client is None:
+                # built under the lock, so concurrent writers don't open several connections
+                client = factory(self._settings)
+                self._clients[name] = (client, time.monotonic())
+            return client
+
+    def invalidate(self, name: str) -> None:
+        """Drops the client of a provider, so it is rebuilt by the next call to get."""
+        with self._lock:
+            self._clients.pop(name, None)
+
+    def clear(self) -> None:
+        """Drops every client."""
+        with self._lock:
+            self._clients.clear()
+
+    def _is_healthy(self, client: Any) -> bool:
+        if not isinstance(client, pyarrow.fs.FileSystem):
+            return True
+        try:
+            client.get_file_info(self._settings.health_check_path)
+            return True
+        except OSError:
+            return False
+
+    def storage_options(self, provider: str) -> dict[str, str] | None:
+        """The storage_options for deltalake that match the connection settings, or None if there are none."""
+        settings = self._settings
+        if provider != "s3":
+            return None
+        options = {
+            "AWS_ENDPOINT_URL": settings.endpoint,
+            "AWS_REGION": settings.region,
+            "AWS_ACCESS_KEY_ID": settings.access_key,
+            "AWS_SECRET_ACCESS_KEY": settings.secret_key,
+        }
+        options = {name: value for name, value in options.items() if value is not None}
+        if settings.endpoint and settings.endpoint.startswith("http://"):
+            options["AWS_ALLOW_HTTP"] = "true"
+        return options or None
+
+
+def _s3_filesystem(settings: StorageSettings) -> pyarrow.fs.S3FileSystem:
+    options = {
+        "endpoint_override": settings.endpoint,
+        "region": settings.region,
+        "access_key": settings.access_key,
+        "secret_key": settings.secret_key,
+    }
+    return pyarrow.fs.S3FileSystem(**{name: value for name, value in options.items() if value is not None})
+
+def _gcs_filesystem(settings: StorageSettings) -> pyarrow.fs.GcsFileSystem:
+    if settings.endpoint:
+        return pyarrow.fs.GcsFileSystem(endpoint_override=settings.endpoint)
+    return pyarrow.fs.GcsFileSystem()
+
+def _hdfs_filesystem(settings: StorageSettings) -> pyarrow.fs.HadoopFileSystem:
+    # the endpoint is the namenode, as host or host:port; "default" uses fs.defaultFS from the Hadoop configuration
+    host, port = settings.endpoint or "default", 0
+    if host.rsplit(":", 1)[-1].isdigit():
+        host, port = host.rsplit(":", 1)
+    return pyarrow.fs.HadoopFileSystem(host, int(port))
+
+def _boto3_session(settings: StorageSettings):
+    import awswrangler as wr
+    import boto3
+    if settings.endpoint:
+        # awswrangler takes the endpoint from its global configuration, not from the session
+        wr.config.s3_endpoint_url = settings.endpoint
+    return boto3.Session(aws_access_key_id=settings.access_key, aws_secret_access_key=settings.secret_key, region_name=settings.region)
+
+def _gcsfs_filesystem(settings: StorageSettings):
+    import gcsfs
+    if settings.endpoint:
+        return gcsfs.GCSFileSystem(endpoint_url=settings.endpoint)
+    return gcsfs.GCSFileSystem()
+
+
+# clients shared by every writer of this process
+storage_clients = StorageClients()
+
 
 # Basic I/O operations
 
-def convert_file_to_dataframe(file_id: str, config: Configuration, file_path: str) -> pd.DataFrame:
+def convert_file_to_dataframe(file_id: str, config: Configuration, file_path: str, nrows: int = None) -> pd.DataFrame:
     """
     Converts a file to a dataframe.
     file_id: str
@@ -17,22 +194,118 @@ def convert_file_to_dataframe(file_id: str, config: Configuration, file_path: st
         The configuration of the file to validate.
     file_path: str
         The path of the file to validate
+    nrows: int
+        The number of rows to read, or None to read the whole file. Not supported by custom loaders.
     Returns:
         A dataframe
     """
     readers = {
-        "excel": pd.read_excel,
+        "excel": read_excel_file,
         "csv": pd.read_csv,
     }
     reader = readers.get(config.load_type)
     if not reader and not callable(config.load_type):
         raise ValueError(f"Invalid load type for file {file_id}: {config.load_type}")
 
+    load_params = dict(config.load_params or {})
+    compiled_schema = config.compiled_schema
+    if reader and config.schema_columns_only and compiled_schema.usecols is not None:
+        load_params.setdefault("usecols", compiled_schema.usecols)
+    if config.load_type == "csv":
+        load_params.setdefault("dtype", compiled_schema.read_dtypes)
+    elif config.load_type == "excel":
+        load_params.setdefault("engine", config.excel_engine)
+    if nrows is not None:
+        load_params["nrows"] = nrows
+
     with open(file_path, "rb") as f:
         if reader:
-            return reader(f, **config.load_params)
+            return reader(f, **load_params)
         elif callable(config.load_type):
-            return config.load_type(f, **config.load_params)
+            return config.load_type(f, **load_params)
+
+def read_excel_file(file: IO[bytes], engine: str = "auto", sheet_name: str | int = 0, **load_params) -> pd.DataFrame:
+    """
+    Reads a single sheet of an Excel file with the engine picked by select_excel_engine.
+    file: IO[bytes]
+        The open file
+    engine: str
+        One of sheetdrop.excel.EXCEL_ENGINES
+    sheet_name: str | int
+        The name or index of the sheet to read
+    load_params:
+        Parameters for pandas.read_excel
+    Returns:
+        A dataframe
+    """
+    engine = select_excel_engine(file, engine, load_params)
+    if engine != "openpyxl_read_only":
+        return pd.read_excel(file, sheet_name=sheet_name, engine=engine, **load_params)
+    with ExcelWorkbook(file, engine) as workbook:
+        return workbook.parse(sheet_name, **load_params)
+
+
+def convert_file_to_table(file_id: str, config: Configuration, file_path: str, nrows: int = None) -> pyarrow.Table:
+    """
+    Converts a CSV file to a pyarrow Table with the multithreaded pyarrow.csv reader.
+    String columns declared in the schema are read as strings. Other columns are inferred, and coerced by the validation,
+    so a bad value is reported as a failure case instead of aborting the read.
+    file_id: str
+        The id of the file to validate
+    config: Configuration
+        The configuration of the file to validate. load_params may contain "read_options",
+        "parse_options" and "convert_options" dictionaries for the pyarrow.csv reader.
+    file_path: str
+        The path of the file to validate
+    nrows: int
+        The number of rows to read, or None to read the whole file. Only the blocks holding them are parsed.
+    Returns:
+        A pyarrow Table
+    """
+    if config.load_type != "csv":
+        raise ValueError(f"The arrow engine only supports CSV files, file {file_id} has load type {config.load_type}")
+    load_params = config.load_params or {}
+    column_types = config.compiled_schema.read_arrow_types
+    convert_options = {"column_types": column_types, **load_params.get("convert_options", {})}
+    options = {
+        "read_options": pyarrow.csv.ReadOptions(**load_params.get("read_options", {})),
+        "parse_options": pyarrow.csv.ParseOptions(**load_params.get("parse_options", {})),
+        "convert_options": pyarrow.csv.ConvertOptions(**convert_options),
+    }
+    if nrows is None:
+        return pyarrow.csv.read_csv(file_path, **options)
+    batches = []
+    with pyarrow.csv.open_csv(file_path, **options) as reader:
+        read = 0
+        for batch in reader:
+            batches.append(batch)
+            read += batch.num_rows
+            if read >= nrows:
+                break
+        return pyarrow.Table.from_batches(batches, reader.schema).slice(0, nrows)
+
+def iter_csv_chunks(file_id: str, config: Configuration, file_path: str) -> Iterator[pd.DataFrame]:
+    """
+    Reads a CSV file in chunks of config.chunk_size rows.
+    file_id: str
+        The id of the file to validate
+    config: Configuration
+        The configuration of the file to validate.
+    file_path: str
+        The path of the file to validate
+    Returns:
+        An iterator of dataframes. The index keeps counting across chunks, so it matches the row number in the file.
+    """
+    if config.load_type != "csv" or not config.chunk_size:
+        raise ValueError(f"Chunked reading is only supported for CSV files with a chunk_size, file {file_id}")
+    load_params = dict(config.load_params or {})
+    compiled_schema = config.compiled_schema
+    if config.schema_columns_only and compiled_schema.usecols is not None:
+        load_params.setdefault("usecols", compiled_schema.usecols)
+    load_params.setdefault("dtype", compiled_schema.read_dtypes)
+    with open(file_path, "rb") as f:
+        with pd.read_csv(f, chunksize=config.chunk_size, **load_params) as reader:
+            yield from reader
 
 def convert_file_to_dataframe_dict(file_id: str, config: MultipleSheetConfiguration, file_path: str) -> dict[str|int, pd.DataFrame]:
     """
@@ -46,10 +319,47 @@ def convert_file_to_dataframe_dict(file_id: str, config: MultipleSheetConfigurat
     Returns:
         A dictionary of dataframes
     """
-    load_params = config.load_params.copy() if config.load_params else {}
-    load_params["sheet_name"] = list(config.sheets.keys())
+    return {sheet_conf.sheet: dataframe for sheet_conf, dataframe in iter_excel_sheets(file_id, config, file_path)}
+
+def iter_excel_sheets(file_id: str, config: MultipleSheetConfiguration, file_path: str, nrows: int = None,
+                      on_error: Callable[[SheetConfiguration, Exception], None] = None) -> Iterator[tuple[SheetConfiguration, pd.DataFrame]]:
+    """
+    Reads the sheets of a file one at a time. The workbook is opened once, and each sheet is only parsed when the iterator gets to it.
+    file_id: str
+        The id of the file to validate
+    config: MultipleSheetConfiguration
+        The configuration of the file to validate.
+    file_path: str
+        The path of the file to validate
+    nrows: int
+        The number of rows to read from each sheet, or None to read them whole
+    on_error: Callable[[SheetConfiguration, Exception], None]
+        If set, called with the sheets that can't be parsed, e.g. missing ones, which are then skipped.
+        Otherwise their errors are raised. Errors opening the workbook are always raised.
+    Returns:
+        An iterator of (sheet configuration, dataframe) pairs, in the order of config.sheets
+    """
+    load_params = dict(config.load_params or {})
+    load_params.pop("sheet_name", None)
+    requested_engine = load_params.pop("engine", config.excel_engine)
+    if nrows is not None:
+        load_params["nrows"] = nrows
     with open(file_path, "rb") as f:
-        return pd.read_excel(f, **load_params)
+        engine = select_excel_engine(f, requested_engine, load_params)
+        with ExcelWorkbook(f, engine) as workbook:
+            for sheet_conf in config.sheets:
+                sheet_params = dict(load_params)
+                usecols = sheet_conf.compiled_schema.usecols
+                if config.schema_columns_only and usecols is not None:
+                    sheet_params.setdefault("usecols", usecols)
+                try:
+                    dataframe = workbook.parse(sheet_conf.sheet, **sheet_params)
+                except Exception as exc:
+                    if on_error is None:
+                        raise
+                    on_error(sheet_conf, exc)
+                    continue
+                yield sheet_conf, dataframe
 
 def store_temp_file(file_id: str, file: io.BytesIO) -> str:
     """
@@ -61,15 +371,73 @@ def store_temp_file(file_id: str, file: io.BytesIO) -> str:
     Returns:
         The path of the stored file
     """
-    temp_dir = "temp"
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-    
-    path = os.path.join(temp_dir, f"{file_id}_{randint(0, 1000000)}")
+    path = new_temp_path(file_id)
     with open(path, "wb") as f:
         f.write(file.getbuffer())
     return path
 
+async def stream_temp_file(file_id: str, file, max_size: int = None, chunk_size: int = UPLOAD_CHUNK_SIZE, hasher=None, timer: StageTimer = None) -> str:
+    """
+    Streams an upload to a temporary file, one chunk at a time.
+    file_id: str
+        The id of the file to store
+    file: UploadFile
+        The upload to store. Any object with an async read(size) method is accepted.
+    max_size: int
+        The maximum number of bytes accepted, or None for no limit
+    chunk_size: int
+        The number of bytes read from the upload at a time
+    hasher: hashlib hash object
+        If set, updated with every chunk, to hash the upload without reading it again
+    timer: StageTimer
+        If set, the writes to disk are timed as the store_temp_file stage
+    Returns:
+        The path of the stored file
+    Raises:
+        FileTooLargeError if the upload is larger than max_size. The partial file is removed.
+    """
+    path = new_temp_path(file_id)
+    written = 0
+    try:
+        with open(path, "wb") as f:
+            while chunk := await file.read(chunk_size):
+                written += len(chunk)
+                if max_size is not None and written > max_size:
+                    raise FileTooLargeError(f"File exceeds the maximum size of {max_size} bytes")
+                if hasher is not None:
+                    hasher.update(chunk)
+                with timer.stage("store_temp_file") if timer else nullcontext(StageTiming()) as timing:
+                    timing.bytes = len(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        delete_temp_file(path)
+        raise
+    return path
+
+def upload_hash(hasher, config: Configuration | MultipleSheetConfiguration) -> str:
+    """
+    Identifies an upload: the same bytes, loaded with the same version of the file definition, get the same hash.
+    hasher: hashlib hash object
+        The hash of the contents of the upload, e.g. as updated by stream_temp_file
+    config: Configuration | MultipleSheetConfiguration
+        The configuration of the file
+    Returns:
+        A hex digest
+    """
+    return hashlib.sha256(f"{hasher.hexdigest()}:{config.fingerprint}".encode()).hexdigest()
+
+def new_temp_path(file_id: str) -> str:
+    """
+    Returns a new path in the temporary directory, creating the directory if needed.
+    file_id: str
+        The id of the file to store
+    Returns:
+        The path for the new temporary file
+    """
+    if not os.path.exists(TEMP_DIR):
+        os.makedirs(TEMP_DIR)
+    return os.path.join(TEMP_DIR, f"{file_id}_{randint(0, 1000000)}")
+
 def delete_temp_file(path):
     """
     Deletes a file from the temporary directory.
@@ -96,10 +464,9 @@ def clear_temp_dir():
     """
     Clears the temporary directory.
     """
-    temp_dir = "temp"
-    if os.path.exists(temp_dir):
-        for f in os.listdir(temp_dir):
-            file_path = os.path.join(temp_dir, f)
+    if os.path.exists(TEMP_DIR):
+        for f in os.listdir(TEMP_DIR):
+            file_path = os.path.join(TEMP_DIR, f)
             try:
                 if os.path.isfile(file_path):
                     os.unlink(file_path)
@@ -116,30 +483,261 @@ def save_table_to_cloud(table: pyarrow.Table, provider: str, format: str, path:
     :param params: Additional parameters to pass to the saving function.
     """
     params = params or {}
-    filesystems = {
-        "s3": pyarrow.fs.S3FileSystem,
-        "gcs": pyarrow.fs.GcsFileSystem,
-        "hdfs": pyarrow.fs.HadoopFileSystem,
-        "local": pyarrow.fs.LocalFileSystem,
-    }
-    fs_class = filesystems.get(provider)
-    if not fs_class:
-        raise ValueError(f"Provider must be one of {list(filesystems.keys())}")
+    filesystem = get_filesystem(provider)
+
+    def parquet_writer(table, path, **kwargs):
+        if any(name in kwargs for name in PARQUET_DATASET_PARAMS):
+            write_parquet_dataset(table, path, **kwargs)
+            return
+        # the filesystem resolves the location, so drop the URI scheme
+        pyarrow.parquet.write_table(table, path.split("://", 1)[-1], **kwargs)
 
     def deltalake_writer(table, path, **kwargs):
-        from deltalake import write_deltalake
-        storage_options = kwargs.pop("storage_options", None)
-        write_deltalake(path, table, storage_options=storage_options, **kwargs)
+        # deltalake resolves the location from the URI and storage_options
+        kwargs.pop("filesystem", None)
+        storage_options = kwargs.pop("storage_options", None) or storage_clients.storage_options(provider)
+        write_delta_table(table, path, storage_options, **kwargs)
+
+    writers = {
+        "parquet": parquet_writer,
+        "deltalake": deltalake_writer,
+    }
+    writer = writers.get(format)
+    if not writer:
+        raise ValueError(f"Format must be one of {list(writers.keys())}")
+
+    try:
+        writer(table, path, filesystem=filesystem, **params)
+    except OSError:
+        # don't reuse a connection that may be broken
+        storage_clients.invalidate(provider)
+        raise
+
+def save_tables_to_cloud(tables: Iterable[pyarrow.Table], provider: str, format: str, path: str, params: dict = None):
+    """
+    Save a stream of pyarrow Tables as a single dataset, without holding more than one table in memory.
+    The output only becomes visible if every table is written. If the iterable raises, nothing is committed:
+    Parquet is written to a staging file that is moved into place at the end, and Delta Lake tables are
+    staged in the temp directory and written once the stream is exhausted.
+    :param tables: Iterable of PyArrow Tables with compatible schemas. Tables are cast to the schema of the first one.
+    :param provider: String indicating the destination ('s3', 'gcs', 'hdfs', 'local').
+    :param format: String indicating the format to save ('parquet', 'deltalake').
+    :param path: The path to save the file (bucket/folder for cloud, HDFS path, or local file path).
+    :param params: Additional parameters to pass to the writer (ParquetWriter, write_parquet_dataset or write_delta_table).
+    """
+    params = params or {}
+    filesystem = get_filesystem(provider)
+    tables = iter(tables)
+    first = next(tables, None)
+    if first is None:
+        raise ValueError("No data to save")
+    schema = first.schema
+
+    def aligned_tables():
+        yield first
+        for table in tables:
+            yield table if table.schema.equals(schema) else table.cast(schema)
+
+    def parquet_writer():
+        if any(name in params for name in PARQUET_DATASET_PARAMS):
+            return parquet_dataset_writer()
+        target = path.split("://", 1)[-1]
+        staging = f"{target}.{randint(0, 1000000)}.tmp"
+        writer_params = params.copy()
+        row_group_size = writer_params.pop("row_group_size", None)
+        try:
+            with pyarrow.parquet.ParquetWriter(staging, schema, filesystem=filesystem, **writer_params) as writer:
+                for table in aligned_tables():
+                    writer.write_table(table, row_group_size=row_group_size)
+            filesystem.move(staging, target)
+        except BaseException:
+            try:
+                filesystem.delete_file(staging)
+            except (FileNotFoundError, OSError):
+                pass
+            raise
+
+    def parquet_dataset_writer():
+        # a dataset spans many files that can't be moved into place at once,
+        # so stage the tables locally and only write the dataset once all of them are written
+        staging = new_temp_path("staging") + ".parquet"
+        try:
+            with pyarrow.parquet.ParquetWriter(staging, schema) as writer:
+                for table in aligned_tables():
+                    writer.write_table(table)
+            batches = pyarrow.parquet.ParquetFile(staging).iter_batches()
+            reader = pyarrow.RecordBatchReader.from_batches(schema, batches)
+            write_parquet_dataset(reader, path, filesystem=filesystem, **params)
+        finally:
+            delete_temp_file(staging)
+
+    def deltalake_writer():
+        delta_params = params.copy()
+        storage_options = delta_params.pop("storage_options", None) or storage_clients.storage_options(provider)
+        # deltalake can't abort cleanly when a stream fails halfway, so stage the tables
+        # in a local Parquet file and only stream them to the table once all of them are written
+        staging = new_temp_path("staging") + ".parquet"
+        try:
+            with pyarrow.parquet.ParquetWriter(staging, schema) as writer:
+                for table in aligned_tables():
+                    writer.write_table(table)
+            batches = pyarrow.parquet.ParquetFile(staging).iter_batches()
+            reader = pyarrow.RecordBatchReader.from_batches(schema, batches)
+            write_delta_table(reader, path, storage_options, **delta_params)
+        finally:
+            delete_temp_file(staging)
 
     writers = {
-        "parquet": pyarrow.parquet.write_table,
+        "parquet": parquet_writer,
         "deltalake": deltalake_writer,
     }
     writer = writers.get(format)
     if not writer:
         raise ValueError(f"Format must be one of {list(writers.keys())}")
+    try:
+        writer()
+    except OSError:
+        # don't reuse a connection that may be broken
+        storage_clients.invalidate(provider)
+        raise
 
-    writer(table, path, filesystem=fs_class(), **params)
+def write_parquet_dataset(data: pyarrow.Table | pyarrow.RecordBatchReader, path: str, filesystem: pyarrow.fs.FileSystem,
+                          partition_cols: list[str] = None, max_rows_per_file: int = None, row_group_size: int = None,
+                          use_dictionary: bool | list[str] = True, compression: str = "snappy", **kwargs):
+    """
+    Writes a Parquet dataset with pyarrow.dataset.write_dataset: a directory of files written in parallel,
+    split into Hive-style partitions (column=value directories) and into files of at most max_rows_per_file rows.
+    Whatever was already in the directory (or in the partitions written to) is replaced.
+    :param data: The table, or a reader streaming its batches.
+    :param path: The directory of the dataset.
+    :param filesystem: The filesystem of the directory.
+    :param partition_cols: Columns used to partition the dataset.
+    :param max_rows_per_file: Maximum number of rows in each file, or None for no limit.
+    :param row_group_size: Number of rows in each row group, or None for pyarrow's default.
+    :param use_dictionary: Whether to dictionary encode all columns, or a list of the columns to encode.
+    :param compression: The compression codec, one of configuration.PARQUET_COMPRESSIONS.
+    :param kwargs: Additional options for ParquetFileFormat.make_write_options.
+    """
+    file_options = pyarrow.dataset.ParquetFileFormat().make_write_options(
+        compression=None if compression.lower() == "none" else compression, use_dictionary=use_dictionary, **kwargs)
+    max_rows_per_group = row_group_size or 1024 * 1024
+    if max_rows_per_file:
+        max_rows_per_group = min(max_rows_per_group, max_rows_per_file)
+    pyarrow.dataset.write_dataset(
+        data,
+        path.split("://", 1)[-1],
+        format="parquet",
+        filesystem=filesystem,
+        file_options=file_options,
+        partitioning=partition_cols,
+        partitioning_flavor="hive" if partition_cols else None,
+        max_rows_per_file=max_rows_per_file or 0,
+        # buffer small batches (e.g. chunks of a CSV file) into full row groups
+        min_rows_per_group=max_rows_per_group if row_group_size else 0,
+        max_rows_per_group=max_rows_per_group,
+        existing_data_behavior="delete_matching",
+    )
+
+def write_delta_table(data: pd.DataFrame | pyarrow.Table | pyarrow.RecordBatchReader, path: str, storage_options: dict[str, str] = None,
+                      mode: str = "overwrite", predicate: str = None, merge_keys: list[str] = None,
+                      compact_every: int = None, vacuum_every: int = None, vacuum_retention_hours: float = None, **kwargs):
+    """
+    Writes data to a Delta Lake table, creating it if needed.
+    :param data: The data to write.
+    :param path: The URI of the table.
+    :param storage_options: Options for the storage backend of deltalake.
+    :param mode: 'overwrite' replaces the table, or only the rows matching predicate when it is set.
+        'append' adds the data to the table. 'merge' updates the rows with the same merge_keys and inserts the others.
+    :param predicate: With mode 'overwrite', a SQL condition (e.g. "date = '2024-01-01'") selecting the rows replaced.
+    :param merge_keys: With mode 'merge', the columns that identify a row.
+    :param compact_every: Compact small files after every this many writes, or None to never compact.
+    :param vacuum_every: Remove files no longer referenced by the table after every this many writes, or None to never vacuum.
+    :param vacuum_retention_hours: Age of the unreferenced files removed by vacuum. Defaults to the table's retention (7 days).
+    :param kwargs: Additional parameters to pass to write_deltalake.
+    """
+    from deltalake import CommitProperties, DeltaTable, write_deltalake
+    from deltalake.exceptions import TableNotFoundError
+
+    writes = None
+    if compact_every or vacuum_every:
+        # the writes are counted in their commits, where the next write finds the count
+        writes = _write_count(path, storage_options) + 1
+        commit_properties = kwargs.pop("commit_properties", None) or CommitProperties()
+        custom_metadata = {**(commit_properties.custom_metadata or {}), DELTA_WRITE_COUNT: str(writes)}
+        kwargs["commit_properties"] = CommitProperties(custom_metadata, commit_properties.max_commit_retries)
+
+    if mode == "merge":
+        try:
+            table = DeltaTable(path, storage_options=storage_options)
+        except TableNotFoundError:
+            write_deltalake(path, data, mode="append", storage_options=storage_options, **kwargs)
+        else:
+            # only the files holding matching keys are rewritten
+            table.merge(
+                data,
+                predicate=" AND ".join(f"target.{quote_identifier(key)} = source.{quote_identifier(key)}" for key in merge_keys),
+                source_alias="source",
+                target_alias="target",
+                commit_properties=kwargs.get("commit_properties"),
+            ).when_matched_update_all().when_not_matched_insert_all().execute()
+    elif predicate:
+        # replaceWhere: only the files holding matching rows are rewritten
+        write_deltalake(path, data, mode=mode, predicate=predicate, engine="rust", storage_options=storage_options, **kwargs)
+    else:
+        write_deltalake(path, data, mode=mode, storage_options=storage_options, **kwargs)
+
+    # merges that change nothing don't commit, and don't count as a write
+    if writes is not None and _write_count(path, storage_options) == writes:
+        table = DeltaTable(path, storage_options=storage_options)
+        if compact_every and writes % compact_every == 0:
+            table.optimize.compact()
+        if vacuum_every and writes % vacuum_every == 0:
+            if vacuum_retention_hours is None:
+                table.vacuum(dry_run=False)
+            else:
+                table.vacuum(retention_hours=vacuum_retention_hours, dry_run=False, enforce_retention_duration=False)
+
+def quote_identifier(name: str) -> str:
+    """Quotes a column name for a Delta Lake SQL expression, so names with spaces or capitals (e.g. Order Id) work."""
+    return '"' + name.replace('"', '""') + '"'
+
+def _write_count(path: str, storage_options: dict[str, str] = None) -> int:
+    """The number of writes to a Delta table recorded by write_delta_table, 0 for a new table."""
+    from deltalake import DeltaTable
+    from deltalake.exceptions import TableNotFoundError
+
+    try:
+        table = DeltaTable(path, storage_options=storage_options)
+    except TableNotFoundError:
+        return 0
+    # the latest write is followed by at most a compaction and the start and end of a vacuum
+    for commit in table.history(limit=4):
+        if DELTA_WRITE_COUNT in commit:
+            return int(commit[DELTA_WRITE_COUNT])
+    return 0
+
+def get_filesystem(provider: str) -> pyarrow.fs.FileSystem:
+    """
+    Returns the pyarrow filesystem of a storage provider, shared by every writer of the process.
+    :param provider: String indicating the destination ('s3', 'gcs', 'hdfs', 'local').
+    """
+    if provider not in ("s3", "gcs", "hdfs", "local"):
+        raise ValueError(f"Provider must be one of {['s3', 'gcs', 'hdfs', 'local']}")
+    return storage_clients.get(provider)
+
+def with_storage_client(name: str, write: Callable[[Any], None]) -> None:
+    """
+    Runs a write with a shared storage client. If it fails with an I/O error, the client is dropped,
+    so the next write reconnects instead of reusing a broken connection.
+    :param name: The name of the client, as in StorageClients.get.
+    :param write: Function that receives the client.
+    """
+    client = storage_clients.get(name)
+    try:
+        write(client)
+    except OSError:
+        storage_clients.invalidate(name)
+        raise
 
 def save_dataframe_to_cloud(df: pd.DataFrame, provider: str, format: str, path: str, params: dict = None):
     """
@@ -152,27 +750,27 @@ def save_dataframe_to_cloud(df: pd.DataFrame, provider: str, format: str, path:
     :param params: Additional parameters to pass to the saving function.
     """
     params = params or {}
+    if format == "parquet" and any(name in params for name in PARQUET_DATASET_PARAMS + PARQUET_WRITE_PARAMS):
+        # the layout options are applied the same way on every provider by the pyarrow writers
+        save_table_to_cloud(pyarrow.Table.from_pandas(df), provider, format, path, params)
+        return
     
     def s3_parquet_saver(df, path, **kwargs):
         import awswrangler as wr
-        wr.s3.to_parquet(df=df, path=path, **kwargs)
+        with_storage_client("boto3", lambda session: wr.s3.to_parquet(df=df, path=path, boto3_session=session, **kwargs))
 
     def gcs_parquet_saver(df, path, **kwargs):
-        import gcsfs
-        fs = gcsfs.GCSFileSystem()
-        df.to_parquet(path, engine='pyarrow', storage_options={"token": fs.credentials}, **kwargs)
+        with_storage_client("gcsfs", lambda fs: df.to_parquet(path, engine='pyarrow', filesystem=fs, **kwargs))
 
     def hdfs_parquet_saver(df, path, **kwargs):
-        fs = HadoopFileSystem()
-        df.to_parquet(path, engine='pyarrow', filesystem=fs, **kwargs)
+        with_storage_client("hdfs", lambda fs: df.to_parquet(path, engine='pyarrow', filesystem=fs, **kwargs))
         
     def local_parquet_saver(df, path, **kwargs):
         df.to_parquet(path, engine='pyarrow', **kwargs)
 
     def deltalake_saver(df, path, **kwargs):
-        from deltalake import write_deltalake
-        storage_options = kwargs.pop("storage_options", None)
-        write_deltalake(path, df, mode="overwrite", storage_options=storage_options, **kwargs)
+        storage_options = kwargs.pop("storage_options", None) or storage_clients.storage_options(provider)
+        write_delta_table(df, path, storage_options, **kwargs)
 
     savers = {
         "s3": {
@@ -0,0 +1,349 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from typing import Mapping
+
+from sqlalchemy import and_, case, exists, func, or_, select, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session, aliased
+
+from sheetdrop.configuration import Configuration, MultipleSheetConfiguration
+from sheetdrop.db import (add_file_status, notify_status_listeners,
+                          save_file_status, utcnow)
+from sheetdrop.dbmodels import FileLatestStatus, Job
+from sheetdrop.enums import JobState, Status
+from sheetdrop.executor import JobExecutor
+from sheetdrop.fileops import delete_temp_file
+from sheetdrop.metrics import metrics_registry
+from sheetdrop.pipeline import PipelineSettings, run_job
+
+
+def enqueue_job(engine: Engine | Connection, file_id: str, file_path: str, content_hash: str = None, supersede: bool = False,
+                stage_timings: dict[str, dict] = None) -> int:
+    """Add a job to the queue, and mark its file as in progress in the same transaction
+    Parameters:
+        engine: sqlalchemy.engine.Engine | sqlalchemy.engine.Connection
+            The engine for the database, or a connection to it
+        file_id: str
+            The ID of the file
+        file_path: str
+            The temporary path of the file to process. Must be visible to every worker.
+        content_hash: str
+            The hash of the upload (see fileops.upload_hash), if it is deduplicated. It is kept with the job,
+            which saves it with the final status of the file, where identical uploads find it.
+        supersede: bool
+            Whether the jobs of the file that are still queued are replaced by this one. Their temporary files are deleted.
+        stage_timings: dict[str, dict]
+            The timings of receiving the upload, saved with the in progress status of the file
+    Returns:
+        int
+            The ID of the new job
+    """
+    superseded_paths = []
+    with Session(engine, expire_on_commit=False) as session:
+        if supersede:
+            queued = session.execute(select(Job.job_id, Job.file_path).where(Job.file_id == file_id, Job.state == JobState.QUEUED.value)).all()
+            for job_id, path in queued:
+                # skip the jobs claimed by a worker in the meantime
+                result = session.execute(
+                    update(Job)
+                    .where(Job.job_id == job_id, Job.state == JobState.QUEUED.value)
+                    .values(state=JobState.SUPERSEDED.value)
+                )
+                if result.rowcount == 1:
+                    superseded_paths.append(path)
+        job = Job(file_id=file_id, file_path=file_path, state=JobState.QUEUED.value, attempts=0, content_hash=content_hash, created_at=utcnow())
+        session.add(job)
+        status = add_file_status(session, file_id, Status.IN_PROGRESS, stage_timings=stage_timings)
+        session.commit()
+    for path in superseded_paths:
+        delete_temp_file(path)
+    notify_status_listeners(status)
+    return job.job_id
+
+
+def find_active_job(engine: Engine | Connection, file_id: str, content_hash: str) -> int | None:
+    """Find a queued or running job for an identical upload of a file
+    Parameters:
+        engine: sqlalchemy.engine.Engine | sqlalchemy.engine.Connection
+            The engine for the database, or a connection to it
+        file_id: str
+            The ID of the file
+        content_hash: str
+            The hash of the upload (see fileops.upload_hash)
+    Returns:
+        int
+            The ID of the oldest such job, or None if there is none
+    """
+    with Session(engine) as session:
+        stmt = (select(Job.job_id)
+                .where(Job.file_id == file_id, Job.content_hash == content_hash,
+                       Job.state.in_([JobState.QUEUED.value, JobState.RUNNING.value]))
+                .order_by(Job.job_id)
+                .limit(1))
+        return session.scalar(stmt)
+
+
+def load_job_states(engine: Engine | Connection, job_ids: list[int]) -> dict[int, str]:
+    """Load the state of several jobs in a single query, e.g. for the status of a batch
+    Parameters:
+        engine: sqlalchemy.engine.Engine | sqlalchemy.engine.Connection
+            The engine for the database, or a connection to it
+        job_ids: list[int]
+            The IDs of the jobs
+    Returns:
+        dict[int, str]
+            The state of each job found, by job ID
+    """
+    if not job_ids:
+        return {}
+    with Session(engine) as session:
+        return dict(session.execute(select(Job.job_id, Job.state).where(Job.job_id.in_(job_ids))).all())
+
+
+def count_jobs(engine: Engine | Connection, state: JobState) -> int:
+    """Count the jobs in a given state
+    Parameters:
+        engine: sqlalchemy.engine.Engine | sqlalchemy.engine.Connection
+            The engine for the database, or a connection to it
+        state: JobState
+            The state of the jobs to count
+    Returns:
+        int
+            The number of jobs in that state
+    """
+    with Session(engine) as session:
+        return session.scalar(select(func.count()).select_from(Job).where(Job.state == state.value))
+
+
+def count_active_jobs(engine: Engine | Connection, file_id: str) -> tuple[int, int]:
+    """Count the queued jobs, in total and for a file, in a single query
+    Parameters:
+        engine: sqlalchemy.engine.Engine | sqlalchemy.engine.Connection
+            The engine for the database, or a connection to it
+        file_id: str
+            The ID of the file
+    Returns:
+        tuple[int, int]
+            The number of queued jobs, and how many of them are for the file
+    """
+    with Session(engine) as session:
+        stmt = (select(func.count(), func.coalesce(func.sum(case((Job.file_id == file_id, 1), else_=0)), 0))
+                .select_from(Job)
+                .where(Job.state == JobState.QUEUED.value))
+        total, for_file = session.execute(stmt).one()
+        return total, for_file
+
+
+def claim_job(engine: Engine, worker_id: str, lease_seconds: int) -> Job | None:
+    """Claim the oldest queued job, or a running job whose worker stopped renewing its lease.
+    Jobs of a file that already has a job running, even one whose lease expired, are left for later, so uploads of the
+    same file never run at the same time. Claims of jobs of the same file are serialized on the latest status of the file
+    Parameters:
+        engine: sqlalchemy.engine.Engine
+            The engine for the database
+        worker_id: str
+            The ID of the worker claiming the job
+        lease_seconds: int
+            How long the job belongs to the worker before other workers can claim it again
+    Returns:
+        Job
+            The claimed job, or None if there is nothing to do
+    """
+    now = utcnow()
+    running = aliased(Job)
+    file_busy = exists().where(
+        running.file_id == Job.file_id,
+        running.job_id != Job.job_id,
+        running.state == JobState.RUNNING.value,
+    )
+    claimable = and_(
+        or_(
+            Job.state == JobState.QUEUED.value,
+            and_(Job.state == JobState.RUNNING.value, Job.lease_expires_at < now),
+        ),
+        ~file_busy,
+    )
+    with Session(engine, expire_on_commit=False) as session:
+        # another worker may claim the same row between the select and the update
+        # (SKIP LOCKED prevents it where supported), so retry a few times
+        for _ in range(5):
+            stmt = select(Job).where(claimable).order_by(Job.job_id).limit(1).with_for_update(skip_locked=True)
+            job = session.scalars(stmt).first()
+            if job is None:
+                return None
+            # two workers could both find no running job of the file, and start two of its jobs. Instead, the second one
+            # waits here until the first one commits, and its update below sees the job started by the first one
+            session.execute(select(FileLatestStatus.file_id).where(FileLatestStatus.file_id == job.file_id).with_for_update())
+            result = session.execute(
+                update(Job)
+                .where(Job.job_id == job.job_id, claimable)
+                .values(state=JobState.RUNNING.value, worker_id=worker_id, attempts=Job.attempts + 1,
+                        lease_expires_at=now + timedelta(seconds=lease_seconds))
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                session.refresh(job)
+                session.commit()
+                return job
+            session.rollback()
+    return None
+
+
+def renew_leases(engine: Engine, worker_id: str, job_ids: list[int], lease_seconds: int) -> None:
+    """Extend the lease of the jobs a worker is still running
+    Parameters:
+        engine: sqlalchemy.engine.Engine
+            The engine for the database
+        worker_id: str
+            The ID of the worker running the jobs
+        job_ids: list[int]
+            The IDs of the jobs
+        lease_seconds: int
+            How long the jobs belong to the worker from now on
+    """
+    if not job_ids:
+        return
+    with Session(engine) as session:
+        session.execute(
+            update(Job)
+            .where(Job.job_id.in_(job_ids), Job.worker_id == worker_id, Job.state == JobState.RUNNING.value)
+            .values(lease_expires_at=utcnow() + timedelta(seconds=lease_seconds))
+        )
+        session.commit()
+
+
+def finish_job(engine: Engine, worker_id: str, job_id: int, state: JobState) -> None:
+    """Mark a job as finished, unless another worker took it over in the meantime
+    Parameters:
+        engine: sqlalchemy.engine.Engine
+            The engine for the database
+        worker_id: str
+            The ID of the worker that ran the job
+        job_id: int
+            The ID of the job
+        state: JobState
+            JobState.DONE or JobState.FAILED
+    """
+    with Session(engine) as session:
+        session.execute(
+            update(Job)
+            .where(Job.job_id == job_id, Job.worker_id == worker_id)
+            .values(state=state.value, lease_expires_at=None)
+        )
+        session.commit()
+
+
+class JobWorker():
+    """
+    Claims jobs from the job table and runs them on a JobExecutor.
+    Several workers, in the web application or in separate processes, can share the same database.
+    Leases of running jobs are renewed periodically, so jobs of a worker that dies are picked up by another one.
+    """
+
+    def __init__(self, engine: Engine, executor: JobExecutor, configurations: Mapping[str, Configuration | MultipleSheetConfiguration],
+                 database_url: str, settings: PipelineSettings, poll_interval: float = 1.0, lease_seconds: int = 60, max_attempts: int = 3):
+        """
+        engine: sqlalchemy.engine.Engine
+            The engine for the utility database
+        executor: JobExecutor
+            The pool where jobs run. The worker only claims jobs when the pool has an idle worker.
+        configurations: Mapping[str, Configuration | MultipleSheetConfiguration]
+            The file definitions, by file_id
+        database_url: str
+            The URL of the utility database, passed to the jobs
+        settings: PipelineSettings
+            The settings passed to the jobs
+        poll_interval: float
+            Seconds between checks for new jobs when idle
+        lease_seconds: int
+            How long a claimed job belongs to this worker without a renewal
+        max_attempts: int
+            How many times a job is claimed before it is marked as failed
+        """
+        self.engine = engine
+        self.executor = executor
+        self.configurations = configurations
+        self.database_url = database_url
+        self.settings = settings
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self._running: dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Runs the worker loop in a background thread."""
+        self._thread = threading.Thread(target=self.run, name="sheetdrop-job-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops claiming new jobs. Jobs already running are left to the executor."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def notify(self) -> None:
+        """Wakes the worker up, e.g. after a job was queued."""
+        self._wakeup.set()
+
+    def run(self) -> None:
+        """Claims and submits jobs until stop is called."""
+        last_renewal = time.monotonic()
+        while not self._stopping.is_set():
+            if time.monotonic() - last_renewal >= self.lease_seconds / 3:
+                with self._lock:
+                    job_ids = list(self._running)
+                renew_leases(self.engine, self.worker_id, job_ids, self.lease_seconds)
+                last_renewal = time.monotonic()
+            try:
+                claimed = len(self._running) < self.executor.max_workers and self._claim_next()
+            except Exception as exc:
+                print(f"Failed to claim a job: {exc!r}")
+                claimed = False
+            if not claimed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _claim_next(self) -> bool:
+        job = claim_job(self.engine, self.worker_id, self.lease_seconds)
+        if job is None:
+            return False
+        file_conf = self.configurations.get(job.file_id)
+        if job.attempts > self.max_attempts:
+            finish_job(self.engine, self.worker_id, job.job_id, JobState.FAILED)
+            save_file_status(self.engine, job.file_id, Status.FAILED, [f"Processing was interrupted {self.max_attempts} times, giving up"])
+            delete_temp_file(job.file_path)
+        elif file_conf is None:
+            finish_job(self.engine, self.worker_id, job.job_id, JobState.FAILED)
+            save_file_status(self.engine, job.file_id, Status.FAILED, ["File ID not found"])
+            delete_temp_file(job.file_path)
+        else:
+            # includes earlier attempts of the job, if it was interrupted
+            queue_wait = (utcnow() - job.created_at).total_seconds()
+            with self._lock:
+                future = self.executor.submit(run_job, self.database_url, self.settings, job.file_id, file_conf, job.file_path, queue_wait,
+                                              job.content_hash)
+                self._running[job.job_id] = future
+            future.add_done_callback(lambda future, job_id=job.job_id, file_id=job.file_id: self._job_done(job_id, file_id, future))
+        return True
+
+    def _job_done(self, job_id: int, file_id: str, future: Future) -> None:
+        with self._lock:
+            self._running.pop(job_id, None)
+        failed = future.cancelled() or future.exception() is not None
+        finish_job(self.engine, self.worker_id, job_id, JobState.FAILED if failed else JobState.DONE)
+        # jobs may run on other processes, so their timings are recorded here, where metrics are served
+        if failed:
+            metrics_registry.inc("sheetdrop_files_processed_total", {"file_id": file_id, "outcome": Status.FAILED.value})
+        else:
+            metrics_registry.record(future.result(), "sheetdrop_files_processed_total")
+        self._wakeup.set()
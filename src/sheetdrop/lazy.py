@@ -0,0 +1,50 @@
+import importlib
+import importlib.util
+import sys
+import types
+
+# modules that take seconds to import, and are only needed once a file is processed
+HEAVY_MODULES = ("pandas", "pandera", "pyarrow", "numpy")
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stands in for a module until one of its attributes is used, then imports it.
+    Attributes are looked up in the real module every time rather than copied, so patching the module
+    (e.g. unittest.mock.patch("pandas.read_csv")) is seen through the proxy.
+    """
+
+    def __getattr__(self, name: str):
+        module = sys.modules.get(self.__name__) or importlib.import_module(self.__name__)
+        try:
+            return getattr(module, name)
+        except AttributeError:
+            # submodules that aren't imported by their package, e.g. pyarrow.parquet
+            try:
+                return importlib.import_module(f"{self.__name__}.{name}")
+            except ModuleNotFoundError:
+                raise AttributeError(f"module '{self.__name__}' has no attribute '{name}'") from None
+
+    def __dir__(self):
+        return dir(importlib.import_module(self.__name__))
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Returns a module that is only imported when it is first used, to keep startup fast.
+    A proxy is returned even if the module was already imported, so that its submodules (e.g. pyarrow.csv) are still
+    imported on first use: importing a package doesn't import all of its submodules.
+    name: str
+        The name of the module, e.g. pandas or pyarrow.compute
+    Raises:
+        ModuleNotFoundError if the package isn't installed, right away rather than on first use
+    """
+    package = name.split(".", 1)[0]
+    if package not in sys.modules and importlib.util.find_spec(package) is None:
+        raise ModuleNotFoundError(f"No module named '{package}'", name=package)
+    return LazyModule(name)
+
+
+def heavy_modules_loaded() -> list[str]:
+    """Returns the modules of HEAVY_MODULES imported so far, e.g. to check that startup didn't load them."""
+    return [name for name in HEAVY_MODULES if name in sys.modules]
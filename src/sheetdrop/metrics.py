@@ -0,0 +1,267 @@
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Iterable, Iterator
+
+# upper bounds of the buckets of duration histograms, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# content type of the Prometheus text exposition format
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# the metrics kept by MetricsRegistry: name -> (type, help)
+METRICS = {
+    "sheetdrop_stage_duration_seconds": ("histogram", "Seconds spent in each stage of an upload, without the stages nested in it"),
+    "sheetdrop_stage_rows_total": ("counter", "Rows processed by each stage"),
+    "sheetdrop_stage_bytes_total": ("counter", "Bytes processed by each stage"),
+    "sheetdrop_stage_peak_memory_bytes": ("gauge", "Peak resident memory of the process when each stage last finished"),
+    "sheetdrop_uploads_total": ("counter", "Uploads received by this process, by outcome"),
+    "sheetdrop_files_processed_total": ("counter", "Files processed by the workers of this process, by final status"),
+}
+
+# time spent in nested stages, for each stage open in the current thread or task, innermost last
+_open_stages: ContextVar[tuple[list[float], ...]] = ContextVar("sheetdrop_open_stages", default=())
+
+# set by enable_tracing
+_tracer = None
+
+
+def peak_memory() -> int:
+    """The peak resident memory of this process so far, in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS, and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def enable_tracing() -> None:
+    """
+    Sends a span for every stage to OpenTelemetry, through the tracer provider set up with its SDK
+    (e.g. by running under opentelemetry-instrument). Requires the opentelemetry-api package.
+    """
+    global _tracer
+    from opentelemetry import trace
+    _tracer = trace.get_tracer("sheetdrop")
+
+
+@dataclass
+class StageTiming():
+    """What a stage of an upload took. Stages that run more than once, e.g. for each chunk or sheet, are added up."""
+    seconds: float = 0.0
+    rows: int = 0
+    bytes: int = 0
+    # peak resident memory of the process when the stage finished, in bytes
+    peak_memory: int = 0
+
+
+class StageTimer():
+    """
+    Times the stages of one upload: receiving it, parsing, validation, the storage write, status updates.
+    Time spent in a stage nested in another one only counts for the inner stage. Stages can run on several threads at
+    once, e.g. for the sheets of a file, so their time is added up and may exceed the wall time.
+    Picklable, so the timings of a job can be sent back from a worker process.
+    """
+
+    def __init__(self, file_id: str, content_hash: str = None):
+        """
+        file_id: str
+            The id of the file being uploaded
+        content_hash: str
+            The hash of the upload, if it is deduplicated (see fileops.upload_hash). Saved with its final status only,
+            so a later identical upload can reuse that result.
+        """
+        self.file_id = file_id
+        self.content_hash = content_hash
+        self.stages: dict[str, StageTiming] = {}
+        # the final status of the upload, set by whoever saves it
+        self.outcome: str = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"file_id": self.file_id, "content_hash": self.content_hash, "stages": self.stages, "outcome": self.outcome}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageTiming]:
+        """
+        Times the code in the block as a stage. Set rows and bytes on the StageTiming it yields to count them.
+        name: str
+            The name of the stage
+        """
+        timing = StageTiming()
+        nested = [0.0]
+        token = _open_stages.set(_open_stages.get() + (nested,))
+        span = _tracer.start_as_current_span(f"sheetdrop.{name}", attributes={"sheetdrop.file_id": self.file_id}) if _tracer else nullcontext()
+        start = time.perf_counter()
+        try:
+            with span:
+                yield timing
+        finally:
+            elapsed = time.perf_counter() - start
+            _open_stages.reset(token)
+            parents = _open_stages.get()
+            if parents:
+                parents[-1][0] += elapsed
+            timing.seconds = elapsed - nested[0]
+            timing.peak_memory = peak_memory()
+            self.add(name, timing)
+
+    def iterate(self, name: str, items: Iterable, rows: Callable[[Any], int] = len) -> Iterator:
+        """
+        Times the production of each item of an iterable as a stage, e.g. reading the chunks of a file.
+        name: str
+            The name of the stage
+        items: Iterable
+            The items
+        rows: Callable
+            Returns the number of rows of an item
+        """
+        items = iter(items)
+        while True:
+            with self.stage(name) as timing:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                timing.rows = rows(item)
+            yield item
+
+    def add(self, name: str, timing: StageTiming) -> None:
+        """Adds a timing measured elsewhere to a stage, e.g. the time a job waited in the queue."""
+        with self._lock:
+            total = self.stages.setdefault(name, StageTiming())
+            total.seconds += timing.seconds
+            total.rows += timing.rows
+            total.bytes += timing.bytes
+            total.peak_memory = max(total.peak_memory, timing.peak_memory)
+
+    def as_dict(self) -> dict[str, dict[str, float | int]]:
+        """The timing of each stage, as saved with the status of the file."""
+        with self._lock:
+            return {name: asdict(timing) for name, timing in self.stages.items()}
+
+
+class MetricsRegistry():
+    """
+    Counters, gauges and histograms labelled by file_id, stage and outcome, rendered in the Prometheus text format.
+    Labels only take values from the file definitions and the pipeline, so the number of series stays bounded.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DURATION_BUCKETS):
+        """
+        buckets: tuple[float, ...]
+            The upper bounds of the buckets of histograms
+        """
+        self.buckets = buckets
+        # name -> labels -> value, or [bucket counts..., sum, count] for histograms
+        self._values: dict[str, dict[tuple[tuple[str, str], ...], Any]] = {name: {} for name in METRICS}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, labels: dict[str, str], value: float = 1) -> None:
+        """Adds a value to a counter."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[name][key] = self._values[name].get(key, 0) + value
+
+    def set(self, name: str, labels: dict[str, str], value: float) -> None:
+        """Sets the value of a gauge."""
+        with self._lock:
+            self._values[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, labels: dict[str, str], value: float) -> None:
+        """Adds an observation to a histogram."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = self._values[name].setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def record(self, timer: StageTimer, counter: str) -> None:
+        """
+        Records the stages of an upload, and counts its outcome.
+        timer: StageTimer
+            The timings of the upload
+        counter: str
+            The counter of outcomes, sheetdrop_uploads_total or sheetdrop_files_processed_total
+        """
+        for name, timing in timer.as_dict().items():
+            labels = {"file_id": timer.file_id, "stage": name}
+            self.observe("sheetdrop_stage_duration_seconds", labels, timing["seconds"])
+            self.inc("sheetdrop_stage_rows_total", labels, timing["rows"])
+            self.inc("sheetdrop_stage_bytes_total", labels, timing["bytes"])
+            self.set("sheetdrop_stage_peak_memory_bytes", labels, timing["peak_memory"])
+        if timer.outcome:
+            self.inc(counter, {"file_id": timer.file_id, "outcome": timer.outcome})
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, (kind, help) in METRICS.items():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in self._values[name].items():
+                    if kind != "histogram":
+                        lines.append(f"{name}{format_labels(key)} {value}")
+                        continue
+                    for bound, count in zip(self.buckets, value):
+                        lines.append(f"{name}_bucket{format_labels(key + (('le', f'{bound:g}'),))} {count}")
+                    lines.append(f"{name}_bucket{format_labels(key + (('le', '+Inf'),))} {value[-1]}")
+                    lines.append(f"{name}_sum{format_labels(key)} {value[-2]}")
+                    lines.append(f"{name}_count{format_labels(key)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    """Formats labels as in the Prometheus text format, escaping their values."""
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def serve_metrics(port: int, registry: "MetricsRegistry" = None) -> ThreadingHTTPServer:
+    """
+    Serves the metrics of a process without a web application, e.g. a standalone worker, on a background thread.
+    port: int
+        The port, on every interface
+    registry: MetricsRegistry
+        The metrics served, metrics_registry by default
+    Returns:
+        The server, to shut it down
+    """
+    registry = registry or metrics_registry
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # scrapes would flood the worker's output
+            pass
+
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="sheetdrop-metrics", daemon=True).start()
+    return server
+
+
+# the metrics of this process, served by /metrics
+metrics_registry = MetricsRegistry()
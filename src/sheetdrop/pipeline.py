@@ -0,0 +1,378 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from sqlalchemy.engine import Engine
+
+from sheetdrop.configuration import (Configuration, MultipleSheetConfiguration,
+                                     SheetConfiguration)
+from sheetdrop.db import create_engine, save_file_status
+from sheetdrop.enums import Status
+from sheetdrop.fileops import (convert_file_to_dataframe,
+                               convert_file_to_table, delete_temp_file,
+                               iter_csv_chunks, iter_excel_sheets,
+                               save_dataframe_to_cloud, save_table_to_cloud,
+                               save_tables_to_cloud, storage_clients,
+                               StorageSettings)
+from sheetdrop.lazy import lazy_import
+from sheetdrop.metrics import StageTimer, StageTiming, enable_tracing
+from sheetdrop.reports import (failure_report_path, summarize_failure_cases,
+                               write_failure_report)
+
+pd = lazy_import("pandas")
+pdr = lazy_import("pandera")
+pyarrow = lazy_import("pyarrow")
+
+# engines created by run_job, one per database URL and process
+_engines: dict[str, Engine] = {}
+
+
+@dataclass
+class PipelineSettings():
+    """Application settings used while processing files. Must stay picklable, to reach worker processes."""
+    provider: str
+    sheet_workers: int = 4
+    failure_samples: int = 5
+    storage: StorageSettings = field(default_factory=StorageSettings)
+    # send a span for every stage to OpenTelemetry
+    tracing: bool = False
+
+
+class ChunkValidationError(Exception):
+    """Raised after the last chunk of a file when any of its chunks failed validation."""
+
+    def __init__(self, failure_cases: pd.DataFrame):
+        super().__init__(f"{len(failure_cases)} failure cases found")
+        self.failure_cases = failure_cases
+
+
+def run_job(database_url: str, settings: PipelineSettings, file_id: str, file_conf: Configuration | MultipleSheetConfiguration, file_path: str,
+            queue_wait: float = None, content_hash: str = None) -> StageTimer:
+    """
+    Entry point for jobs submitted to a JobExecutor.
+    Receives only picklable arguments, so it can run both on threads and on worker processes.
+    database_url: str
+        The URL of the utility database
+    settings: PipelineSettings
+        The settings used to process the file
+    file_id: str
+        The id of the file to validate
+    file_conf: Configuration | MultipleSheetConfiguration
+        The configuration of the file to validate
+    file_path: str
+        The temporary path of file to validate
+    queue_wait: float
+        Seconds the job waited in the queue, recorded as a stage
+    content_hash: str
+        The hash of the upload, if it is deduplicated, saved with the final status of the file
+    Returns:
+        The timings of the stages of the file, to be recorded by the process that submitted the job
+    """
+    engine = _engines.get(database_url)
+    if engine is None:
+        engine = _engines.setdefault(database_url, create_engine(database_url))
+    # storage clients are shared by the jobs of a process, and only rebuilt if the settings change
+    storage_clients.configure(settings.storage)
+    if settings.tracing:
+        enable_tracing()
+    timer = StageTimer(file_id, content_hash)
+    if queue_wait is not None:
+        timer.add("queue_wait", StageTiming(seconds=queue_wait))
+    return process_file(engine, settings, file_id, file_conf, file_path, timer)
+
+
+def process_file(engine: Engine, settings: PipelineSettings, file_id: str, file_conf: Configuration | MultipleSheetConfiguration, file_path: str,
+                 timer: StageTimer = None) -> StageTimer:
+    """
+    Validates and stores a file.
+    engine: sqlalchemy.engine.Engine
+        The engine for the utility database
+    settings: PipelineSettings
+        The settings used to process the file
+    file_id: str
+        The id of the file to validate
+    file_conf: Configuration | MultipleSheetConfiguration
+        The configuration of the file to validate
+    file_path: str
+        The temporary path of file to validate
+    timer: StageTimer
+        Where the stages of the file are timed, a new one if not set
+    Returns:
+        The timer, with the final status of the file as its outcome. The timings are also saved with that status.
+    """
+    timer = timer or StageTimer(file_id)
+    try:
+        if isinstance(file_conf, MultipleSheetConfiguration):
+            process_file_multiple_sheets(engine, settings, file_id, file_path, file_conf, timer)
+        elif file_conf.engine == "arrow":
+            with timer.stage("load") as timing:
+                table = convert_file_to_table(file_id, file_conf, file_path)
+                timing.rows, timing.bytes = table.num_rows, os.path.getsize(file_path)
+            validate_and_save_table(engine, settings, file_id, table, file_conf, timer)
+        elif file_conf.chunk_size:
+            timer.add("load", StageTiming(bytes=os.path.getsize(file_path)))
+            chunks = timer.iterate("load", iter_csv_chunks(file_id, file_conf, file_path))
+            validate_and_save_chunks(engine, settings, file_id, chunks, file_conf, timer)
+        else:
+            with timer.stage("load") as timing:
+                dataframe = convert_file_to_dataframe(file_id, file_conf, file_path)
+                timing.rows, timing.bytes = len(dataframe), os.path.getsize(file_path)
+            validate_and_save_dataframe(engine, settings, file_id, dataframe, file_conf, timer)
+    except Exception as exc:
+        # don't leave the file in progress forever if loading fails
+        save_timed_status(engine, timer, file_id, Status.FAILED, [str(exc)])
+        raise
+    finally:
+        delete_temp_file(file_path)
+    return timer
+
+
+def process_file_multiple_sheets(engine: Engine, settings: PipelineSettings, file_id: str, file_path: str, file_conf: MultipleSheetConfiguration,
+                                 timer: StageTimer) -> None:
+    """
+    Validates and stores the sheets of a file in parallel, each with its own schema and save location.
+    Sheets are parsed one after the other from a single workbook, and each one is handed to the pool as soon as it is read.
+    A sheet that can't be read, or fails unexpectedly, only fails itself: the other sheets are still validated and saved.
+    The file succeeds if every sheet does, fails if none does, and partially succeeds otherwise.
+    """
+    results: dict[str, tuple[list[str], pd.DataFrame | None]] = {}
+
+    def sheet_not_read(sheet_conf: SheetConfiguration, exc: Exception) -> None:
+        results[sheet_conf.sheet] = ([f"The sheet could not be read: {exc}"], None)
+
+    with ThreadPoolExecutor(max_workers=settings.sheet_workers, thread_name_prefix=f"sheetdrop-{file_id}") as pool:
+        futures = {}
+        timer.add("load", StageTiming(bytes=os.path.getsize(file_path)))
+        sheets = timer.iterate("load", iter_excel_sheets(file_id, file_conf, file_path, on_error=sheet_not_read), rows=lambda item: len(item[1]))
+        for sheet_conf, dataframe in sheets:
+            futures[sheet_conf.sheet] = pool.submit(validate_and_save_sheet, settings, sheet_conf, dataframe, timer)
+        # only the pool keeps the sheets from here on
+        dataframe = None
+    for sheet, future in futures.items():
+        try:
+            results[sheet] = future.result()
+        except Exception as exc:
+            results[sheet] = ([f"Unexpected error: {exc!r}"], None)
+    # details in the order of the configuration, whatever the order the sheets finished in
+    results = {sheet_conf.sheet: results[sheet_conf.sheet] for sheet_conf in file_conf.sheets if sheet_conf.sheet in results}
+
+    details = []
+    failures = []
+    for sheet, (errors, failure_cases) in results.items():
+        details.append(f"{sheet}: {Status.FAILED.value if errors else Status.SUCCESS.value}")
+        details.extend(f"{sheet}: {error}" for error in errors)
+        if failure_cases is not None:
+            failures.append(failure_cases.assign(sheet=str(sheet)))
+    report_path = None
+    if failures:
+        report_path = failure_report_path(file_id)
+        with timer.stage("report"):
+            write_failure_report(pd.concat(failures, ignore_index=True), report_path)
+    failed_sheets = sum(1 for errors, _ in results.values() if errors)
+    if failed_sheets == len(results):
+        save_timed_status(engine, timer, file_id, Status.FAILED, details, report_path)
+    elif failed_sheets:
+        save_timed_status(engine, timer, file_id, Status.PARTIAL_SUCCESS, details, report_path)
+    else:
+        save_timed_status(engine, timer, file_id, Status.SUCCESS, details)
+
+
+def validate_and_save_sheet(settings: PipelineSettings, sheet_conf: SheetConfiguration, dataframe: pd.DataFrame, timer: StageTimer) -> tuple[list[str], pd.DataFrame | None]:
+    """
+    Validates and saves one sheet of a file.
+    Returns the errors found, or an empty list if the sheet was saved, and the failure cases found by pandera, if any.
+    """
+    try:
+        with timer.stage("validate") as timing:
+            timing.rows = len(dataframe)
+            failure_cases = validate_dataframe(dataframe, sheet_conf)
+        if failure_cases is not None:
+            return summarize_failure_cases(failure_cases, settings.failure_samples), failure_cases
+        with timer.stage("save") as timing:
+            timing.rows = len(dataframe)
+            save_dataframe_to_cloud(dataframe, settings.provider, sheet_conf.save_type, sheet_conf.save_location, sheet_conf.save_params)
+        return [], None
+    except (pyarrow.lib.ArrowInvalid, ValueError) as exc:
+        return [str(exc)], None
+
+
+def validate_and_save_dataframe(engine: Engine, settings: PipelineSettings, file_id: str, dataframe: pd.DataFrame, file_conf: Configuration, timer: StageTimer) -> None:
+    """Validates and saves a dataframe."""
+    try:
+        with timer.stage("validate") as timing:
+            timing.rows = len(dataframe)
+            failure_cases = validate_dataframe(dataframe, file_conf)
+        if failure_cases is not None:
+            save_failure_cases(engine, settings, file_id, failure_cases, timer)
+            return
+        save_timed_status(engine, timer, file_id, Status.SAVING)
+        # save dataframe to appropriate location
+        with timer.stage("save") as timing:
+            timing.rows = len(dataframe)
+            save_dataframe_to_cloud(dataframe, settings.provider, file_conf.save_type, file_conf.save_location, file_conf.save_params)
+        save_timed_status(engine, timer, file_id, Status.SUCCESS)
+    except (pyarrow.lib.ArrowInvalid, ValueError) as exc:
+        save_timed_status(engine, timer, file_id, Status.FAILED, [str(exc)])
+
+
+def validate_and_save_table(engine: Engine, settings: PipelineSettings, file_id: str, table: pyarrow.Table, file_conf: Configuration, timer: StageTimer) -> None:
+    """
+    Validates a pyarrow Table and saves it without converting it back from pandas.
+    Checks run on a pandas view of the table, which shares memory with it where the types allow.
+    Only the columns whose type was coerced by the validation are converted back, so they are saved as coerced.
+    """
+    try:
+        with timer.stage("validate") as timing:
+            timing.rows = table.num_rows
+            dataframe = table.to_pandas(split_blocks=True)
+            read_dtypes = dataframe.dtypes.to_dict()
+            failure_cases = validate_dataframe(dataframe, file_conf)
+            if failure_cases is None:
+                for name in dataframe.columns:
+                    if dataframe[name].dtype != read_dtypes[name]:
+                        coerced = pyarrow.Array.from_pandas(dataframe[name])
+                        table = table.set_column(table.schema.get_field_index(name), name, coerced)
+            del dataframe
+        if failure_cases is not None:
+            save_failure_cases(engine, settings, file_id, failure_cases, timer)
+            return
+        save_timed_status(engine, timer, file_id, Status.SAVING)
+        with timer.stage("save") as timing:
+            timing.rows = table.num_rows
+            save_table_to_cloud(table, settings.provider, file_conf.save_type, file_conf.save_location, file_conf.save_params)
+        save_timed_status(engine, timer, file_id, Status.SUCCESS)
+    except (pyarrow.lib.ArrowInvalid, ValueError) as exc:
+        save_timed_status(engine, timer, file_id, Status.FAILED, [str(exc)])
+
+
+def validate_and_save_chunks(engine: Engine, settings: PipelineSettings, file_id: str, chunks: Iterable[pd.DataFrame], file_conf: Configuration, timer: StageTimer) -> None:
+    """
+    Validates and saves a file one chunk at a time, so memory is bounded by the chunk size instead of the file size.
+    Every chunk is validated, to report all failure cases, but the output is only committed if all of them pass.
+    Chunks are read and validated while the output is written, so those stages are nested in the save stage.
+    """
+    failures = []
+
+    def validated_tables():
+        for chunk in chunks:
+            with timer.stage("validate") as timing:
+                timing.rows = len(chunk)
+                failure_cases = validate_dataframe(chunk, file_conf)
+            if failure_cases is not None:
+                failures.append(failure_cases)
+            # after the first failure, keep validating but stop writing
+            if not failures:
+                yield cast_to_schema(pyarrow.Table.from_pandas(chunk, preserve_index=False), file_conf)
+        if failures:
+            raise ChunkValidationError(pd.concat(failures, ignore_index=True))
+
+    try:
+        with timer.stage("save"):
+            save_tables_to_cloud(validated_tables(), settings.provider, file_conf.save_type, file_conf.save_location, file_conf.save_params)
+        save_timed_status(engine, timer, file_id, Status.SUCCESS)
+    except ChunkValidationError as exc:
+        save_failure_cases(engine, settings, file_id, exc.failure_cases, timer)
+    except (pyarrow.lib.ArrowInvalid, ValueError) as exc:
+        save_timed_status(engine, timer, file_id, Status.FAILED, [str(exc)])
+
+
+def cast_to_schema(table: pyarrow.Table, file_conf: Configuration) -> pyarrow.Table:
+    """
+    Casts the columns of a table declared in the schema of a configuration to their Arrow type, so every chunk of a
+    file is saved with the same types, even if the values of a chunk alone would be read as another type (e.g. a
+    column that is empty in the first chunk). Other columns keep the type of the first chunk when they are saved.
+    """
+    arrow_types = file_conf.compiled_schema.arrow_types
+    schema = pyarrow.schema([field.with_type(arrow_types.get(field.name, field.type)) for field in table.schema],
+                            metadata=table.schema.metadata)
+    return table if schema.equals(table.schema) else table.cast(schema)
+
+
+def precheck_file(file_id: str, file_conf: Configuration | MultipleSheetConfiguration, file_path: str, rows: int, samples: int = 5) -> list[str]:
+    """
+    Reads only the first rows of a file, or of each sheet, and checks that the columns of the schema are there
+    and have the right types, so a wrong file fails in milliseconds instead of after a full parse.
+    Checks of the schema are left to the full validation, which reports every failure case.
+    file_id: str
+        The id of the file
+    file_conf: Configuration | MultipleSheetConfiguration
+        The configuration of the file
+    file_path: str
+        The temporary path of the file
+    rows: int
+        The number of rows read from the file, or from each sheet
+    samples: int
+        The number of failing values shown for each column
+    Returns:
+        The problems found, as status details, or an empty list if the file looks right
+    """
+    try:
+        if isinstance(file_conf, MultipleSheetConfiguration):
+            sheets = list(iter_excel_sheets(file_id, file_conf, file_path, rows))
+        elif callable(file_conf.load_type):
+            # custom loaders may not be able to read only a few rows
+            return []
+        elif file_conf.engine == "arrow":
+            sheets = [(file_conf, convert_file_to_table(file_id, file_conf, file_path, rows).to_pandas())]
+        else:
+            sheets = [(file_conf, convert_file_to_dataframe(file_id, file_conf, file_path, rows))]
+    except Exception as exc:
+        # readers raise their own errors for corrupt or mislabelled files, e.g. CalamineError or BadZipFile
+        return [f"The file could not be read: {exc}"]
+
+    errors = []
+    for conf, sample in sheets:
+        try:
+            conf.compiled_schema.header_schema.validate(sample, lazy=True, inplace=True)
+        except pdr.errors.SchemaErrors as exc:
+            prefix = f"{conf.sheet}: " if isinstance(conf, SheetConfiguration) else ""
+            errors.extend(prefix + line for line in summarize_failure_cases(exc.failure_cases, samples))
+    if errors:
+        errors.insert(0, f"The first {rows} rows don't match the schema")
+    return errors
+
+
+def validate_dataframe(dataframe: pd.DataFrame, conf: Configuration | SheetConfiguration) -> pd.DataFrame | None:
+    """
+    Validates a dataframe against the schema of a configuration, coercing its columns in place.
+    Returns:
+        The failure cases found by pandera, or None if the dataframe is valid
+    """
+    if conf.validation_engine == "fast":
+        return conf.compiled_schema.fast_validator.validate(dataframe)
+    try:
+        conf.compiled_schema.dataframe_schema.validate(dataframe, lazy=True, inplace=True)
+    except pdr.errors.SchemaErrors as exc:
+        return exc.failure_cases
+    return None
+
+
+def save_failure_cases(engine: Engine, settings: PipelineSettings, file_id: str, failure_cases: pd.DataFrame, timer: StageTimer) -> None:
+    """
+    Marks a file as failed. The status details summarize the failure cases found by pandera,
+    and all of them are saved to a failure report, that can be downloaded.
+    """
+    report_path = failure_report_path(file_id)
+    with timer.stage("report") as timing:
+        timing.rows = len(failure_cases)
+        write_failure_report(failure_cases, report_path)
+    save_timed_status(engine, timer, file_id, Status.FAILED, summarize_failure_cases(failure_cases, settings.failure_samples), report_path)
+
+
+def save_timed_status(engine: Engine, timer: StageTimer, file_id: str, status: Status, status_detail: list[str] = None, report_path: str = None) -> None:
+    """
+    Saves a status of a file, timing the status database as a stage.
+    A final status becomes the outcome of the timer, and is saved with the timings of the stages so far and the
+    hash of the upload.
+    """
+    final = status in (Status.SUCCESS, Status.FAILED, Status.PARTIAL_SUCCESS)
+    if final:
+        timer.outcome = status.value
+    with timer.stage("status_db"):
+        if final:
+            save_file_status(engine, file_id, status, status_detail, report_path, timer.as_dict(), timer.content_hash)
+        else:
+            save_file_status(engine, file_id, status, status_detail, report_path)
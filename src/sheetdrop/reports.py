@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import os
+from random import randint
+
+from sheetdrop.fileops import TEMP_DIR
+from sheetdrop.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+# failure reports are kept next to the temporary files, one per file id
+REPORT_DIR = os.path.join(TEMP_DIR, "reports")
+
+# columns of the failure cases found by pandera, which the report keeps
+REPORT_COLUMNS = ["schema_context", "column", "check", "check_number", "failure_case", "index"]
+
+
+def summarize_failure_cases(failure_cases: pd.DataFrame, samples: int = 5) -> list[str]:
+    """
+    Summarizes the failure cases found by pandera, with one line per column and check.
+    The number of lines depends on the schema, not on the number of failures.
+    failure_cases: pandas.DataFrame
+        The failure cases, as reported by pandera. May have a 'sheet' column, for multiple sheet files.
+    samples: int
+        The number of failing values shown for each column and check
+    Returns:
+        The summary, as status details
+    """
+    keys = [key for key in ("sheet", "column", "check") if key in failure_cases]
+    summary = [f"{len(failure_cases)} failure cases found"]
+    for key, group in failure_cases.groupby(keys, sort=False, dropna=False):
+        name = " / ".join("-" if pd.isna(value) else str(value) for value in key)
+        examples = ", ".join(f"{value!r} (row {index})" for value, index in zip(group["failure_case"].head(samples), group["index"].head(samples)))
+        summary.append(f"{name}: {len(group)} failed, e.g. {examples}")
+    return summary
+
+
+def failure_report_path(file_id: str) -> str:
+    """
+    Returns the path of the failure report of a file, creating the report directory if needed.
+    file_id: str
+        The id of the file
+    Returns:
+        The path of the report
+    """
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    return os.path.join(REPORT_DIR, f"{file_id}.parquet")
+
+
+def write_failure_report(failure_cases: pd.DataFrame, path: str) -> None:
+    """
+    Saves every failure case to a Parquet file, replacing the previous report atomically.
+    Failing values and row labels may have any type, so they are stored as strings.
+    failure_cases: pandas.DataFrame
+        The failure cases, as reported by pandera
+    path: str
+        The path of the report
+    """
+    report = pd.DataFrame({
+        column: failure_cases[column].astype("Int64") if column == "check_number" else failure_cases[column].astype("string")
+        for column in failure_cases.columns if column in REPORT_COLUMNS or column == "sheet"
+    })
+    staging_path = f"{path}.{randint(0, 1000000)}.tmp"
+    report.to_parquet(staging_path, index=False)
+    os.replace(staging_path, path)
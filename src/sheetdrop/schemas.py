@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import copy
+import re
+from dataclasses import dataclass
+from typing import Callable
+
+from sheetdrop.lazy import lazy_import
+from sheetdrop.validation import FastValidator
+
+numpy = lazy_import("numpy")
+pd = lazy_import("pandas")
+pa = lazy_import("pandera")
+pyarrow = lazy_import("pyarrow")
+
+# built-in checks whose pattern argument is a regular expression
+REGEX_CHECKS = {"str_matches", "str_contains"}
+
+
+@dataclass
+class CompiledSchema():
+    """
+    The pandera schema of a configuration, built once, plus what loaders need to read only what the schema validates.
+    """
+    dataframe_schema: pa.DataFrameSchema
+    # usecols filter for pandas readers, or None if columns are matched by regex
+    usecols: Callable[[str], bool] | None
+    # dtype map for pandas CSV readers
+    read_dtypes: dict[str, type]
+    # the same columns, as types for the pyarrow CSV reader
+    read_arrow_types: dict[str, pyarrow.DataType]
+    # the Arrow type of every column that has one, given to the validated data before it is saved
+    arrow_types: dict[str, pyarrow.DataType]
+    # validator used when the configuration's validation_engine is 'fast'
+    fast_validator: FastValidator
+    # the same columns and types, without checks or nullability, to pre-check the first rows of a file
+    header_schema: pa.DataFrameSchema
+
+
+def compile_schema(schema: dict[str, pa.Column]) -> CompiledSchema:
+    """
+    Builds the pandera DataFrameSchema of a configuration, with the patterns of regex checks compiled.
+    schema: dict[str, pandera.Column]
+        The schema of the configuration. It is copied, not modified.
+    Returns:
+        The compiled schema
+    """
+    columns = copy.deepcopy(schema)
+    for column in columns.values():
+        for check in column.checks:
+            pattern = check._check_kwargs.get("pattern") if check.name in REGEX_CHECKS else None
+            if isinstance(pattern, str):
+                check._check_kwargs["pattern"] = re.compile(pattern)
+
+    if any(column.regex for column in columns.values()):
+        usecols = None
+    else:
+        usecols = set(columns).__contains__
+
+    # only string columns are typed while reading: a bad value in a numeric column would abort
+    # the parser, instead of being reported by pandera as a failure case
+    read_dtypes = {}
+    read_arrow_types = {}
+    arrow_types = {}
+    for name, column in columns.items():
+        arrow_type = arrow_type_from_pandera(column)
+        if arrow_type is None or column.regex:
+            continue
+        arrow_types[name] = arrow_type
+        if arrow_type == pyarrow.string():
+            read_dtypes[name] = str
+            read_arrow_types[name] = arrow_type
+
+    dataframe_schema = pa.DataFrameSchema(columns, coerce=True)
+    header_schema = pa.DataFrameSchema({
+        name: pa.Column(column.dtype, nullable=True, required=column.required, regex=column.regex)
+        for name, column in columns.items()
+    }, coerce=True)
+    return CompiledSchema(dataframe_schema, usecols, read_dtypes, read_arrow_types, arrow_types, FastValidator(dataframe_schema), header_schema)
+
+
+def arrow_type_from_pandera(column: pa.Column) -> pyarrow.DataType | None:
+    """
+    Maps the dtype of a pandera Column to an Arrow type.
+    column: pandera.Column
+        The column to map
+    Returns:
+        The Arrow type, or None if the column has no dtype or it has no direct Arrow equivalent
+    """
+    dtype = getattr(column.dtype, "type", None)
+    if isinstance(dtype, pd.StringDtype):
+        return pyarrow.string()
+    # pandas nullable types, e.g. Int64, wrap a numpy dtype
+    dtype = getattr(dtype, "numpy_dtype", dtype)
+    if not isinstance(dtype, numpy.dtype):
+        return None
+    if dtype.kind == "U":
+        return pyarrow.string()
+    try:
+        return pyarrow.from_numpy_dtype(dtype)
+    except (pyarrow.ArrowNotImplementedError, TypeError):
+        return None
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from sheetdrop.db import (file_status_dict, load_latest_file_status,
+                          load_latest_status_ids, run_db)
+
+
+class StatusCache():
+    """
+    Keeps the latest status of recently requested files in memory, and pushes changes to subscribers.
+    Statuses saved in this process are written through to the cache by save_file_status (see db.status_listeners).
+    Statuses saved by other processes, such as external workers, are picked up when a cached entry expires,
+    or by run(), which checks the files with subscribers in a single query.
+    """
+
+    def __init__(self, engine: Engine, ttl: float = 2.0, max_entries: int = 10000, poll_interval: float = 1.0, async_engine: AsyncEngine = None):
+        """
+        engine: sqlalchemy.engine.Engine
+            The engine for the utility database
+        ttl: float
+            Seconds a status is served from memory before it is loaded again. 0 disables caching.
+        max_entries: int
+            Maximum number of files kept in memory. The least recently used ones are evicted first.
+        poll_interval: float
+            Seconds between checks for statuses saved by other processes, while a file has subscribers
+        async_engine: sqlalchemy.ext.asyncio.AsyncEngine
+            The async engine for the utility database, used instead of running queries on threads, if set
+        """
+        self.engine = engine
+        self.async_engine = async_engine
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.poll_interval = poll_interval
+        # file_id -> (status or None if the file has none, time it was stored)
+        self._entries: OrderedDict[str, tuple[dict[str, Any] | None, float]] = OrderedDict()
+        self._subscribers: dict[str, set[tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+
+    async def get(self, file_id: str) -> dict[str, Any] | None:
+        """
+        Returns the latest status of a file, as returned by file_status_dict, or None if it has no status.
+        """
+        with self._lock:
+            entry = self._entries.get(file_id)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(file_id)
+                return entry[0]
+        return await self.load(file_id)
+
+    async def load(self, file_id: str) -> dict[str, Any] | None:
+        """Loads the latest status of a file from the database, and updates the cache with it."""
+        status = await run_db(self.engine, self.async_engine, load_latest_file_status, file_id)
+        saved = file_status_dict(status) if status else None
+        self._store(file_id, saved)
+        return saved
+
+    def put(self, status: dict[str, Any]) -> None:
+        """Stores a status that was just saved, as returned by file_status_dict. Can be called from any thread."""
+        self._store(status["file_id"], status)
+
+    def _store(self, file_id: str, status: dict[str, Any] | None) -> None:
+        with self._lock:
+            entry = self._entries.get(file_id)
+            cached = entry[0] if entry else None
+            if cached and status and cached["status_id"] > status["status_id"]:
+                # a newer status was stored while this one was loaded
+                status = cached
+            changed = status is not None and (cached is None or cached["status_id"] != status["status_id"])
+            self._entries[file_id] = (status, time.monotonic())
+            self._entries.move_to_end(file_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            subscribers = list(self._subscribers.get(file_id, ())) if changed else []
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, status)
+
+    def subscribe(self, file_id: str) -> asyncio.Queue:
+        """
+        Subscribes to the changes of the status of a file. Must be called from the event loop.
+        Returns:
+            A queue that receives every new status of the file. It must be passed to unsubscribe when done.
+        """
+        queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(file_id, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, file_id: str, queue: asyncio.Queue) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(file_id, set())
+            subscribers.discard((asyncio.get_running_loop(), queue))
+            if not subscribers:
+                self._subscribers.pop(file_id, None)
+
+    async def refresh(self) -> None:
+        """Reloads the statuses of the files with subscribers that were changed by other processes."""
+        with self._lock:
+            file_ids = list(self._subscribers)
+            cached = {file_id: self._entries.get(file_id, (None, 0))[0] for file_id in file_ids}
+        if not file_ids:
+            return
+        latest = await run_db(self.engine, self.async_engine, load_latest_status_ids, file_ids)
+        for file_id, status_id in latest.items():
+            if cached[file_id] is None or cached[file_id]["status_id"] != status_id:
+                await self.load(file_id)
+
+    async def run(self) -> None:
+        """Checks for statuses saved by other processes every poll_interval, until cancelled."""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh()
+            except Exception as exc:
+                print(f"Error refreshing the status cache: {exc}")
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+import uuid
+from random import randint
+from typing import AsyncIterable
+
+from sheetdrop.fileops import (TEMP_DIR, UPLOAD_CHUNK_SIZE, FileTooLargeError,
+                               delete_temp_file, new_temp_path)
+
+# resumable uploads keep their chunks here until they are committed, one directory per upload
+UPLOAD_DIR = os.path.join(TEMP_DIR, "uploads")
+
+# name of the file that describes an upload, in its directory
+UPLOAD_METADATA = "upload.json"
+
+
+class UploadNotFoundError(LookupError):
+    """Raised when a resumable upload doesn't exist, was already committed or belongs to another file."""
+
+
+class IncompleteUploadError(ValueError):
+    """Raised when a resumable upload is committed with missing chunks."""
+
+
+def create_upload(file_id: str) -> str:
+    """
+    Starts a resumable upload. Its state is kept on disk, so every web server sharing the temp directory can receive its chunks.
+    file_id: str
+        The id of the file being uploaded
+    Returns:
+        The id of the upload
+    """
+    upload_id = uuid.uuid4().hex
+    path = upload_path(upload_id)
+    os.makedirs(path)
+    with open(os.path.join(path, UPLOAD_METADATA), "w") as f:
+        json.dump({"file_id": file_id, "created_at": time.time()}, f)
+    return upload_id
+
+
+def upload_path(upload_id: str) -> str:
+    """Returns the directory of a resumable upload."""
+    # upload ids come from URLs, so don't let them point outside the upload directory
+    if not upload_id.isalnum():
+        raise UploadNotFoundError(f"Upload {upload_id} not found")
+    return os.path.join(UPLOAD_DIR, upload_id)
+
+
+def load_upload(file_id: str, upload_id: str) -> dict:
+    """
+    Returns the metadata of a resumable upload.
+    Raises:
+        UploadNotFoundError if the upload doesn't exist, or is for another file
+    """
+    try:
+        with open(os.path.join(upload_path(upload_id), UPLOAD_METADATA)) as f:
+            metadata = json.load(f)
+    except FileNotFoundError:
+        raise UploadNotFoundError(f"Upload {upload_id} not found") from None
+    if metadata["file_id"] != file_id:
+        raise UploadNotFoundError(f"Upload {upload_id} not found")
+    return metadata
+
+
+def list_chunks(upload_id: str) -> dict[int, int]:
+    """
+    Returns the chunks received so far, so a client can resume an upload after a failure.
+    Returns:
+        The size of each chunk, by chunk number
+    """
+    path = upload_path(upload_id)
+    chunks = {}
+    for name in os.listdir(path):
+        if name.endswith(".part"):
+            chunks[int(name[:-len(".part")])] = os.path.getsize(os.path.join(path, name))
+    return dict(sorted(chunks.items()))
+
+
+async def write_chunk(upload_id: str, number: int, body: AsyncIterable[bytes], max_size: int = None) -> int:
+    """
+    Stores a chunk of a resumable upload. Sending a chunk again replaces it, so failed chunks can simply be retried.
+    The chunk only becomes part of the upload once it is fully received.
+    upload_id: str
+        The id of the upload
+    number: int
+        The position of the chunk in the file, starting at 1
+    body: AsyncIterable[bytes]
+        The contents of the chunk, e.g. Request.stream()
+    max_size: int
+        The maximum size of the whole upload, or None for no limit
+    Returns:
+        The size of the chunk
+    Raises:
+        FileTooLargeError if the chunks received so far, with this one, exceed max_size
+    """
+    path = upload_path(upload_id)
+    if number < 1:
+        raise ValueError("Chunk numbers start at 1")
+    # the chunk being replaced doesn't count against the limit
+    received = sum(size for chunk, size in list_chunks(upload_id).items() if chunk != number)
+    target = os.path.join(path, f"{number:08d}.part")
+    staging = f"{target}.{randint(0, 1000000)}.tmp"
+    written = 0
+    try:
+        with open(staging, "wb") as f:
+            async for data in body:
+                written += len(data)
+                if max_size is not None and received + written > max_size:
+                    raise FileTooLargeError(f"File exceeds the maximum size of {max_size} bytes")
+                await asyncio.to_thread(f.write, data)
+        os.replace(staging, target)
+    except BaseException:
+        delete_temp_file(staging)
+        raise
+    return written
+
+
+def assemble_upload(file_id: str, upload_id: str, hasher=None, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """
+    Joins the chunks of a resumable upload into a temporary file, ready to be processed, and removes the upload.
+    Once an upload is being assembled, it can't be committed again.
+    file_id: str
+        The id of the file being uploaded
+    upload_id: str
+        The id of the upload
+    hasher: hashlib hash object
+        If set, updated with the contents of the file
+    chunk_size: int
+        The number of bytes copied at a time
+    Returns:
+        The path of the assembled file
+    Raises:
+        UploadNotFoundError if the upload doesn't exist or is already being committed
+        IncompleteUploadError if chunks are missing. The upload is left as it was, so they can still be sent.
+    """
+    load_upload(file_id, upload_id)
+    path = upload_path(upload_id)
+    chunks = list_chunks(upload_id)
+    if not chunks or list(chunks) != list(range(1, len(chunks) + 1)):
+        missing = sorted(set(range(1, max(chunks, default=0) + 1)) - set(chunks)) or [1]
+        raise IncompleteUploadError(f"Upload {upload_id} is missing chunks {', '.join(map(str, missing))}")
+    # renaming the directory is atomic, so only one commit gets to assemble the upload
+    committing = f"{path}.committing"
+    try:
+        os.rename(path, committing)
+    except FileNotFoundError:
+        raise UploadNotFoundError(f"Upload {upload_id} not found") from None
+    target = new_temp_path(file_id)
+    try:
+        with open(target, "wb") as output:
+            for number in chunks:
+                with open(os.path.join(committing, f"{number:08d}.part"), "rb") as chunk:
+                    while data := chunk.read(chunk_size):
+                        if hasher is not None:
+                            hasher.update(data)
+                        output.write(data)
+    except BaseException:
+        delete_temp_file(target)
+        # give the upload back, so the commit can be retried
+        os.rename(committing, path)
+        raise
+    shutil.rmtree(committing, ignore_errors=True)
+    return target
+
+
+def delete_upload(file_id: str, upload_id: str) -> None:
+    """
+    Aborts a resumable upload, removing its chunks.
+    Raises:
+        UploadNotFoundError if the upload doesn't exist, or is for another file
+    """
+    load_upload(file_id, upload_id)
+    shutil.rmtree(upload_path(upload_id), ignore_errors=True)
+
+
+def expire_uploads(max_age: float) -> None:
+    """
+    Removes the resumable uploads that didn't receive a chunk for more than max_age seconds, and were never committed.
+    max_age: float
+        The age in seconds
+    """
+    if not os.path.exists(UPLOAD_DIR):
+        return
+    deadline = time.time() - max_age
+    for upload_id in os.listdir(UPLOAD_DIR):
+        path = os.path.join(UPLOAD_DIR, upload_id)
+        try:
+            if os.path.getmtime(path) < deadline:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            # removed by another process in the meantime
+            pass
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import re
+from typing import Any, Callable
+
+from sheetdrop.lazy import lazy_import
+
+pd = lazy_import("pandas")
+pa = lazy_import("pandera")
+pyarrow = lazy_import("pyarrow")
+pc = lazy_import("pyarrow.compute")
+
+# values accepted by Configuration.validation_engine
+VALIDATION_ENGINES = ("pandera", "fast")
+
+# regex syntax that RE2, used by Arrow, doesn't support or interprets differently from Python
+RE2_INCOMPATIBLE = re.compile(r"\\[dDwWsSbBZ0-9]|\[:|\{,")
+
+
+class KernelFallback(Exception):
+    """Raised when a column can't be checked by the kernels, to validate the dataframe with pandera instead."""
+
+
+def _passed_comparison(function: str) -> Callable:
+    # the compute function is looked up by name when the kernel runs, so pyarrow isn't imported with this module
+    def kernel(array: pyarrow.Array, **kwargs) -> pyarrow.Array:
+        (value,) = kwargs.values()
+        return getattr(pc, function)(array, pyarrow.scalar(value))
+    return kernel
+
+
+def _passed_in_range(array: pyarrow.Array, min_value, max_value, include_min=True, include_max=True) -> pyarrow.Array:
+    low = (pc.greater_equal if include_min else pc.greater)(array, pyarrow.scalar(min_value))
+    high = (pc.less_equal if include_max else pc.less)(array, pyarrow.scalar(max_value))
+    return pc.and_(low, high)
+
+
+def _value_set(array: pyarrow.Array, values) -> pyarrow.Array:
+    return pyarrow.array(list(values)).cast(array.type)
+
+
+def _passed_isin(array: pyarrow.Array, allowed_values) -> pyarrow.Array:
+    return pc.is_in(array, value_set=_value_set(array, allowed_values))
+
+
+def _passed_notin(array: pyarrow.Array, forbidden_values) -> pyarrow.Array:
+    return pc.invert(pc.is_in(array, value_set=_value_set(array, forbidden_values)))
+
+
+def _string_array(array: pyarrow.Array) -> pyarrow.Array:
+    if not (pyarrow.types.is_string(array.type) or pyarrow.types.is_large_string(array.type)):
+        raise KernelFallback(f"String check on a column of type {array.type}")
+    return array
+
+
+def _passed_regex(array: pyarrow.Array, pattern: str | re.Pattern, anchored: bool) -> pyarrow.Array:
+    array = _string_array(array)
+    regex = pattern if isinstance(pattern, re.Pattern) else re.compile(pattern)
+    # Python's $ also matches before a trailing newline, RE2's doesn't: only use RE2 without newlines
+    if (regex.flags == re.UNICODE and regex.pattern.isascii() and not RE2_INCOMPATIBLE.search(regex.pattern)
+            and not pc.any(pc.match_substring(array, "\n")).as_py()):
+        try:
+            return pc.match_substring_regex(array, f"^(?:{regex.pattern})" if anchored else regex.pattern)
+        except pyarrow.ArrowInvalid:
+            pass
+    search = regex.match if anchored else regex.search
+    return pyarrow.array([None if value is None else search(value) is not None for value in array.to_pylist()], pyarrow.bool_())
+
+
+def _passed_str_length(array: pyarrow.Array, min_value=None, max_value=None) -> pyarrow.Array:
+    if min_value is None and max_value is None:
+        raise KernelFallback("str_length without limits")
+    length = pc.utf8_length(_string_array(array))
+    if max_value is None:
+        return pc.greater_equal(length, min_value)
+    if min_value is None:
+        return pc.less_equal(length, max_value)
+    return pc.and_(pc.greater_equal(length, min_value), pc.less_equal(length, max_value))
+
+
+# kernels for the built-in pandera checks, by check name. Each receives the column as an Arrow
+# array and the check arguments, and returns whether each value passed, or null for null values.
+KERNELS: dict[str, Callable[..., pyarrow.Array]] = {
+    "equal_to": _passed_comparison("equal"),
+    "not_equal_to": _passed_comparison("not_equal"),
+    "greater_than": _passed_comparison("greater"),
+    "greater_than_or_equal_to": _passed_comparison("greater_equal"),
+    "less_than": _passed_comparison("less"),
+    "less_than_or_equal_to": _passed_comparison("less_equal"),
+    "in_range": _passed_in_range,
+    "isin": _passed_isin,
+    "notin": _passed_notin,
+    "str_matches": lambda array, pattern: _passed_regex(array, pattern, anchored=True),
+    "str_contains": lambda array, pattern: _passed_regex(array, pattern, anchored=False),
+    "str_startswith": lambda array, string: pc.starts_with(_string_array(array), string),
+    "str_endswith": lambda array, string: pc.ends_with(_string_array(array), string),
+    "str_length": _passed_str_length,
+}
+
+
+def is_kernel_check(check: pa.Check) -> bool:
+    """Tells if a check can run as a kernel: a built-in check with a kernel and default pandera options."""
+    return (
+        check.name in KERNELS
+        and check._check_fn == pa.Check.get_builtin_check_fn(check.name)
+        and check.ignore_na
+        and not check.element_wise
+        and check.groupby is None
+        and not check.raise_warning
+        and check.n_failure_cases is None
+    )
+
+
+class FastValidator():
+    """
+    Validates dataframes like a pandera DataFrameSchema, running the common built-in checks as Arrow compute kernels.
+    Coercion, dtypes, nullability and unrecognized checks are still validated by pandera, without the kernel checks.
+    Each column with kernel checks is then converted to Arrow once, and all its checks run on that array.
+    Whenever anything fails outside the kernels, the full schema is validated by pandera instead,
+    so the failure cases are always the ones pandera would report.
+    """
+
+    def __init__(self, dataframe_schema: pa.DataFrameSchema):
+        """
+        dataframe_schema: pandera.DataFrameSchema
+            The schema to validate. It is not modified.
+        """
+        self.dataframe_schema = dataframe_schema
+        self.kernel_checks: dict[str, list[tuple[int, pa.Check]]] = {}
+        structural_checks = {}
+        for name, column in dataframe_schema.columns.items():
+            if column.regex:
+                continue
+            checks = [(i, check) for i, check in enumerate(column.checks) if is_kernel_check(check)]
+            if checks:
+                self.kernel_checks[name] = checks
+                structural_checks[name] = {"checks": [check for check in column.checks if not is_kernel_check(check)]}
+        self.structural_schema = dataframe_schema.update_columns(structural_checks)
+
+    def validate(self, dataframe: pd.DataFrame) -> pd.DataFrame | None:
+        """
+        Validates a dataframe, coercing its columns in place.
+        Returns:
+            The failure cases, in pandera's format, or None if the dataframe is valid
+        """
+        try:
+            self.structural_schema.validate(dataframe, lazy=True, inplace=True)
+            failure_cases = self._run_kernels(dataframe)
+        # errors raised by a kernel that can't handle a column, e.g. a comparison between incompatible types.
+        # The dataframe is then validated by pandera, which reports them as failure cases.
+        except (pa.errors.SchemaErrors, KernelFallback, pyarrow.ArrowException, TypeError, ValueError):
+            return self._validate_with_pandera(dataframe)
+        if not failure_cases:
+            return None
+        # consolidated like pandera.backends.pandas.error_formatters.consolidate_failure_cases
+        return pd.concat(failure_cases).reset_index(drop=True).sort_values("schema_context", ascending=False)
+
+    def _validate_with_pandera(self, dataframe: pd.DataFrame) -> pd.DataFrame | None:
+        try:
+            self.dataframe_schema.validate(dataframe, lazy=True, inplace=True)
+        except pa.errors.SchemaErrors as exc:
+            return exc.failure_cases
+        return None
+
+    def _run_kernels(self, dataframe: pd.DataFrame) -> list[pd.DataFrame]:
+        failure_cases = []
+        for name, checks in self.kernel_checks.items():
+            if name not in dataframe:
+                # optional columns that are missing are not checked
+                continue
+            series = dataframe[name]
+            array = pyarrow.Array.from_pandas(series)
+            for check_number, check in checks:
+                passed = KERNELS[check.name](array, **check._check_kwargs)
+                # null values pass, as with pandera's ignore_na
+                failed = pc.invert(pc.fill_null(passed, True))
+                if not pc.any(failed).as_py():
+                    continue
+                failure_cases.append(self._failure_cases(series, check, check_number, failed.to_numpy(zero_copy_only=False)))
+        return failure_cases
+
+    @staticmethod
+    def _failure_cases(series: pd.Series, check: pa.Check, check_number: int, failed: Any) -> pd.DataFrame:
+        # shaped like pandera.backends.pandas.error_formatters.reshape_failure_cases
+        cases = series[failed].rename("failure_case")
+        cases.index.name = "index"
+        return cases.reset_index().assign(
+            schema_context="Column",
+            check=check.error,
+            check_number=check_number,
+            column=series.name,
+        )[["schema_context", "column", "check", "check_number", "failure_case", "index"]]
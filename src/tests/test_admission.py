@@ -0,0 +1,120 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from sheetdrop import jobs
+from sheetdrop.admission import AdmissionControl, UploadRejectedError
+from sheetdrop.db import create_engine
+from sheetdrop.dbmodels import Base
+
+
+class TestAdmissionControl(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.temp_dir.name, 'test.db')}")
+        Base.metadata.create_all(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.temp_dir.cleanup()
+
+    def test_rejects_uploads_beyond_queue_depth(self):
+        admission = AdmissionControl(self.engine, max_queue_depth=2, retry_after=7)
+        jobs.enqueue_job(self.engine, 'file_a', 'temp/a')
+
+        async def upload():
+            async with admission.admit('file_b'):
+                self.assertEqual(admission.receiving, 1)
+                # the upload being received takes the last place in the queue
+                async with admission.admit('file_c'):
+                    pass
+
+        with self.assertRaises(UploadRejectedError) as context:
+            asyncio.run(upload())
+        self.assertEqual(context.exception.retry_after, 7)
+        self.assertEqual(admission.receiving, 0)
+
+    def test_rejects_uploads_beyond_queue_of_file(self):
+        admission = AdmissionControl(self.engine, max_queue_depth=10, max_queued_per_file=1)
+        jobs.enqueue_job(self.engine, 'file_a', 'temp/a')
+
+        async def upload(file_id):
+            async with admission.admit(file_id):
+                pass
+
+        asyncio.run(upload('file_b'))
+        with self.assertRaises(UploadRejectedError):
+            asyncio.run(upload('file_a'))
+
+    def test_rejects_uploads_beyond_concurrent_uploads(self):
+        admission = AdmissionControl(self.engine, max_queue_depth=10, max_receiving=1)
+
+        async def uploads():
+            started = asyncio.Event()
+            release = asyncio.Event()
+
+            async def upload(file_id, wait):
+                async with admission.admit(file_id):
+                    started.set()
+                    if wait:
+                        await release.wait()
+
+            first = asyncio.create_task(upload('file_a', True))
+            await started.wait()
+            try:
+                await upload('file_b', False)
+            finally:
+                release.set()
+                await first
+
+        with self.assertRaises(UploadRejectedError):
+            asyncio.run(uploads())
+
+    def test_limits_concurrent_uploads_during_bursts(self):
+        admission = AdmissionControl(self.engine, max_queue_depth=100, max_receiving=2)
+        peak = 0
+
+        async def burst():
+            decided = asyncio.Semaphore(0)
+            release = asyncio.Event()
+
+            async def upload(file_id):
+                nonlocal peak
+                try:
+                    async with admission.admit(file_id):
+                        peak = max(peak, admission.receiving)
+                        decided.release()
+                        # admitted uploads are received until every upload was admitted or rejected
+                        await release.wait()
+                    return True
+                except UploadRejectedError:
+                    decided.release()
+                    return False
+
+            # every upload starts before any of them is admitted
+            tasks = [asyncio.create_task(upload(f'file_{number}')) for number in range(10)]
+            for _ in tasks:
+                await decided.acquire()
+            release.set()
+            return await asyncio.gather(*tasks)
+
+        admitted = asyncio.run(burst())
+
+        self.assertEqual(sum(admitted), 2)
+        self.assertEqual(peak, 2)
+        self.assertEqual(admission.receiving, 0)
+
+    def test_file_lock_is_shared_by_uploads_of_a_file(self):
+        admission = AdmissionControl(self.engine)
+
+        async def locks():
+            lock = admission.file_lock('file_a')
+            self.assertIs(admission.file_lock('file_a'), lock)
+            self.assertIsNot(admission.file_lock('file_b'), lock)
+
+        asyncio.run(locks())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import hashlib
+import io
+import os
+import tempfile
+import time
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from sheetdrop import batches
+from sheetdrop.fileops import FileTooLargeError
+
+
+class TestBatches(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        patchers = [
+            patch('sheetdrop.batches.BATCH_DIR', os.path.join(self.temp_dir.name, 'batches')),
+            patch('sheetdrop.fileops.TEMP_DIR', self.temp_dir.name),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def make_archive(self, entries: dict[str, bytes]) -> zipfile.ZipFile:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, data in entries.items():
+                archive.writestr(name, data)
+        return zipfile.ZipFile(buffer)
+
+    def test_archive_file_id(self):
+        self.assertEqual(batches.archive_file_id('sales.csv'), 'sales')
+        self.assertEqual(batches.archive_file_id('sales/2024-01.csv'), 'sales')
+        self.assertIsNone(batches.archive_file_id('sales/'))
+        self.assertIsNone(batches.archive_file_id('__MACOSX/._sales.csv'))
+        self.assertIsNone(batches.archive_file_id('.DS_Store'))
+
+    def test_extract_entry(self):
+        archive = self.make_archive({'sales.csv': b'a,b\n1,2\n'})
+        hasher = hashlib.sha256()
+
+        path = batches.extract_entry(archive, archive.getinfo('sales.csv'), 'sales', hasher=hasher, chunk_size=3)
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'a,b\n1,2\n')
+        self.assertEqual(hasher.hexdigest(), hashlib.sha256(b'a,b\n1,2\n').hexdigest())
+
+    def test_extract_entry_too_large(self):
+        archive = self.make_archive({'sales.csv': b'x' * 100})
+
+        with self.assertRaises(FileTooLargeError):
+            batches.extract_entry(archive, archive.getinfo('sales.csv'), 'sales', max_size=50)
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+    def test_batch_summary(self):
+        batch_id = batches.create_batch([
+            {'file_id': 'a', 'name': 'a.csv', 'status_code': 202, 'message': 'Validation started in background', 'job_id': 1},
+            {'file_id': 'b', 'name': 'b.csv', 'status_code': 202, 'message': 'Validation started in background', 'job_id': 2},
+            {'file_id': 'c', 'name': 'c.csv', 'status_code': 200, 'message': 'Identical to the latest upload, its result was kept', 'job_id': None},
+            {'file_id': 'd', 'name': 'd.csv', 'status_code': 413, 'message': 'File exceeds the maximum size of 10 bytes'},
+        ])
+
+        summary = batches.summarize_batch(batches.load_batch(batch_id), {1: 'done', 2: 'running'})
+
+        self.assertEqual(summary['state'], 'in_progress')
+        self.assertEqual(summary['counts'], {'done': 2, 'running': 1, 'rejected': 1})
+        self.assertEqual([entry['state'] for entry in summary['entries']], ['done', 'running', 'done', 'rejected'])
+        self.assertEqual(batches.summarize_batch(batches.load_batch(batch_id), {1: 'done', 2: 'failed'})['state'], 'done')
+
+    def test_load_batch_not_found(self):
+        with self.assertRaises(batches.BatchNotFoundError):
+            batches.load_batch('missing')
+        with self.assertRaises(batches.BatchNotFoundError):
+            batches.load_batch('../uploads')
+
+    def test_expire_batches(self):
+        old = batches.create_batch([])
+        recent = batches.create_batch([])
+        os.utime(batches.batch_path(old), (time.time() - 100, time.time() - 100))
+
+        batches.expire_batches(50)
+
+        with self.assertRaises(batches.BatchNotFoundError):
+            batches.load_batch(old)
+        self.assertEqual(batches.load_batch(recent)['entries'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import tempfile
+import unittest
+import uuid
+
+from sheetdrop.configuration import ConfigurationRegistry
+
+DEFINITION = """
+from pandera import Column
+from sheetdrop.configuration import Configuration
+
+configuration = Configuration(
+    name={name!r},
+    load_type="csv",
+    load_params={{}},
+    save_location={save_location!r},
+    schema={{"one_to_three": Column(int)}},
+)
+"""
+
+
+class TestConfigurationRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        # a package of its own for each test, so modules imported by other tests aren't reused
+        self.package = f"definitions_{uuid.uuid4().hex}"
+        self.modules_dir = os.path.join(self.temp_dir.name, self.package)
+        os.makedirs(self.modules_dir)
+        open(os.path.join(self.modules_dir, "__init__.py"), "w").close()
+        sys.path.insert(0, self.temp_dir.name)
+        self.addCleanup(sys.path.remove, self.temp_dir.name)
+
+    def tearDown(self):
+        for module in [module for module in sys.modules if module.startswith(self.package)]:
+            del sys.modules[module]
+        self.temp_dir.cleanup()
+
+    def write_definition(self, module_name: str, name: str = "Test CSV", save_location: str = "output.parquet"):
+        path = os.path.join(self.modules_dir, f"{module_name}.py")
+        # the registry looks at modification times, which may not change between quick writes
+        mtime_ns = os.stat(path).st_mtime_ns + 1_000_000_000 if os.path.exists(path) else None
+        with open(path, "w") as f:
+            f.write(DEFINITION.format(name=name, save_location=save_location))
+        if mtime_ns:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    def test_definitions_are_loaded_when_requested(self):
+        self.write_definition("first")
+        registry = ConfigurationRegistry(self.modules_dir, self.package)
+
+        self.assertNotIn(f"{self.package}.first", sys.modules)
+        self.assertEqual(registry["first"].name, "Test CSV")
+        self.assertNotIn("missing", registry)
+        self.assertEqual(list(registry), ["first"])
+
+    def test_refresh_swaps_changed_definitions(self):
+        self.write_definition("first")
+        self.write_definition("second")
+        registry = ConfigurationRegistry(self.modules_dir, self.package)
+        running = registry["first"]
+        second = registry["second"]
+
+        self.write_definition("first", name="Changed")
+        self.assertEqual(registry.refresh(), ["first"])
+
+        self.assertEqual(registry["first"].name, "Changed")
+        self.assertNotEqual(registry["first"].fingerprint, running.fingerprint)
+        # jobs that already had the configuration keep it as it was
+        self.assertEqual(running.name, "Test CSV")
+        self.assertIs(registry["second"], second)
+
+    def test_invalid_change_keeps_previous_version(self):
+        self.write_definition("first")
+        registry = ConfigurationRegistry(self.modules_dir, self.package)
+        previous = registry["first"]
+
+        self.write_definition("first", save_location="")
+        registry.refresh()
+
+        self.assertIs(registry["first"], previous)
+        self.assertEqual(len(registry.errors), 1)
+        self.assertIn("save_location", registry.errors[0])
+
+        self.write_definition("first", name="Fixed")
+        registry.refresh()
+
+        self.assertEqual(registry["first"].name, "Fixed")
+        self.assertEqual(registry.errors, [])
+
+    def test_refresh_adds_and_removes_definitions(self):
+        self.write_definition("first")
+        registry = ConfigurationRegistry(self.modules_dir, self.package)
+        registry.load_all()
+
+        self.write_definition("second", save_location="")
+        os.remove(os.path.join(self.modules_dir, "first.py"))
+
+        self.assertEqual(registry.refresh(), ["first", "second"])
+        self.assertNotIn("first", registry)
+        self.assertNotIn("second", registry)
+        self.assertEqual(len(registry.errors), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
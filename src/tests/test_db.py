@@ -0,0 +1,72 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from sheetdrop import db
+from sheetdrop.dbmodels import Base, FileLatestStatus
+from sheetdrop.enums import Status
+
+
+class TestDb(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.engine = db.create_engine(f"sqlite:///{os.path.join(self.temp_dir.name, 'test.db')}")
+        Base.metadata.create_all(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.temp_dir.cleanup()
+
+    def test_load_latest_file_status(self):
+        db.save_file_status(self.engine, "test_file", Status.IN_PROGRESS)
+        db.save_file_status(self.engine, "other_file", Status.SUCCESS)
+        db.save_file_status(self.engine, "test_file", Status.FAILED, ["first", "second"], "report.parquet")
+
+        status = db.load_latest_file_status(self.engine, "test_file")
+
+        self.assertEqual(status.status, Status.FAILED.value)
+        self.assertEqual(status.report_path, "report.parquet")
+        self.assertIsNotNone(status.created_at)
+        # details are loaded with the status, so they are available once the session is closed
+        self.assertEqual([detail.status_detail for detail in status.status_details], ["first", "second"])
+        self.assertEqual(db.load_latest_file_status(self.engine, "other_file").status, Status.SUCCESS.value)
+        self.assertIsNone(db.load_latest_file_status(self.engine, "unknown_file"))
+
+    def test_update_latest_file_status_keeps_newer_status(self):
+        db.save_file_status(self.engine, "test_file", Status.IN_PROGRESS)
+        db.save_file_status(self.engine, "test_file", Status.SUCCESS)
+        latest = db.load_latest_file_status(self.engine, "test_file").status_id
+
+        # as if an older transaction committed after a newer one
+        with Session(self.engine) as session:
+            db.update_latest_file_status(session, "test_file", latest - 1)
+            session.commit()
+
+        with Session(self.engine) as session:
+            self.assertEqual(session.scalars(select(FileLatestStatus.status_id)).all(), [latest])
+
+    def test_run_db(self):
+        async_engine = db.create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.temp_dir.name, 'test.db')}", pool_size=2)
+
+        async def save_and_load():
+            try:
+                await db.run_db(self.engine, async_engine, db.save_file_status, "test_file", Status.FAILED, ["bad value"])
+                await db.run_db(self.engine, None, db.save_file_status, "other_file", Status.SUCCESS)
+                return (await db.run_db(self.engine, async_engine, db.load_latest_file_status, "other_file"),
+                        await db.run_db(self.engine, None, db.load_latest_file_status, "test_file"))
+            finally:
+                await async_engine.dispose()
+
+        other_status, test_status = asyncio.run(save_and_load())
+
+        self.assertEqual(other_status.status, Status.SUCCESS.value)
+        self.assertEqual(test_status.status, Status.FAILED.value)
+        self.assertEqual([detail.status_detail for detail in test_status.status_details], ["bad value"])
+
+if __name__ == '__main__':
+    unittest.main()
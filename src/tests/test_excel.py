@@ -0,0 +1,73 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+from pandera import Column
+
+from sheetdrop import excel, fileops
+from sheetdrop.configuration import MultipleSheetConfiguration, SheetConfiguration
+
+
+class TestExcel(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'input')
+        with pd.ExcelWriter(self.path, engine='openpyxl') as writer:
+            pd.DataFrame({'a': [1, 2], 'b': ['x', 'y'], 'c': [1.5, 2.5]}).to_excel(writer, sheet_name='first', index=False)
+            pd.DataFrame({'a': [3], 'b': ['z'], 'c': [3.5]}).to_excel(writer, sheet_name='second', index=False)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_detect_excel_format(self):
+        with open(self.path, 'rb') as f:
+            self.assertEqual(excel.detect_excel_format(f), 'xlsx')
+            self.assertEqual(f.tell(), 0)
+        self.assertEqual(excel.detect_excel_format(io.BytesIO(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1')), 'xls')
+        self.assertIsNone(excel.detect_excel_format(io.BytesIO(b'a,b\n1,2\n')))
+
+    @patch('importlib.util.find_spec')
+    def test_select_excel_engine(self, mock_find_spec):
+        with open(self.path, 'rb') as f:
+            self.assertEqual(excel.select_excel_engine(f, 'openpyxl'), 'openpyxl')
+            mock_find_spec.return_value = MagicMock()
+            self.assertEqual(excel.select_excel_engine(f), 'calamine')
+            mock_find_spec.return_value = None
+            self.assertEqual(excel.select_excel_engine(f), 'openpyxl')
+            with patch('sheetdrop.excel.STREAMING_THRESHOLD', 0):
+                self.assertEqual(excel.select_excel_engine(f), 'openpyxl_read_only')
+                self.assertEqual(excel.select_excel_engine(f, load_params={'dtype': str}), 'openpyxl')
+
+    def test_read_only_engine_keeps_selected_columns(self):
+        with open(self.path, 'rb') as f, excel.ExcelWorkbook(f, 'openpyxl_read_only') as workbook:
+            dataframe = workbook.parse('first', usecols=['a', 'c', 'missing'])
+            with self.assertRaises(ValueError):
+                workbook.parse('first', dtype=str)
+
+        self.assertEqual(list(dataframe.columns), ['a', 'c'])
+        self.assertEqual(dataframe['a'].tolist(), [1, 2])
+
+    def test_iter_excel_sheets(self):
+        config = MultipleSheetConfiguration(
+            name='Test',
+            excel_engine='openpyxl',
+            schema_columns_only=True,
+            sheets=[
+                SheetConfiguration(sheet='second', save_location='second.parquet', schema={'a': Column(int)}),
+                SheetConfiguration(sheet=0, save_location='first.parquet', schema={'b': Column(str)}),
+            ],
+        )
+        with patch('pandas.ExcelFile', wraps=pd.ExcelFile) as mock_excel_file:
+            sheets = list(fileops.iter_excel_sheets('test_file', config, self.path))
+
+        mock_excel_file.assert_called_once()
+        self.assertEqual([sheet_conf.sheet for sheet_conf, _ in sheets], ['second', 0])
+        self.assertEqual(sheets[0][1].to_dict('list'), {'a': [3]})
+        self.assertEqual(sheets[1][1].to_dict('list'), {'b': ['x', 'y']})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import threading
+import unittest
+
+from sheetdrop.executor import JobExecutor, QueueFullError
+
+
+class TestJobExecutor(unittest.TestCase):
+
+    def test_submit_runs_job(self):
+        executor = JobExecutor("thread", max_workers=2, max_queue_depth=0)
+        future = executor.submit(sum, [1, 2, 3])
+        self.assertEqual(future.result(timeout=5), 6)
+        executor.shutdown()
+        self.assertEqual(executor.pending, 0)
+
+    def test_submit_raises_when_queue_is_full(self):
+        executor = JobExecutor("thread", max_workers=1, max_queue_depth=1)
+        release = threading.Event()
+        running = executor.submit(release.wait)
+        queued = executor.submit(release.wait)
+        with self.assertRaises(QueueFullError):
+            executor.submit(release.wait)
+        release.set()
+        running.result(timeout=5)
+        queued.result(timeout=5)
+        # slots are given back once jobs finish
+        executor.submit(release.wait).result(timeout=5)
+        executor.shutdown()
+
+    def test_invalid_executor_type(self):
+        with self.assertRaises(ValueError):
+            JobExecutor("invalid")
+
+if __name__ == '__main__':
+    unittest.main()
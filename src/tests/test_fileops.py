@@ -1,12 +1,25 @@
+import asyncio
+import hashlib
+import io
+import tempfile
 import unittest
 import os
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch, MagicMock
 import pandas as pd
+import pandera as pa
 import pyarrow
+import pyarrow.dataset
+import pyarrow.parquet
 from sheetdrop import fileops
+from sheetdrop.configuration import Configuration
 
 class TestFileops(unittest.TestCase):
 
+    def setUp(self):
+        # storage clients are cached per process, drop the ones built by other tests
+        fileops.storage_clients.clear()
+
     @patch('builtins.open')
     @patch('pandas.read_excel')
     def test_convert_file_to_dataframe_excel(self, mock_read_excel, mock_open):
@@ -43,6 +56,27 @@ class TestFileops(unittest.TestCase):
         with self.assertRaises(ValueError):
             fileops.convert_file_to_dataframe('test_file', config, 'dummy_path')
 
+    def test_convert_file_to_table(self):
+        config = Configuration(
+            name='Test CSV',
+            load_type='csv',
+            load_params={'parse_options': {'delimiter': ';'}},
+            save_location='output.parquet',
+            schema={'col1': pa.Column(float), 'col2': pa.Column(str), 'col3': pa.Column()},
+            engine='arrow',
+        )
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'input.csv')
+            with open(path, 'w') as f:
+                f.write('col1;col2;col3\n1;2;3\n')
+
+            table = fileops.convert_file_to_table('test_file', config, path)
+
+        # only string columns are typed while reading, the validation coerces the others
+        self.assertEqual(table.schema.field('col1').type, pyarrow.int64())
+        self.assertEqual(table.schema.field('col2').type, pyarrow.string())
+        self.assertEqual(table.schema.field('col3').type, pyarrow.int64())
+
     @patch('os.path.exists')
     @patch('os.makedirs')
     @patch('builtins.open')
@@ -57,6 +91,31 @@ class TestFileops(unittest.TestCase):
         mock_makedirs.assert_called_with('temp')
         self.assertTrue(path.startswith(os.path.join('temp', 'test_file_')))
 
+    def test_stream_temp_file(self):
+        upload = MagicMock()
+        contents = io.BytesIO(b'x' * 10)
+        upload.read = lambda size: asyncio.sleep(0, contents.read(size))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            target = os.path.join(temp_dir, 'test_file_1')
+            with patch('sheetdrop.fileops.new_temp_path', return_value=target):
+                hasher = hashlib.sha256()
+                path = asyncio.run(fileops.stream_temp_file('test_file', upload, max_size=10, chunk_size=3, hasher=hasher))
+            self.assertEqual(path, target)
+            self.assertEqual(hasher.hexdigest(), hashlib.sha256(b'x' * 10).hexdigest())
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'x' * 10)
+
+    def test_stream_temp_file_too_large(self):
+        upload = MagicMock()
+        contents = io.BytesIO(b'x' * 10)
+        upload.read = lambda size: asyncio.sleep(0, contents.read(size))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            target = os.path.join(temp_dir, 'test_file_1')
+            with patch('sheetdrop.fileops.new_temp_path', return_value=target):
+                with self.assertRaises(fileops.FileTooLargeError):
+                    asyncio.run(fileops.stream_temp_file('test_file', upload, max_size=5, chunk_size=3))
+            self.assertFalse(os.path.exists(target))
+
     @patch('os.remove')
     def test_delete_temp_file(self, mock_remove):
         fileops.delete_temp_file('dummy_path')
@@ -78,6 +137,89 @@ class TestFileops(unittest.TestCase):
         mock_gcs_fs.assert_called_once()
         mock_write_deltalake.assert_called_once()
 
+    @patch('deltalake.DeltaTable')
+    @patch('deltalake.write_deltalake')
+    def test_save_table_to_cloud_deltalake_merge(self, mock_write_deltalake, mock_delta_table):
+        table = pyarrow.table({'id': [1, 2], 'value': [3, 4]})
+        fileops.save_table_to_cloud(table, 'local', 'deltalake', '/path/to/table', {'mode': 'merge', 'merge_keys': ['id']})
+        mock_write_deltalake.assert_not_called()
+        merge = mock_delta_table.return_value.merge
+        merge.assert_called_once()
+        self.assertEqual(merge.call_args.kwargs['predicate'], 'target."id" = source."id"')
+        merge.return_value.when_matched_update_all.return_value.when_not_matched_insert_all.return_value.execute.assert_called_once()
+
+    def test_write_delta_table_merge_on_key_with_space(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fileops.write_delta_table(pyarrow.table({'Order Id': [1, 2], 'value': [3, 4]}), temp_dir, mode='merge', merge_keys=['Order Id'])
+            fileops.write_delta_table(pyarrow.table({'Order Id': [2, 5], 'value': [6, 7]}), temp_dir, mode='merge', merge_keys=['Order Id'])
+
+            from deltalake import DeltaTable
+            saved = DeltaTable(temp_dir).to_pandas().sort_values('Order Id')
+        self.assertEqual(saved['Order Id'].tolist(), [1, 2, 5])
+        self.assertEqual(saved['value'].tolist(), [3, 6, 7])
+
+    @patch('deltalake.write_deltalake')
+    def test_save_table_to_cloud_deltalake_replace_where(self, mock_write_deltalake):
+        table = pyarrow.table({'day': ['2024-01-01'], 'value': [1]})
+        fileops.save_table_to_cloud(table, 'local', 'deltalake', '/path/to/table', {'predicate': "day = '2024-01-01'"})
+        self.assertEqual(mock_write_deltalake.call_args.kwargs['mode'], 'overwrite')
+        self.assertEqual(mock_write_deltalake.call_args.kwargs['predicate'], "day = '2024-01-01'")
+
+    def test_write_delta_table_maintenance_every_n_writes(self):
+        from deltalake import DeltaTable
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch.object(DeltaTable, 'vacuum', autospec=True, side_effect=DeltaTable.vacuum) as vacuum, \
+                patch('deltalake.table.TableOptimizer.compact', return_value={}) as compact:
+            for value in range(8):
+                fileops.write_delta_table(pyarrow.table({'id': [value], 'value': [value]}), temp_dir, mode='append', compact_every=4, vacuum_every=3)
+            # merges count as writes too
+            fileops.write_delta_table(pyarrow.table({'id': [7, 8], 'value': [70, 8]}), temp_dir, mode='merge', merge_keys=['id'], compact_every=4, vacuum_every=3)
+
+            self.assertEqual(DeltaTable(temp_dir).to_pandas().sort_values('id')['value'].tolist(), [0, 1, 2, 3, 4, 5, 6, 70, 8])
+        # nothing is old enough to be removed, so vacuum doesn't commit, and still only runs every 3 writes
+        self.assertEqual(vacuum.call_count, 3)
+        self.assertEqual(compact.call_count, 2)
+
+    def test_save_tables_to_cloud_local_parquet(self):
+        tables = [pyarrow.table({'col1': [1, 2]}), pyarrow.table({'col1': [3]})]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'output.parquet')
+            fileops.save_tables_to_cloud(tables, 'local', 'parquet', path)
+            self.assertEqual(pd.read_parquet(path)['col1'].tolist(), [1, 2, 3])
+            self.assertEqual(os.listdir(temp_dir), ['output.parquet'])
+
+    def test_save_tables_to_cloud_discards_output_on_error(self):
+        def tables():
+            yield pyarrow.table({'col1': [1, 2]})
+            raise RuntimeError('invalid chunk')
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'output.parquet')
+            with self.assertRaises(RuntimeError):
+                fileops.save_tables_to_cloud(tables(), 'local', 'parquet', path)
+            self.assertEqual(os.listdir(temp_dir), [])
+
+    def test_save_dataframe_to_cloud_partitioned_parquet(self):
+        df = pd.DataFrame({'region': ['a', 'a', 'a', 'b'], 'value': [1, 2, 3, 4]})
+        params = {'partition_cols': ['region'], 'max_rows_per_file': 2, 'compression': 'zstd'}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'output')
+            fileops.save_dataframe_to_cloud(df, 'local', 'parquet', path, params)
+            self.assertEqual(sorted(os.listdir(path)), ['region=a', 'region=b'])
+            self.assertEqual(len(os.listdir(os.path.join(path, 'region=a'))), 2)
+            metadata = pyarrow.parquet.ParquetFile(os.path.join(path, 'region=b', os.listdir(os.path.join(path, 'region=b'))[0])).metadata
+            self.assertEqual(metadata.row_group(0).column(0).compression, 'ZSTD')
+            result = pyarrow.dataset.dataset(path, partitioning='hive').to_table().to_pandas()
+            self.assertEqual(sorted(result['value'].tolist()), [1, 2, 3, 4])
+
+    def test_save_tables_to_cloud_parquet_dataset(self):
+        tables = [pyarrow.table({'col1': [1, 2]}), pyarrow.table({'col1': [3]})]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'output')
+            fileops.save_tables_to_cloud(tables, 'local', 'parquet', path, {'max_rows_per_file': 2, 'row_group_size': 2})
+            self.assertEqual(len(os.listdir(path)), 2)
+            self.assertEqual(sorted(pyarrow.dataset.dataset(path).to_table()['col1'].to_pylist()), [1, 2, 3])
+
     @patch('awswrangler.s3.to_parquet')
     def test_save_dataframe_to_cloud_s3_parquet(self, mock_to_parquet):
         df = pd.DataFrame()
@@ -90,5 +232,70 @@ class TestFileops(unittest.TestCase):
         fileops.save_dataframe_to_cloud(df, 'local', 'deltalake', '/path/to/table')
         mock_write_deltalake.assert_called_once()
 
+class TestStorageClients(unittest.TestCase):
+
+    def test_client_is_built_once(self):
+        clients = fileops.StorageClients()
+        with patch('pyarrow.fs.LocalFileSystem', wraps=pyarrow.fs.LocalFileSystem) as mock_local_fs:
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                filesystems = list(pool.map(lambda _: clients.get('local'), range(8)))
+        mock_local_fs.assert_called_once()
+        self.assertTrue(all(fs is filesystems[0] for fs in filesystems))
+
+    def test_invalid_provider(self):
+        with self.assertRaises(ValueError):
+            fileops.StorageClients().get('ftp')
+
+    @patch('pyarrow.fs.S3FileSystem')
+    def test_s3_settings(self, mock_s3_fs):
+        settings = fileops.StorageSettings(endpoint='http://localhost:9000', region='us-east-1', access_key='key', secret_key='secret')
+        clients = fileops.StorageClients(settings)
+        clients.get('s3')
+        mock_s3_fs.assert_called_once_with(endpoint_override='http://localhost:9000', region='us-east-1', access_key='key', secret_key='secret')
+        self.assertEqual(clients.storage_options('s3'), {
+            'AWS_ENDPOINT_URL': 'http://localhost:9000',
+            'AWS_REGION': 'us-east-1',
+            'AWS_ACCESS_KEY_ID': 'key',
+            'AWS_SECRET_ACCESS_KEY': 'secret',
+            'AWS_ALLOW_HTTP': 'true',
+        })
+
+    def test_configure_rebuilds_clients_when_settings_change(self):
+        clients = fileops.StorageClients()
+        filesystem = clients.get('local')
+        clients.configure(fileops.StorageSettings())
+        self.assertIs(clients.get('local'), filesystem)
+        clients.configure(fileops.StorageSettings(region='eu-west-1'))
+        self.assertIsNot(clients.get('local'), filesystem)
+
+    def test_unhealthy_client_is_rebuilt(self):
+        clients = fileops.StorageClients(fileops.StorageSettings(health_check_interval=0))
+        broken = MagicMock(spec=pyarrow.fs.FileSystem)
+        broken.get_file_info.side_effect = OSError('connection reset')
+        clients._clients['local'] = (broken, 0)
+        self.assertIsInstance(clients.get('local'), pyarrow.fs.LocalFileSystem)
+
+    def test_client_is_dropped_after_io_error(self):
+        filesystem = fileops.storage_clients.get('local')
+
+        def write(fs):
+            raise OSError('connection reset')
+
+        with self.assertRaises(OSError):
+            fileops.with_storage_client('local', write)
+        self.assertIsNot(fileops.storage_clients.get('local'), filesystem)
+
+    def test_save_table_to_cloud_reuses_filesystem(self):
+        table = pyarrow.table({'col1': [1, 2]})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # spy on the factory rather than pyarrow.fs.LocalFileSystem, which pyarrow checks with isinstance
+            factory = MagicMock(wraps=fileops.storage_clients._factories['local'])
+            with patch.dict(fileops.storage_clients._factories, {'local': factory}):
+                fileops.storage_clients.clear()
+                fileops.save_table_to_cloud(table, 'local', 'parquet', os.path.join(temp_dir, 'first.parquet'))
+                fileops.save_table_to_cloud(table, 'local', 'parquet', os.path.join(temp_dir, 'second.parquet'))
+            factory.assert_called_once()
+            self.assertEqual(pd.read_parquet(os.path.join(temp_dir, 'second.parquet'))['col1'].tolist(), [1, 2])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,208 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import timedelta
+
+import pandas as pd
+from pandera import Check, Column
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from sheetdrop import jobs
+from sheetdrop.configuration import Configuration
+from sheetdrop.db import (create_engine, load_latest_file_status,
+                          load_reusable_file_status, save_file_status)
+from sheetdrop.dbmodels import Base, Job
+from sheetdrop.enums import JobState, Status
+from sheetdrop.executor import JobExecutor
+from sheetdrop.pipeline import PipelineSettings, run_job
+
+
+class TestJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.database_url = f"sqlite:///{os.path.join(self.temp_dir.name, 'test.db')}"
+        self.engine = create_engine(self.database_url)
+        Base.metadata.create_all(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.temp_dir.cleanup()
+
+    def test_claim_job_in_order(self):
+        first = jobs.enqueue_job(self.engine, 'file_a', 'temp/a')
+        second = jobs.enqueue_job(self.engine, 'file_b', 'temp/b')
+
+        self.assertEqual(jobs.claim_job(self.engine, 'worker', 60).job_id, first)
+        job = jobs.claim_job(self.engine, 'worker', 60)
+        self.assertEqual(job.job_id, second)
+        self.assertEqual(job.state, JobState.RUNNING.value)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(jobs.claim_job(self.engine, 'worker', 60))
+        self.assertEqual(jobs.count_jobs(self.engine, JobState.RUNNING), 2)
+        # queued files are marked as in progress along with their job
+        self.assertEqual(load_latest_file_status(self.engine, 'file_a').status, Status.IN_PROGRESS.value)
+
+    def test_load_job_states(self):
+        first = jobs.enqueue_job(self.engine, 'file_a', 'temp/a')
+        second = jobs.enqueue_job(self.engine, 'file_b', 'temp/b')
+        jobs.claim_job(self.engine, 'worker', 60)
+
+        states = jobs.load_job_states(self.engine, [first, second, second + 1])
+
+        self.assertEqual(states, {first: JobState.RUNNING.value, second: JobState.QUEUED.value})
+        self.assertEqual(jobs.load_job_states(self.engine, []), {})
+
+    def test_claim_job_with_expired_lease(self):
+        job_id = jobs.enqueue_job(self.engine, 'file_a', 'temp/a')
+        jobs.claim_job(self.engine, 'crashed_worker', 60)
+        self.assertIsNone(jobs.claim_job(self.engine, 'worker', 60))
+
+        with Session(self.engine) as session:
+            session.execute(update(Job).values(lease_expires_at=jobs.utcnow() - timedelta(seconds=1)))
+            session.commit()
+
+        job = jobs.claim_job(self.engine, 'worker', 60)
+        self.assertEqual(job.job_id, job_id)
+        self.assertEqual(job.worker_id, 'worker')
+        self.assertEqual(job.attempts, 2)
+
+    def test_finish_job_ignores_lost_lease(self):
+        job_id = jobs.enqueue_job(self.engine, 'file_a', 'temp/a')
+        jobs.claim_job(self.engine, 'worker', 60)
+
+        jobs.finish_job(self.engine, 'other_worker', job_id, JobState.DONE)
+        self.assertEqual(jobs.count_jobs(self.engine, JobState.RUNNING), 1)
+        jobs.finish_job(self.engine, 'worker', job_id, JobState.DONE)
+        self.assertEqual(jobs.count_jobs(self.engine, JobState.DONE), 1)
+
+    def test_claim_job_serializes_uploads_of_a_file(self):
+        first = jobs.enqueue_job(self.engine, 'file_a', 'temp/a1')
+        second = jobs.enqueue_job(self.engine, 'file_a', 'temp/a2')
+        other = jobs.enqueue_job(self.engine, 'file_b', 'temp/b')
+
+        self.assertEqual(jobs.claim_job(self.engine, 'worker', 60).job_id, first)
+        # the second upload of file_a waits for the first one
+        self.assertEqual(jobs.claim_job(self.engine, 'worker', 60).job_id, other)
+        self.assertIsNone(jobs.claim_job(self.engine, 'worker', 60))
+        self.assertEqual(jobs.count_active_jobs(self.engine, 'file_a'), (1, 1))
+        jobs.finish_job(self.engine, 'worker', first, JobState.DONE)
+        self.assertEqual(jobs.claim_job(self.engine, 'worker', 60).job_id, second)
+
+    def test_claim_job_waits_for_expired_job_of_a_file(self):
+        first = jobs.enqueue_job(self.engine, 'file_a', 'temp/a1')
+        second = jobs.enqueue_job(self.engine, 'file_a', 'temp/a2')
+        # the worker running the second upload stopped, while the first one was still queued
+        with Session(self.engine) as session:
+            session.execute(update(Job).where(Job.job_id == second)
+                            .values(state=JobState.RUNNING.value, lease_expires_at=jobs.utcnow() - timedelta(seconds=1)))
+            session.commit()
+
+        self.assertEqual(jobs.claim_job(self.engine, 'worker', 60).job_id, second)
+        self.assertIsNone(jobs.claim_job(self.engine, 'worker', 60))
+        jobs.finish_job(self.engine, 'worker', second, JobState.DONE)
+        self.assertEqual(jobs.claim_job(self.engine, 'worker', 60).job_id, first)
+
+    def test_enqueue_job_supersedes_queued_uploads(self):
+        path = os.path.join(self.temp_dir.name, 'a1')
+        open(path, 'w').close()
+        first = jobs.enqueue_job(self.engine, 'file_a', path)
+        jobs.enqueue_job(self.engine, 'file_b', 'temp/b')
+        second = jobs.enqueue_job(self.engine, 'file_a', 'temp/a2', supersede=True)
+
+        self.assertEqual(jobs.count_jobs(self.engine, JobState.SUPERSEDED), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertNotEqual(jobs.claim_job(self.engine, 'worker', 60).job_id, first)
+        self.assertEqual(jobs.claim_job(self.engine, 'worker', 60).job_id, second)
+
+    def test_identical_uploads(self):
+        job_id = jobs.enqueue_job(self.engine, 'file_a', 'temp/a', 'hash_a')
+        jobs.enqueue_job(self.engine, 'file_b', 'temp/b', 'hash_b')
+
+        self.assertEqual(jobs.find_active_job(self.engine, 'file_a', 'hash_a'), job_id)
+        self.assertIsNone(jobs.find_active_job(self.engine, 'file_a', 'hash_b'))
+        jobs.claim_job(self.engine, 'worker', 60)
+        self.assertEqual(jobs.find_active_job(self.engine, 'file_a', 'hash_a'), job_id)
+        jobs.finish_job(self.engine, 'worker', job_id, JobState.DONE)
+        self.assertIsNone(jobs.find_active_job(self.engine, 'file_a', 'hash_a'))
+
+        # the result of the upload is reusable once it succeeds, until another upload is queued
+        save_file_status(self.engine, 'file_a', Status.SUCCESS, content_hash='hash_a')
+        self.assertEqual(load_reusable_file_status(self.engine, 'file_a', 'hash_a').status, Status.SUCCESS.value)
+        self.assertIsNone(load_reusable_file_status(self.engine, 'file_a', 'hash_b'))
+        jobs.enqueue_job(self.engine, 'file_a', 'temp/a')
+        save_file_status(self.engine, 'file_a', Status.SUCCESS)
+        self.assertIsNone(load_reusable_file_status(self.engine, 'file_a', 'hash_a'))
+
+    def test_identical_upload_reuses_its_own_result(self):
+        config = Configuration(
+            name="Test CSV",
+            load_type="csv",
+            load_params={},
+            save_location=os.path.join(self.temp_dir.name, "output.parquet"),
+            schema={"one_to_three": Column(int, [Check.isin([1, 2, 3])])},
+        )
+        path = os.path.join(self.temp_dir.name, "input.csv")
+        pd.DataFrame({"one_to_three": [1, 2]}).to_csv(path, index=False)
+        jobs.enqueue_job(self.engine, 'test_file', path, 'hash_a')
+        job = jobs.claim_job(self.engine, 'worker', 60)
+        # another upload is queued while the first one runs
+        jobs.enqueue_job(self.engine, 'test_file', 'temp/b', 'hash_b')
+
+        run_job(self.database_url, PipelineSettings("local"), 'test_file', config, job.file_path, content_hash=job.content_hash)
+
+        self.assertEqual(load_latest_file_status(self.engine, 'test_file').status, Status.SUCCESS.value)
+        self.assertIsNone(load_reusable_file_status(self.engine, 'test_file', 'hash_b'))
+        self.assertEqual(load_reusable_file_status(self.engine, 'test_file', 'hash_a').status, Status.SUCCESS.value)
+
+    def test_job_worker_processes_queued_file(self):
+        config = Configuration(
+            name="Test CSV",
+            load_type="csv",
+            load_params={},
+            save_location=os.path.join(self.temp_dir.name, "output.parquet"),
+            schema={"one_to_three": Column(int, [Check.isin([1, 2, 3])])},
+        )
+        path = os.path.join(self.temp_dir.name, "input.csv")
+        pd.DataFrame({"one_to_three": [1, 2]}).to_csv(path, index=False)
+        executor = JobExecutor("thread", max_workers=1, max_queue_depth=0)
+        worker = jobs.JobWorker(self.engine, executor, {"test_file": config}, self.database_url, PipelineSettings("local"), poll_interval=0.05)
+
+        jobs.enqueue_job(self.engine, "test_file", path)
+        worker.start()
+        deadline = time.monotonic() + 10
+        while jobs.count_jobs(self.engine, JobState.DONE) == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        worker.stop()
+        executor.shutdown()
+
+        self.assertEqual(jobs.count_jobs(self.engine, JobState.DONE), 1)
+        self.assertEqual(load_latest_file_status(self.engine, "test_file").status, Status.SUCCESS.value)
+
+    def test_job_worker_deletes_file_of_job_it_gives_up(self):
+        executor = JobExecutor("thread", max_workers=1, max_queue_depth=0)
+        # the first claim is already over a limit of no attempts
+        worker = jobs.JobWorker(self.engine, executor, {"test_file": None}, self.database_url, PipelineSettings("local"), max_attempts=0)
+        paths = []
+        for file_id in ["test_file", "missing"]:
+            path = os.path.join(self.temp_dir.name, f"{file_id}.csv")
+            with open(path, "w") as f:
+                f.write("one_to_three\n1\n")
+            jobs.enqueue_job(self.engine, file_id, path)
+            paths.append(path)
+
+        self.assertTrue(worker._claim_next())
+        worker.max_attempts = 3
+        self.assertTrue(worker._claim_next())
+        executor.shutdown()
+
+        self.assertEqual(jobs.count_jobs(self.engine, JobState.FAILED), 2)
+        self.assertEqual(load_latest_file_status(self.engine, "test_file").status, Status.FAILED.value)
+        self.assertEqual(load_latest_file_status(self.engine, "missing").status, Status.FAILED.value)
+        for path in paths:
+            self.assertFalse(os.path.exists(path))
+
+if __name__ == '__main__':
+    unittest.main()
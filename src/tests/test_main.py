@@ -0,0 +1,182 @@
+import asyncio
+import dataclasses
+import importlib
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from pandera import Check, Column
+
+from sheetdrop.configuration import Configuration
+from sheetdrop.dbmodels import Base
+
+VALID_CSV = b"one_to_three\n1\n3\n"
+INVALID_CSV = b"other_column\n1\n"
+
+# settings are read when the application is imported: a database of its own, and jobs left in the queue
+temp_dir = tempfile.TemporaryDirectory()
+environment = patch.dict(os.environ, {
+    "DATABASE_URL": f"sqlite:///{os.path.join(temp_dir.name, 'test.db')}",
+    "DATABASE_SCHEMA": "main",
+    "STORAGE_PROVIDER": "local",
+    "STARTUP_MODE": "lazy",
+    "JOB_RUNNER": "external",
+})
+main = None
+
+
+def setUpModule():
+    global main
+    environment.start()
+    main = importlib.import_module("main")
+    Base.metadata.create_all(main.engine)
+
+
+def tearDownModule():
+    environment.stop()
+    main.engine.dispose()
+    temp_dir.cleanup()
+
+
+class TestEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.config = Configuration(
+            name="Test CSV",
+            load_type="csv",
+            load_params={},
+            save_location=os.path.join(self.temp_dir.name, "output.parquet"),
+            schema={"one_to_three": Column(int, [Check.isin([1, 2, 3])])},
+        )
+        self.configurations = {"test_file": self.config}
+        patchers = [
+            patch.object(main, "configurations", self.configurations),
+            patch("sheetdrop.fileops.TEMP_DIR", self.temp_dir.name),
+            patch("sheetdrop.uploads.UPLOAD_DIR", os.path.join(self.temp_dir.name, "uploads")),
+            patch("sheetdrop.batches.BATCH_DIR", os.path.join(self.temp_dir.name, "batches")),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # not started as a context manager, so the lifespan (database check, status refresher) doesn't run
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        with main.engine.begin() as connection:
+            for table in reversed(Base.metadata.sorted_tables):
+                connection.execute(table.delete())
+        self.temp_dir.cleanup()
+
+    def upload(self, file_id: str, data: bytes):
+        return self.client.post(f"/file/{file_id}", files={"file": ("input.csv", data)})
+
+    def test_upload_is_queued(self):
+        response = self.upload("test_file", VALID_CSV)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["message"], "Validation started in background")
+        self.assertIsInstance(response.json()["job_id"], int)
+
+    def test_identical_upload_in_progress(self):
+        self.configurations["test_file"] = dataclasses.replace(self.config, deduplicate=True)
+        job_id = self.upload("test_file", VALID_CSV).json()["job_id"]
+
+        response = self.upload("test_file", VALID_CSV)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {"message": "Identical to an upload already in progress", "job_id": job_id})
+
+    def test_upload_of_unknown_file(self):
+        self.assertEqual(self.upload("missing", VALID_CSV).status_code, 404)
+
+    def test_upload_too_large(self):
+        self.configurations["test_file"] = dataclasses.replace(self.config, max_file_size=5)
+
+        self.assertEqual(self.upload("test_file", VALID_CSV).status_code, 413)
+
+    def test_upload_failing_precheck(self):
+        response = self.upload("test_file", INVALID_CSV)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertIn("one_to_three", str(response.json()["detail"]))
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+    def test_upload_rejected_when_queue_is_full(self):
+        with patch.object(main.admission, "max_queue_depth", 0):
+            response = self.upload("test_file", VALID_CSV)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response.headers)
+
+    def test_resumable_upload(self):
+        response = self.client.post("/file/test_file/uploads")
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.json()["upload_id"]
+        self.assertEqual(self.client.put(f"/file/test_file/uploads/{upload_id}/chunks/2", content=VALID_CSV[8:]).status_code, 200)
+
+        response = self.client.post(f"/file/test_file/uploads/{upload_id}/commit")
+        self.assertEqual(response.status_code, 409)
+
+        self.assertEqual(self.client.put(f"/file/test_file/uploads/{upload_id}/chunks/1", content=VALID_CSV[:8]).status_code, 200)
+        response = self.client.get(f"/file/test_file/uploads/{upload_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["size"], len(VALID_CSV))
+
+        response = self.client.post(f"/file/test_file/uploads/{upload_id}/commit")
+        self.assertEqual(response.status_code, 202)
+        self.assertIsInstance(response.json()["job_id"], int)
+        self.assertEqual(self.client.post(f"/file/test_file/uploads/{upload_id}/commit").status_code, 404)
+        self.assertEqual(self.client.post("/file/missing/uploads").status_code, 404)
+
+    def test_batch_archive(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("test_file.csv", VALID_CSV)
+            archive.writestr("missing.csv", VALID_CSV)
+
+        response = self.client.post("/batches", files={"archive": ("batch.zip", buffer.getvalue())})
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual([entry["status_code"] for entry in response.json()["entries"]], [202, 404])
+        response = self.client.get(f"/batches/{response.json()['batch_id']}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["state"], "in_progress")
+        self.assertEqual(self.client.get("/batches/missing").status_code, 404)
+        self.assertEqual(self.client.post("/batches", files={"archive": ("batch.zip", b"not a zip")}).status_code, 400)
+
+    def test_events_start_with_the_current_status(self):
+        self.upload("test_file", INVALID_CSV)
+
+        async def first_event():
+            # the stream never ends, so only its first event is read
+            response = await main.get_file_events("test_file")
+            events = response.body_iterator
+            try:
+                return response, await anext(events)
+            finally:
+                await events.aclose()
+
+        response, event = asyncio.run(first_event())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.media_type, "text/event-stream")
+        self.assertTrue(event.startswith("event: status\n"))
+        self.assertIn('"status": "failed"', event)
+
+    def test_metrics(self):
+        self.upload("test_file", VALID_CSV)
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn('sheetdrop_uploads_total{file_id="test_file",outcome="queued"}', response.text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import pickle
+import time
+import unittest
+
+from sheetdrop.metrics import MetricsRegistry, StageTimer, StageTiming
+
+
+class TestStageTimer(unittest.TestCase):
+
+    def test_nested_stages_only_count_for_the_inner_stage(self):
+        timer = StageTimer("test_file")
+
+        with timer.stage("save"):
+            time.sleep(0.02)
+            with timer.stage("validate") as timing:
+                timing.rows = 10
+                time.sleep(0.05)
+
+        stages = timer.as_dict()
+        self.assertGreaterEqual(stages["validate"]["seconds"], 0.05)
+        self.assertLess(stages["save"]["seconds"], 0.05)
+        self.assertEqual(stages["validate"]["rows"], 10)
+        self.assertGreater(stages["save"]["peak_memory"], 0)
+
+    def test_repeated_stages_are_added_up(self):
+        timer = StageTimer("test_file")
+        timer.add("load", StageTiming(bytes=100))
+
+        chunks = list(timer.iterate("load", [[1, 2], [3]]))
+
+        self.assertEqual(chunks, [[1, 2], [3]])
+        self.assertEqual(timer.as_dict()["load"]["rows"], 3)
+        self.assertEqual(timer.as_dict()["load"]["bytes"], 100)
+
+    def test_stage_is_timed_when_it_fails(self):
+        timer = StageTimer("test_file")
+
+        with self.assertRaises(ValueError):
+            with timer.stage("load"):
+                raise ValueError("bad file")
+
+        self.assertIn("load", timer.as_dict())
+
+    def test_pickle(self):
+        timer = StageTimer("test_file")
+        with timer.stage("load"):
+            pass
+        timer.outcome = "success"
+
+        copy = pickle.loads(pickle.dumps(timer))
+
+        self.assertEqual(copy.as_dict(), timer.as_dict())
+        self.assertEqual(copy.outcome, "success")
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_render(self):
+        registry = MetricsRegistry(buckets=(0.1, 1))
+        timer = StageTimer('file "a"')
+        timer.add("load", StageTiming(seconds=0.5, rows=3, bytes=20))
+        timer.outcome = "success"
+
+        registry.record(timer, "sheetdrop_files_processed_total")
+        output = registry.render()
+
+        labels = 'file_id="file \\"a\\"",stage="load"'
+        self.assertIn("# TYPE sheetdrop_stage_duration_seconds histogram", output)
+        self.assertIn(f'sheetdrop_stage_duration_seconds_bucket{{{labels},le="0.1"}} 0', output)
+        self.assertIn(f'sheetdrop_stage_duration_seconds_bucket{{{labels},le="1"}} 1', output)
+        self.assertIn(f'sheetdrop_stage_duration_seconds_bucket{{{labels},le="+Inf"}} 1', output)
+        self.assertIn(f"sheetdrop_stage_duration_seconds_count{{{labels}}} 1", output)
+        self.assertIn(f"sheetdrop_stage_rows_total{{{labels}}} 3", output)
+        self.assertIn(f"sheetdrop_stage_bytes_total{{{labels}}} 20", output)
+        self.assertIn('sheetdrop_files_processed_total{file_id="file \\"a\\"",outcome="success"} 1', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
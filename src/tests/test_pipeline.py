@@ -0,0 +1,302 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+from pandera import Check, Column
+
+from sheetdrop import pipeline, reports
+from sheetdrop.configuration import (Configuration, MultipleSheetConfiguration,
+                                     SheetConfiguration)
+from sheetdrop.db import (create_engine, file_status_dict,
+                          load_latest_file_status)
+from sheetdrop.dbmodels import Base
+from sheetdrop.enums import Status
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.report_dir = tempfile.TemporaryDirectory()
+        report_dir_patch = patch.object(reports, "REPORT_DIR", self.report_dir.name)
+        report_dir_patch.start()
+        self.addCleanup(report_dir_patch.stop)
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.temp_dir.name, 'test.db')}")
+        Base.metadata.create_all(self.engine)
+        self.settings = pipeline.PipelineSettings("local", sheet_workers=2)
+        self.config = Configuration(
+            name="Test CSV",
+            load_type="csv",
+            load_params={},
+            save_location=os.path.join(self.temp_dir.name, "output.parquet"),
+            schema={
+                "small_values": Column(float, [Check.less_than(100)]),
+                "one_to_three": Column(int, [Check.isin([1, 2, 3])]),
+            },
+        )
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.temp_dir.cleanup()
+        self.report_dir.cleanup()
+
+    def write_input(self, dataframe: pd.DataFrame) -> str:
+        path = os.path.join(self.temp_dir.name, "input.csv")
+        dataframe.to_csv(path, index=False)
+        return path
+
+    def test_process_file_success(self):
+        path = self.write_input(pd.DataFrame({"small_values": [1.5, 2.5], "one_to_three": [1, 3]}))
+
+        pipeline.process_file(self.engine, self.settings, "test_file", self.config, path)
+
+        status = load_latest_file_status(self.engine, "test_file")
+        self.assertEqual(status.status, Status.SUCCESS.value)
+        self.assertEqual(len(pd.read_parquet(self.config.save_location)), 2)
+        self.assertFalse(os.path.exists(path))
+
+    def test_process_file_saves_stage_timings(self):
+        path = self.write_input(pd.DataFrame({"small_values": [1.5, 2.5], "one_to_three": [1, 3]}))
+
+        timer = pipeline.process_file(self.engine, self.settings, "test_file", self.config, path)
+
+        self.assertEqual(timer.outcome, Status.SUCCESS.value)
+        stages = file_status_dict(load_latest_file_status(self.engine, "test_file"))["stage_timings"]
+        self.assertEqual(list(stages), ["load", "validate", "status_db", "save"])
+        self.assertEqual(stages["load"]["rows"], 2)
+        self.assertGreater(stages["load"]["bytes"], 0)
+
+    def test_precheck_file(self):
+        path = self.write_input(pd.DataFrame({"small_values": [1000.0, 2.0, 3.0], "one_to_three": [7, 1, 2]}))
+        # checks are left to the full validation
+        self.assertEqual(pipeline.precheck_file("test_file", self.config, path, rows=2), [])
+
+        path = self.write_input(pd.DataFrame({"small_values": [1.0, "abc", 3.0], "other": [1, 2, 3]}))
+        errors = pipeline.precheck_file("test_file", self.config, path, rows=2)
+        self.assertEqual(errors[0], "The first 2 rows don't match the schema")
+        self.assertTrue(any(error.startswith("small_values") and "'abc'" in error for error in errors))
+        self.assertTrue(any("one_to_three" in error for error in errors))
+
+    def test_precheck_file_reads_only_first_rows(self):
+        path = self.write_input(pd.DataFrame({"small_values": [1.0, 2.0, "abc"], "one_to_three": [1, 2, 3]}))
+        self.assertEqual(pipeline.precheck_file("test_file", self.config, path, rows=2), [])
+
+    def test_precheck_file_that_cannot_be_read(self):
+        path = os.path.join(self.temp_dir.name, "input.xlsx")
+        with open(path, "wb") as f:
+            f.write(b"not a workbook")
+
+        errors = pipeline.precheck_file("test_file", self.multiple_sheet_config(), path, rows=2)
+
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith("The file could not be read"))
+
+    def test_process_file_validation_failure(self):
+        path = self.write_input(pd.DataFrame({"small_values": [1000.0], "one_to_three": [7]}))
+
+        pipeline.process_file(self.engine, self.settings, "test_file", self.config, path)
+
+        status = load_latest_file_status(self.engine, "test_file")
+        self.assertEqual(status.status, Status.FAILED.value)
+        details = [detail.status_detail for detail in status.status_details]
+        self.assertEqual(details, [
+            "2 failure cases found",
+            "small_values / less_than(100): 1 failed, e.g. 1000.0 (row 0)",
+            "one_to_three / isin([1, 2, 3]): 1 failed, e.g. 7.0 (row 0)",
+        ])
+        report = pd.read_parquet(status.report_path)
+        self.assertEqual(report["failure_case"].tolist(), ["1000.0", "7.0"])
+        self.assertFalse(os.path.exists(self.config.save_location))
+
+    def test_process_file_with_arrow_engine(self):
+        self.config.engine = "arrow"
+        path = self.write_input(pd.DataFrame({"small_values": [1.5, 2.5], "one_to_three": [1, 3]}))
+
+        pipeline.process_file(self.engine, self.settings, "test_file", self.config, path)
+
+        status = load_latest_file_status(self.engine, "test_file")
+        self.assertEqual(status.status, Status.SUCCESS.value)
+        self.assertEqual(pd.read_parquet(self.config.save_location)["small_values"].tolist(), [1.5, 2.5])
+
+    def test_process_file_with_arrow_engine_saves_coerced_columns(self):
+        self.config.engine = "arrow"
+        # columns matched by regex aren't typed by the reader, so they are only coerced by the validation
+        self.config.schema = {**self.config.schema, "amount_.*": Column(float, regex=True)}
+        path = self.write_input(pd.DataFrame({"small_values": [1.5, 2.5], "one_to_three": [1, 3], "amount_eur": [10, 20]}))
+
+        pipeline.process_file(self.engine, self.settings, "test_file", self.config, path)
+
+        saved = pd.read_parquet(self.config.save_location)
+        self.assertEqual(saved["amount_eur"].dtype, "float64")
+        self.assertEqual(saved["amount_eur"].tolist(), [10.0, 20.0])
+        self.assertEqual(saved["one_to_three"].dtype, "int64")
+
+    def test_process_file_with_arrow_engine_validation_failure(self):
+        self.config.engine = "arrow"
+        path = self.write_input(pd.DataFrame({"small_values": [1000.0], "one_to_three": [7]}))
+
+        pipeline.process_file(self.engine, self.settings, "test_file", self.config, path)
+
+        status = load_latest_file_status(self.engine, "test_file")
+        self.assertEqual(status.status, Status.FAILED.value)
+        self.assertFalse(os.path.exists(self.config.save_location))
+
+    def test_process_file_with_arrow_engine_bad_numeric_value(self):
+        self.config.engine = "arrow"
+        path = os.path.join(self.temp_dir.name, "input.csv")
+        with open(path, "w") as f:
+            f.write("small_values,one_to_three\n1.5,1\nabc,3\n")
+
+        pipeline.process_file(self.engine, self.settings, "test_file", self.config, path)
+
+        status = load_latest_file_status(self.engine, "test_file")
+        self.assertEqual(status.status, Status.FAILED.value)
+        self.assertIsNotNone(status.report_path)
+        self.assertIn("abc", pd.read_parquet(status.report_path)["failure_case"].tolist())
+        self.assertFalse(os.path.exists(self.config.save_location))
+
+    def test_process_file_with_fast_validation(self):
+        self.config.validation_engine = "fast"
+        path = self.write_input(pd.DataFrame({"small_values": [1.5, 1000.0], "one_to_three": [1, 7]}))
+
+        pipeline.process_file(self.engine, self.settings, "test_file", self.config, path)
+
+        status = load_latest_file_status(self.engine, "test_file")
+        self.assertEqual(status.status, Status.FAILED.value)
+        details = "\n".join(detail.status_detail for detail in status.status_details)
+        self.assertIn("1000.0", details)
+        self.assertIn("one_to_three", details)
+
+    def test_process_file_in_chunks(self):
+        self.config.chunk_size = 2
+        path = self.write_input(pd.DataFrame({"small_values": [1.5, 2.5, 3.5, 4.5, 5.5], "one_to_three": [1, 3, 2, 1, 2]}))
+
+        pipeline.process_file(self.engine, self.settings, "test_file", self.config, path)
+
+        status = load_latest_file_status(self.engine, "test_file")
+        self.assertEqual(status.status, Status.SUCCESS.value)
+        self.assertEqual(pd.read_parquet(self.config.save_location)["one_to_three"].tolist(), [1, 3, 2, 1, 2])
+
+    def test_process_file_in_chunks_with_types_changing_between_chunks(self):
+        self.config.chunk_size = 2
+        self.config.schema = {**self.config.schema, "comment": Column(str, nullable=True)}
+        # the first chunk reads as integers and has no comments
+        path = os.path.join(self.temp_dir.name, "input.csv")
+        with open(path, "w") as f:
+            f.write("small_values,one_to_three,comment\n1,1,\n2,3,\n3.5,2,late\n")
+
+        pipeline.process_file(self.engine, self.settings, "test_file", self.config, path)
+
+        status = load_latest_file_status(self.engine, "test_file")
+        self.assertEqual(status.status, Status.SUCCESS.value)
+        saved = pd.read_parquet(self.config.save_location)
+        self.assertEqual(saved["comment"].tolist(), [None, None, "late"])
+        self.assertEqual(saved["small_values"].tolist(), [1.0, 2.0, 3.5])
+
+    def test_process_file_in_chunks_reports_failures_of_every_chunk(self):
+        self.config.chunk_size = 2
+        path = self.write_input(pd.DataFrame({"small_values": [1000.0, 2.5, 3.5, 4.5, 5.5], "one_to_three": [1, 3, 2, 1, 7]}))
+
+        pipeline.process_file(self.engine, self.settings, "test_file", self.config, path)
+
+        status = load_latest_file_status(self.engine, "test_file")
+        self.assertEqual(status.status, Status.FAILED.value)
+        details = "\n".join(detail.status_detail for detail in status.status_details)
+        self.assertIn("1000.0", details)
+        self.assertIn("7", details)
+        self.assertEqual(os.listdir(self.temp_dir.name), ["test.db"])
+
+    def write_workbook(self, sheets: dict[str, pd.DataFrame]) -> str:
+        path = os.path.join(self.temp_dir.name, "input.xlsx")
+        with pd.ExcelWriter(path) as writer:
+            for name, dataframe in sheets.items():
+                dataframe.to_excel(writer, sheet_name=name, index=False)
+        return path
+
+    def multiple_sheet_config(self) -> MultipleSheetConfiguration:
+        return MultipleSheetConfiguration(
+            name="Test Excel",
+            sheets=[
+                SheetConfiguration(
+                    sheet=name,
+                    save_location=os.path.join(self.temp_dir.name, f"{name}.parquet"),
+                    schema={"one_to_three": Column(int, [Check.isin([1, 2, 3])])},
+                )
+                for name in ("january", "february", "march")
+            ],
+        )
+
+    def test_process_file_multiple_sheets(self):
+        path = self.write_workbook({name: pd.DataFrame({"one_to_three": [1, 2]}) for name in ("january", "february", "march")})
+
+        pipeline.process_file(self.engine, self.settings, "test_file", self.multiple_sheet_config(), path)
+
+        status = load_latest_file_status(self.engine, "test_file")
+        self.assertEqual(status.status, Status.SUCCESS.value)
+        for name in ("january", "february", "march"):
+            self.assertEqual(len(pd.read_parquet(os.path.join(self.temp_dir.name, f"{name}.parquet"))), 2)
+
+    def test_process_file_multiple_sheets_partial_success(self):
+        path = self.write_workbook({
+            "january": pd.DataFrame({"one_to_three": [1, 2]}),
+            "february": pd.DataFrame({"one_to_three": [7]}),
+            "march": pd.DataFrame({"one_to_three": [3]}),
+        })
+
+        pipeline.process_file(self.engine, self.settings, "test_file", self.multiple_sheet_config(), path)
+
+        status = load_latest_file_status(self.engine, "test_file")
+        details = [detail.status_detail for detail in status.status_details]
+        self.assertEqual(status.status, Status.PARTIAL_SUCCESS.value)
+        self.assertIn("january: success", details)
+        self.assertIn("february: failed", details)
+        self.assertIn("february: one_to_three / isin([1, 2, 3]): 1 failed, e.g. 7 (row 0)", details)
+        self.assertEqual(pd.read_parquet(status.report_path)["sheet"].tolist(), ["february"])
+        self.assertIn("march: success", details)
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir.name, "february.parquet")))
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir.name, "march.parquet")))
+
+    def test_process_file_multiple_sheets_missing_sheet(self):
+        path = self.write_workbook({name: pd.DataFrame({"one_to_three": [1, 2]}) for name in ("january", "march")})
+
+        pipeline.process_file(self.engine, self.settings, "test_file", self.multiple_sheet_config(), path)
+
+        status = load_latest_file_status(self.engine, "test_file")
+        details = [detail.status_detail for detail in status.status_details]
+        self.assertEqual(status.status, Status.PARTIAL_SUCCESS.value)
+        self.assertEqual(details[:2], ["january: success", "february: failed"])
+        self.assertTrue(details[2].startswith("february: The sheet could not be read"))
+        self.assertIn("march: success", details)
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir.name, "march.parquet")))
+
+    def test_process_file_multiple_sheets_unexpected_error(self):
+        path = self.write_workbook({name: pd.DataFrame({"one_to_three": [1, 2]}) for name in ("january", "february", "march")})
+        save = pipeline.save_dataframe_to_cloud
+
+        def save_or_fail(dataframe, provider, save_type, save_location, save_params=None):
+            if save_location.endswith("february.parquet"):
+                raise RuntimeError("storage unavailable")
+            save(dataframe, provider, save_type, save_location, save_params)
+
+        with patch.object(pipeline, "save_dataframe_to_cloud", side_effect=save_or_fail):
+            pipeline.process_file(self.engine, self.settings, "test_file", self.multiple_sheet_config(), path)
+
+        status = load_latest_file_status(self.engine, "test_file")
+        details = [detail.status_detail for detail in status.status_details]
+        self.assertEqual(status.status, Status.PARTIAL_SUCCESS.value)
+        self.assertIn("february: failed", details)
+        self.assertIn("february: Unexpected error: RuntimeError('storage unavailable')", details)
+        self.assertIn("january: success", details)
+        self.assertIn("march: success", details)
+
+    def test_process_file_multiple_sheets_failure(self):
+        path = self.write_workbook({name: pd.DataFrame({"one_to_three": [9]}) for name in ("january", "february", "march")})
+
+        pipeline.process_file(self.engine, self.settings, "test_file", self.multiple_sheet_config(), path)
+
+        self.assertEqual(load_latest_file_status(self.engine, "test_file").status, Status.FAILED.value)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from sheetdrop import reports
+
+
+def failure_cases(rows: list[tuple]) -> pd.DataFrame:
+    # like pandera's, with object columns when values of different types are mixed
+    return pd.DataFrame(rows, columns=reports.REPORT_COLUMNS, dtype=object)
+
+
+class TestReports(unittest.TestCase):
+
+    def test_summarize_failure_cases(self):
+        cases = failure_cases(
+            [("Column", "amount", "less_than(100)", 0, 100 + i, i) for i in range(1000)]
+            + [("Column", "code", "str_matches('^[a-z]+$')", 0, "ABC", 3)]
+            + [("DataFrameSchema", None, "column_in_dataframe", None, "missing", None)]
+        )
+
+        summary = reports.summarize_failure_cases(cases, samples=2)
+
+        self.assertEqual(summary, [
+            "1002 failure cases found",
+            "amount / less_than(100): 1000 failed, e.g. 100 (row 0), 101 (row 1)",
+            "code / str_matches('^[a-z]+$'): 1 failed, e.g. 'ABC' (row 3)",
+            "- / column_in_dataframe: 1 failed, e.g. 'missing' (row None)",
+        ])
+
+    def test_summarize_failure_cases_by_sheet(self):
+        cases = failure_cases([("Column", "amount", "less_than(100)", 0, 500, 0)] * 2)
+        cases["sheet"] = ["january", "february"]
+
+        summary = reports.summarize_failure_cases(cases)
+
+        self.assertEqual(summary[1:], [
+            "january / amount / less_than(100): 1 failed, e.g. 500 (row 0)",
+            "february / amount / less_than(100): 1 failed, e.g. 500 (row 0)",
+        ])
+
+    def test_write_failure_report(self):
+        cases = failure_cases([
+            ("Column", "amount", "less_than(100)", 0, 500.5, 1),
+            ("Column", "code", "not_nullable", None, None, 2),
+            ("Column", "code", "str_length(1, 3)", 1, "ABCD", 3),
+        ])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "report.parquet")
+            reports.write_failure_report(cases, path)
+            report = pd.read_parquet(path)
+
+            self.assertEqual(os.listdir(temp_dir), ["report.parquet"])
+        self.assertEqual(report.columns.tolist(), reports.REPORT_COLUMNS)
+        self.assertEqual(report["failure_case"].fillna("null").tolist(), ["500.5", "null", "ABCD"])
+        self.assertEqual(report["check_number"].fillna(-1).tolist(), [0, -1, 1])
+
+if __name__ == '__main__':
+    unittest.main()
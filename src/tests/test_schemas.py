@@ -0,0 +1,57 @@
+import pickle
+import re
+import unittest
+
+import pandas as pd
+import pyarrow
+from pandera import Check, Column
+
+from sheetdrop import schemas
+
+
+class TestSchemas(unittest.TestCase):
+
+    def test_compile_schema(self):
+        schema = {
+            'small_values': Column(float, [Check.less_than(100)]),
+            'phone_number': Column(str, [Check.str_matches(r'^[a-z0-9-]+$')]),
+        }
+
+        compiled = schemas.compile_schema(schema)
+
+        self.assertTrue(compiled.usecols('small_values'))
+        self.assertFalse(compiled.usecols('other'))
+        self.assertEqual(compiled.read_dtypes, {'phone_number': str})
+        self.assertEqual(compiled.read_arrow_types, {'phone_number': pyarrow.string()})
+        self.assertEqual(compiled.arrow_types, {'small_values': pyarrow.float64(), 'phone_number': pyarrow.string()})
+        check = compiled.dataframe_schema.columns['phone_number'].checks[0]
+        self.assertIsInstance(check._check_kwargs['pattern'], re.Pattern)
+        # the configuration's own schema is left untouched
+        self.assertIsInstance(schema['phone_number'].checks[0]._check_kwargs['pattern'], str)
+        # compiled schemas travel with configurations to worker processes
+        pickle.loads(pickle.dumps(compiled))
+
+    def test_compiled_schema_validates(self):
+        compiled = schemas.compile_schema({'phone_number': Column(str, [Check.str_matches(r'^[a-z0-9-]+$')])})
+        dataframe = pd.DataFrame({'phone_number': ['a-1', 'B']})
+
+        with self.assertRaises(Exception) as context:
+            compiled.dataframe_schema.validate(dataframe, lazy=True)
+
+        self.assertEqual(context.exception.failure_cases['failure_case'].tolist(), ['B'])
+
+    def test_compile_schema_with_regex_columns(self):
+        compiled = schemas.compile_schema({'value_.*': Column(int, regex=True)})
+
+        self.assertIsNone(compiled.usecols)
+        self.assertEqual(compiled.arrow_types, {})
+
+    def test_arrow_type_from_pandera(self):
+        self.assertEqual(schemas.arrow_type_from_pandera(Column(int)), pyarrow.int64())
+        self.assertEqual(schemas.arrow_type_from_pandera(Column('Int64')), pyarrow.int64())
+        self.assertEqual(schemas.arrow_type_from_pandera(Column('string')), pyarrow.string())
+        self.assertIsNone(schemas.arrow_type_from_pandera(Column('category')))
+        self.assertIsNone(schemas.arrow_type_from_pandera(Column()))
+
+if __name__ == '__main__':
+    unittest.main()
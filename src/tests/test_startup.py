@@ -0,0 +1,79 @@
+import importlib
+import json
+import subprocess
+import sys
+import unittest
+from unittest.mock import patch
+
+from sheetdrop.lazy import LazyModule, lazy_import
+
+# seconds the application modules may take to import, with room for slow CI machines (see benchmarks.bench_startup)
+IMPORT_BUDGET = 3.0
+
+STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import sheetdrop.fileops, sheetdrop.jobs, sheetdrop.pipeline
+from sheetdrop.configuration import ConfigurationRegistry
+configurations = ConfigurationRegistry("file_definitions")
+seconds = time.perf_counter() - start
+from sheetdrop.lazy import heavy_modules_loaded
+result = {"seconds": seconds, "heavy_modules": heavy_modules_loaded(), "definition_imported": "file_definitions.sample" in sys.modules}
+configurations["sample"]
+result["loaded"] = heavy_modules_loaded()
+print(json.dumps(result))
+"""
+
+
+def run_python(code: str) -> str:
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+
+
+class TestLazyImport(unittest.TestCase):
+
+    def test_module_is_imported_on_first_use(self):
+        output = run_python(
+            "import sys; from sheetdrop.lazy import lazy_import; fractions = lazy_import('fractions'); "
+            "before = 'fractions' in sys.modules; print(before, fractions.Fraction(1, 2), 'fractions' in sys.modules)"
+        )
+        self.assertEqual(output.split(), ["False", "1/2", "True"])
+
+    def test_patches_are_seen_through_the_proxy(self):
+        module = LazyModule("json")
+        with patch("json.dumps", return_value="patched"):
+            self.assertEqual(module.dumps({}), "patched")
+        self.assertEqual(module.dumps({}), "{}")
+
+    def test_submodules_are_imported_when_the_package_already_was(self):
+        importlib.import_module("xml")
+        module = lazy_import("xml")
+
+        self.assertIsInstance(module, LazyModule)
+        self.assertEqual(module.dom.__name__, "xml.dom")
+
+    def test_pyarrow_submodules_after_pandas(self):
+        # pandas imports pyarrow, but not pyarrow.csv or pyarrow.fs, which fileops uses through its proxy
+        output = run_python(
+            "import pandas; from sheetdrop import fileops; "
+            "print(fileops.pyarrow.csv.ReadOptions is not None, fileops.pyarrow.fs.LocalFileSystem is not None)"
+        )
+        self.assertEqual(output.split(), ["True", "True"])
+
+    def test_missing_package_fails_right_away(self):
+        with self.assertRaises(ModuleNotFoundError):
+            lazy_import("sheetdrop_missing_package.module")
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_startup_defers_heavy_imports_and_definitions(self):
+        result = json.loads(run_python(STARTUP_PROBE).splitlines()[-1])
+
+        self.assertEqual(result["heavy_modules"], [])
+        self.assertFalse(result["definition_imported"])
+        self.assertLess(result["seconds"], IMPORT_BUDGET)
+        self.assertIn("pandera", result["loaded"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from sheetdrop import db
+from sheetdrop.dbmodels import Base
+from sheetdrop.enums import Status
+from sheetdrop.status_cache import StatusCache
+
+
+class TestStatusCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.engine = db.create_engine(f"sqlite:///{os.path.join(self.temp_dir.name, 'test.db')}")
+        Base.metadata.create_all(self.engine)
+        self.cache = StatusCache(self.engine, ttl=60, max_entries=2)
+        listeners_patch = patch.object(db, "status_listeners", [self.cache.put])
+        listeners_patch.start()
+        self.addCleanup(listeners_patch.stop)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.temp_dir.cleanup()
+
+    def test_get_is_served_from_memory(self):
+        db.save_file_status(self.engine, "test_file", Status.FAILED, ["bad value"])
+
+        with patch("sheetdrop.status_cache.load_latest_file_status") as load:
+            status = asyncio.run(self.cache.get("test_file"))
+
+        load.assert_not_called()
+        self.assertEqual(status["status"], Status.FAILED.value)
+        self.assertEqual(status["status_details"], [{"status_detail": "bad value"}])
+
+    def test_get_loads_missing_and_expired_statuses(self):
+        self.assertIsNone(asyncio.run(self.cache.get("test_file")))
+        # saved by another process, without going through the cache
+        with patch.object(db, "status_listeners", []):
+            db.save_file_status(self.engine, "test_file", Status.SUCCESS)
+        self.assertIsNone(asyncio.run(self.cache.get("test_file")))
+
+        self.cache.ttl = 0
+
+        self.assertEqual(asyncio.run(self.cache.get("test_file"))["status"], Status.SUCCESS.value)
+
+    def test_least_recently_used_statuses_are_evicted(self):
+        for file_id in ("first", "second", "third"):
+            db.save_file_status(self.engine, file_id, Status.SUCCESS)
+
+        self.assertEqual(list(self.cache._entries), ["second", "third"])
+
+    def test_subscribers_receive_changes(self):
+        async def follow():
+            queue = self.cache.subscribe("test_file")
+            try:
+                await asyncio.to_thread(db.save_file_status, self.engine, "test_file", Status.IN_PROGRESS)
+                # saved by another process, then found by refresh
+                with patch.object(db, "status_listeners", []):
+                    db.save_file_status(self.engine, "test_file", Status.SUCCESS)
+                await self.cache.refresh()
+                return [(await asyncio.wait_for(queue.get(), 1))["status"] for _ in range(2)]
+            finally:
+                self.cache.unsubscribe("test_file", queue)
+
+        statuses = asyncio.run(follow())
+
+        self.assertEqual(statuses, [Status.IN_PROGRESS.value, Status.SUCCESS.value])
+        self.assertEqual(self.cache._subscribers, {})
+
+if __name__ == '__main__':
+    unittest.main()
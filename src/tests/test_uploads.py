@@ -0,0 +1,86 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from sheetdrop import fileops, uploads
+
+
+async def body(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+class TestUploads(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        patchers = [
+            patch('sheetdrop.uploads.UPLOAD_DIR', os.path.join(self.temp_dir.name, 'uploads')),
+            patch('sheetdrop.fileops.TEMP_DIR', self.temp_dir.name),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_resumable_upload(self):
+        upload_id = uploads.create_upload('test_file')
+        asyncio.run(uploads.write_chunk(upload_id, 2, body(b'world')))
+        # a chunk that failed halfway is not kept
+        with self.assertRaises(RuntimeError):
+            asyncio.run(uploads.write_chunk(upload_id, 1, self.failing_body()))
+        self.assertEqual(uploads.list_chunks(upload_id), {2: 5})
+        with self.assertRaises(uploads.IncompleteUploadError):
+            uploads.assemble_upload('test_file', upload_id)
+
+        asyncio.run(uploads.write_chunk(upload_id, 1, body(b'hello ', b'big ')))
+        self.assertEqual(uploads.list_chunks(upload_id), {1: 10, 2: 5})
+        hasher = hashlib.sha256()
+        path = uploads.assemble_upload('test_file', upload_id, hasher, chunk_size=3)
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'hello big world')
+        self.assertEqual(hasher.hexdigest(), hashlib.sha256(b'hello big world').hexdigest())
+        # an upload can only be committed once
+        with self.assertRaises(uploads.UploadNotFoundError):
+            uploads.assemble_upload('test_file', upload_id)
+
+    def test_upload_size_limit(self):
+        upload_id = uploads.create_upload('test_file')
+        asyncio.run(uploads.write_chunk(upload_id, 1, body(b'x' * 6), max_size=10))
+        with self.assertRaises(fileops.FileTooLargeError):
+            asyncio.run(uploads.write_chunk(upload_id, 2, body(b'x' * 6), max_size=10))
+        # a chunk sent again replaces the previous one
+        asyncio.run(uploads.write_chunk(upload_id, 1, body(b'x' * 10), max_size=10))
+        self.assertEqual(uploads.list_chunks(upload_id), {1: 10})
+
+    def test_upload_of_another_file(self):
+        upload_id = uploads.create_upload('test_file')
+        with self.assertRaises(uploads.UploadNotFoundError):
+            uploads.load_upload('other_file', upload_id)
+        with self.assertRaises(uploads.UploadNotFoundError):
+            uploads.load_upload('test_file', '../reports')
+        uploads.delete_upload('test_file', upload_id)
+        with self.assertRaises(uploads.UploadNotFoundError):
+            uploads.load_upload('test_file', upload_id)
+
+    def test_expire_uploads(self):
+        upload_id = uploads.create_upload('test_file')
+        uploads.expire_uploads(3600)
+        uploads.load_upload('test_file', upload_id)
+        os.utime(uploads.upload_path(upload_id), (0, 0))
+        uploads.expire_uploads(3600)
+        with self.assertRaises(uploads.UploadNotFoundError):
+            uploads.load_upload('test_file', upload_id)
+
+    async def failing_body(self):
+        yield b'hel'
+        raise RuntimeError('connection lost')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import pickle
+import unittest
+
+import pandas as pd
+import pandera as pa
+from pandera import Check, Column
+
+from sheetdrop import validation
+from sheetdrop.schemas import compile_schema
+
+
+class TestFastValidator(unittest.TestCase):
+
+    def assert_same_failure_cases(self, schema: dict[str, Column], dataframe: pd.DataFrame):
+        compiled = compile_schema(schema)
+        try:
+            compiled.dataframe_schema.validate(dataframe.copy(), lazy=True, inplace=True)
+            expected = None
+        except pa.errors.SchemaErrors as exc:
+            expected = exc.failure_cases
+
+        actual = validation.FastValidator(compiled.dataframe_schema).validate(dataframe.copy())
+
+        if expected is None:
+            self.assertIsNone(actual)
+        else:
+            pd.testing.assert_frame_equal(actual, expected)
+        return actual
+
+    def test_kernel_checks(self):
+        schema = {
+            'small_values': Column(float, [Check.less_than(100), Check.greater_than_or_equal_to(0)], nullable=True),
+            'one_to_three': Column(int, [Check.isin([1, 2, 3]), Check.in_range(1, 3, include_max=False)]),
+            'not_zero': Column(int, [Check.notin([0]), Check.not_equal_to(5)]),
+            'code': Column(str, [Check.str_matches(r'^[a-z]+$'), Check.str_length(2, 3), Check.str_startswith('a')], nullable=True),
+            'name': Column(str, [Check.str_contains('o'), Check.str_endswith('n')]),
+        }
+        dataframe = pd.DataFrame({
+            'small_values': [1.5, 250.0, None, -1.0, 99.9],
+            'one_to_three': [1, 3, 2, 7, 1],
+            'not_zero': [1, 0, 5, 2, 0],
+            'code': ['ab', 'ABC', None, 'abcd', 'b1'],
+            'name': ['john', 'ann', 'bob', 'jon', 'tom'],
+        })
+
+        failure_cases = self.assert_same_failure_cases(schema, dataframe)
+
+        self.assertEqual(len(failure_cases), 16)
+
+    def test_valid_dataframe(self):
+        schema = {
+            'small_values': Column(float, [Check.less_than(100)]),
+            'code': Column(str, [Check.str_matches(r'^[a-z]+$')]),
+        }
+        dataframe = pd.DataFrame({'small_values': ['1.5', '2'], 'code': ['ab', 'c']})
+
+        self.assertIsNone(self.assert_same_failure_cases(schema, dataframe))
+
+    def test_regex_without_re2(self):
+        # \d matches any unicode digit in Python, only ASCII digits in RE2
+        schema = {'digits': Column(str, [Check.str_matches(r'\d+$'), Check.str_contains(r'(?i)X')])}
+        dataframe = pd.DataFrame({'digits': ['12', '١٢', '1a', '3\n', 'x1']})
+
+        self.assert_same_failure_cases(schema, dataframe)
+
+    def test_falls_back_to_pandera(self):
+        schema = {
+            # coercion errors, nullability and custom checks are reported by pandera
+            'small_values': Column(float, [Check.less_than(100)]),
+            'positive': Column(int, [Check(lambda s: s > 0), Check.less_than(10)]),
+            # a string check on a numeric column fails inside pandera
+            'number': Column(int, [Check.str_length(1, 2)]),
+        }
+        dataframe = pd.DataFrame({
+            'small_values': ['1.5', 'abc', None],
+            'positive': [1, -1, 20],
+            'number': [1, 2, 3],
+        })
+
+        self.assert_same_failure_cases(schema, dataframe)
+
+    def test_kernel_check_selection(self):
+        self.assertTrue(validation.is_kernel_check(Check.less_than(3)))
+        self.assertFalse(validation.is_kernel_check(Check.less_than(3, ignore_na=False)))
+        self.assertFalse(validation.is_kernel_check(Check(lambda s: s < 3, name='less_than')))
+        self.assertFalse(validation.is_kernel_check(Check.unique_values_eq([1])))
+
+    def test_structural_schema(self):
+        compiled = compile_schema({'value': Column(int, [Check(lambda s: s > 0), Check.less_than(10)])})
+
+        validator = validation.FastValidator(compiled.dataframe_schema)
+
+        self.assertEqual(len(validator.structural_schema.columns['value'].checks), 1)
+        self.assertEqual([number for number, _ in validator.kernel_checks['value']], [1])
+        # the original schema is left untouched
+        self.assertEqual(len(compiled.dataframe_schema.columns['value'].checks), 2)
+
+    def test_pickle(self):
+        compiled = compile_schema({'code': Column(str, [Check.str_matches(r'^[a-z]+$')])})
+
+        # validators travel with configurations to worker processes
+        validator = pickle.loads(pickle.dumps(validation.FastValidator(compiled.dataframe_schema)))
+
+        self.assertIsNotNone(validator.validate(pd.DataFrame({'code': ['A']})))
+
+if __name__ == '__main__':
+    unittest.main()
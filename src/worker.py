@@ -0,0 +1,62 @@
+"""
+Standalone worker that processes files queued by the web application.
+Run it from the same directory as main.py, with the same configuration:
+    python worker.py
+Any number of workers can run next to the web application, as long as they share the
+utility database and the temp directory.
+"""
+import os
+import signal
+
+from sheetdrop.configs import app_configs
+from sheetdrop.configuration import ConfigurationRegistry
+from sheetdrop.db import create_engine
+from sheetdrop.executor import JobExecutor
+from sheetdrop.fileops import StorageSettings
+from sheetdrop.jobs import JobWorker
+from sheetdrop.metrics import enable_tracing, serve_metrics
+from sheetdrop.pipeline import PipelineSettings
+
+
+def main():
+    engine = create_engine(app_configs.database_url, app_configs.database_pool_size, app_configs.database_max_overflow, app_configs.database_pool_timeout)
+    modules_dir = os.path.join(os.path.dirname(__file__), "file_definitions")
+    # definitions are loaded by the first job of each file in the lazy startup modes
+    configurations = ConfigurationRegistry(modules_dir)
+    if app_configs.startup_mode == "eager":
+        configurations.load_all()
+        for error in configurations.errors:
+            print(f"ERROR: {error}")
+    elif app_configs.startup_mode == "background":
+        configurations.warm_up()
+    if app_configs.definitions_reload_interval:
+        # jobs already running keep the definition they started with
+        configurations.watch(app_configs.definitions_reload_interval)
+
+    storage_settings = StorageSettings(app_configs.storage_endpoint, app_configs.storage_region, app_configs.storage_access_key, app_configs.storage_secret_key,
+                                       app_configs.storage_health_check_interval, app_configs.storage_health_check_path)
+    pipeline_settings = PipelineSettings(app_configs.storage_provider, app_configs.sheet_workers, app_configs.failure_samples, storage_settings,
+                                         app_configs.opentelemetry)
+    if app_configs.opentelemetry:
+        enable_tracing()
+    if app_configs.metrics_port:
+        # the web application serves its own metrics; a worker serves the jobs it runs
+        serve_metrics(app_configs.metrics_port)
+    executor = JobExecutor(app_configs.executor_type, app_configs.max_workers, app_configs.max_queue_depth)
+    worker = JobWorker(engine, executor, configurations, app_configs.database_url, pipeline_settings,
+                       app_configs.job_poll_interval, app_configs.job_lease_seconds, app_configs.job_max_attempts)
+    # finish the jobs in progress when the container is stopped
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    print(f"Worker {worker.worker_id} started")
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        configurations.stop_watching()
+        executor.shutdown(wait=True)
+        print(f"Worker {worker.worker_id} stopped")
+
+
+if __name__ == "__main__":
+    main()